@@ -1,59 +1,234 @@
-import os
-import anthropic
-from time import sleep
-import sys
+from threading import Lock
 from logging import getLogger
+from client_manager import get_client, get_async_client
+from retry_policy import RetryPolicy
+from rate_limiter import get_rate_limiter
+from response_cache import get_response_cache
+from utils import estimate_tokens
 
 logger = getLogger(__name__)
 
-ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
+MAX_TOKENS = 4096
+CACHE_CONTROL = {"type": "ephemeral"}
+
+_usage_totals = {
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 0,
+}
+_usage_lock = Lock()
+
+
+def build_request(conversation_history, model, temperature, system_message):
+    return {
+        "model": model,
+        "messages": conversation_history,
+        "max_tokens": MAX_TOKENS,
+        "temperature": temperature,
+        "system": system_message,
+    }
+
+
+def with_prompt_caching(request):
+    # Breakpoints go on the system prompt and on the newest message. Each turn
+    # moves the second breakpoint forward, and the API finds the prefix that
+    # was written on the previous turn by looking back from it.
+    cached_request = dict(request)
+    if request["system"]:
+        cached_request["system"] = [
+            {"type": "text", "text": request["system"], "cache_control": CACHE_CONTROL}
+        ]
+    messages = [
+        {"role": message["role"], "content": message["content"]}
+        for message in request["messages"]
+    ]
+    if messages:
+        content = messages[-1]["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        content = [dict(block) for block in content]
+        content[-1]["cache_control"] = CACHE_CONTROL
+        messages[-1] = {"role": messages[-1]["role"], "content": content}
+    cached_request["messages"] = messages
+    return cached_request
+
+
+def get_usage_stats():
+    with _usage_lock:
+        return dict(_usage_totals)
+
+
+def _record_usage(usage):
+    if usage is None:
+        return
+    token_counts = {key: int(getattr(usage, key, 0) or 0) for key in _usage_totals}
+    with _usage_lock:
+        for key, count in token_counts.items():
+            _usage_totals[key] += count
+    logger.info(
+        f"Prompt cache read {token_counts['cache_read_input_tokens']} tokens, "
+        f"wrote {token_counts['cache_creation_input_tokens']} tokens"
+    )
 
 
 def invoke_anthropic_api(
-    conversation_history, model, temperature, system_message, max_retries=3
+    conversation_history,
+    model,
+    temperature,
+    system_message,
+    max_retries=3,
+    retry_policy=None,
+    use_cache=True,
 ):
-    client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
+    request = build_request(conversation_history, model, temperature, system_message)
+    response_cache, cached_response = _lookup_cache(request, use_cache)
+    if cached_response is not None:
+        return cached_response
 
-    for attempt in range(max_retries):
+    client = get_client()
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(conversation_history, system_message)
+    retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+
+    api_request = with_prompt_caching(request)
+
+    def create_message():
+        rate_limiter.acquire(estimated_tokens)
+        return client.messages.create(**api_request)
+
+    response = retry_policy.call(create_message)
+    _record_usage(response.usage)
+    content_text = " ".join(block.text for block in response.content)
+    if response_cache:
+        response_cache.set(request, content_text)
+    return content_text
+
+
+def stream_anthropic_api(
+    conversation_history,
+    model,
+    temperature,
+    system_message,
+    max_retries=3,
+    retry_policy=None,
+    use_cache=True,
+):
+    request = build_request(conversation_history, model, temperature, system_message)
+    response_cache, cached_response = _lookup_cache(request, use_cache)
+    if cached_response is not None:
+        yield cached_response
+        return
+
+    client = get_client()
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(conversation_history, system_message)
+    retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+    api_request = with_prompt_caching(request)
+    retry_policy.start()
+
+    while True:
+        chunks = []
         try:
-            response = client.messages.create(
-                model=model,
-                messages=conversation_history,
-                max_tokens=4096,
-                temperature=temperature,
-                system=system_message,
-            )
-            content_text = " ".join(block.text for block in response.content)
-            return content_text
-        except anthropic.BadRequestError as e:
-            logger.error(f"Bad request error: {str(e)}")
-            raise e
-        except anthropic.AuthenticationError as e:
-            logger.error(f"Authentication error: {str(e)}")
-            raise e
-        except anthropic.PermissionDeniedError as e:
-            logger.error(f"Permission denied error: {str(e)}")
-            raise e
-        except anthropic.RateLimitError as e:
-            retry_after = e.response.headers.get("retry-after")
-            if retry_after:
-                retry_after_milliseconds = (
-                    int(retry_after) * 1000
-                )  # We're doing this so we can run our tests faster, deal with it. 😎
-                if attempt < max_retries - 1:
-                    wait_message = f"Rate limit exceeded. Retrying in {retry_after_milliseconds / 1000} seconds. Attempt {attempt + 1}/{max_retries}"
-                    print(wait_message, file=sys.stderr)
-                    logger.warning(wait_message)
-                    sleep(retry_after_milliseconds / 1000)
-                else:
-                    logger.error("Rate limit exceeded. Max retries reached.")
-                    raise e
-            else:
-                logger.error("Rate limit exceeded. Retry information not available.")
+            rate_limiter.acquire(estimated_tokens)
+            with client.messages.stream(**api_request) as stream:
+                for text in stream.text_stream:
+                    chunks.append(text)
+                    yield text
+                _record_usage(stream.get_final_message().usage)
+            break
+        except Exception as e:
+            if chunks:
+                # Part of the reply has already been handed to the caller, so
+                # retrying would duplicate it.
+                logger.error(f"Stream interrupted: {str(e)}")
                 raise e
-        except anthropic.APIError as e:
-            logger.error(f"Unexpected API error: {str(e)}")
-            raise e
+            retry_policy.wait(e)
+
+    if response_cache:
+        response_cache.set(request, "".join(chunks))
+
+
+async def async_invoke_anthropic_api(
+    conversation_history,
+    model,
+    temperature,
+    system_message,
+    max_retries=3,
+    retry_policy=None,
+    use_cache=True,
+):
+    request = build_request(conversation_history, model, temperature, system_message)
+    response_cache, cached_response = _lookup_cache(request, use_cache)
+    if cached_response is not None:
+        return cached_response
+
+    client = get_async_client()
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(conversation_history, system_message)
+    retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+
+    api_request = with_prompt_caching(request)
+
+    async def create_message():
+        await rate_limiter.async_acquire(estimated_tokens)
+        return await client.messages.create(**api_request)
+
+    response = await retry_policy.async_call(create_message)
+    _record_usage(response.usage)
+    content_text = " ".join(block.text for block in response.content)
+    if response_cache:
+        response_cache.set(request, content_text)
+    return content_text
+
+
+async def async_stream_anthropic_api(
+    conversation_history,
+    model,
+    temperature,
+    system_message,
+    max_retries=3,
+    retry_policy=None,
+    use_cache=True,
+):
+    request = build_request(conversation_history, model, temperature, system_message)
+    response_cache, cached_response = _lookup_cache(request, use_cache)
+    if cached_response is not None:
+        yield cached_response
+        return
+
+    client = get_async_client()
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(conversation_history, system_message)
+    retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+    api_request = with_prompt_caching(request)
+    retry_policy.start()
+
+    while True:
+        chunks = []
+        try:
+            await rate_limiter.async_acquire(estimated_tokens)
+            async with client.messages.stream(**api_request) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    yield text
+                _record_usage((await stream.get_final_message()).usage)
+            break
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            raise e
+            if chunks:
+                logger.error(f"Stream interrupted: {str(e)}")
+                raise e
+            await retry_policy.async_wait(e)
+
+    if response_cache:
+        response_cache.set(request, "".join(chunks))
+
+
+def _lookup_cache(request, use_cache):
+    response_cache = get_response_cache() if use_cache else None
+    if response_cache is None:
+        return None, None
+    cached_response = response_cache.get(request)
+    if cached_response is not None:
+        logger.info("Returning cached response")
+    return response_cache, cached_response
@@ -1,9 +1,10 @@
+import os
 import argparse
-import argcomplete
+from datetime import datetime
 from system_prompts import SYSTEM_PROMPTS
 
 
-def parse_args():
+def build_parser():
     parser = argparse.ArgumentParser(description="Anthropic CLI")
     subparsers = parser.add_subparsers(dest="command")
 
@@ -21,6 +22,11 @@ def parse_args():
         action="store_true",
         help="Remove the last interaction from the conversation history",
     )
+    chat_group.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Show response cache hit and miss statistics",
+    )
     chat_parser.add_argument("-m", "--model", type=str, help="The AI model to use")
     chat_parser.add_argument(
         "-t", "--temperature", type=float, help="The temperature value for the AI model"
@@ -38,6 +44,17 @@ def parse_args():
         type=str,
         help="The directory to store conversation files",
     )
+    chat_parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Stream the response as it is generated",
+    )
+    chat_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always send the request instead of using a cached response",
+    )
     chat_parser.add_argument(
         "-j", "--json", action="store_true", help="Output the result as JSON"
     )
@@ -62,6 +79,11 @@ def parse_args():
     interactive_parser.add_argument(
         "-i", "--interactive", type=str, help="interactive_mode"
     )
+    interactive_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always send the request instead of using a cached response",
+    )
 
     history_parser = subparsers.add_parser(
         "history", help="Display the conversation history"
@@ -72,13 +94,34 @@ def parse_args():
         action="store_true",
         help="Display the conversation history as raw text without formatting",
     )
+    history_range_group = history_parser.add_mutually_exclusive_group()
+    history_range_group.add_argument(
+        "--last", type=int, help="Display only the last N messages"
+    )
+    history_range_group.add_argument(
+        "--page", type=int, help="Display page N of the messages, starting at 1"
+    )
+    history_range_group.add_argument(
+        "--offset", type=int, help="Display a page of messages starting at message N"
+    )
+    history_parser.add_argument(
+        "--page-size",
+        type=int,
+        default=20,
+        help="The number of messages on a page",
+    )
+    history_parser.add_argument(
+        "--pager",
+        action="store_true",
+        help="Scroll through the conversation history in a pager",
+    )
 
     import_parser = subparsers.add_parser(
         "import", help="Import a conversation history from a file"
     )
     import_parser.add_argument(
         "conversation_name", type=str, help="The name of the conversation to import"
-    )
+    ).completer = conversation_name_completer
     import_parser.add_argument(
         "-d",
         "--directory",
@@ -86,5 +129,146 @@ def parse_args():
         help="The directory containing the conversation file",
     )
 
-    argcomplete.autocomplete(parser)
+    batch_parser = subparsers.add_parser(
+        "batch", help="Send a JSONL file of requests through the Message Batches API"
+    )
+    batch_parser.add_argument(
+        "input_file",
+        type=str,
+        help="JSONL file with one {message, id, persona, model, temperature} per line",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The JSONL file to write results to (default: <input>.results.jsonl)",
+    )
+    batch_parser.add_argument("-m", "--model", type=str, help="The AI model to use")
+    batch_parser.add_argument(
+        "-t", "--temperature", type=float, help="The temperature value for the AI model"
+    )
+    batch_parser.add_argument(
+        "-p",
+        "--persona",
+        type=str,
+        choices=list(SYSTEM_PROMPTS.keys()),
+        help="The AI persona to use",
+    )
+    batch_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=10.0,
+        help="Seconds to wait before first checking on the batch",
+    )
+
+    run_parser = subparsers.add_parser(
+        "run", help="Run a JSONL file or directory of prompts concurrently"
+    )
+    run_parser.add_argument(
+        "input",
+        type=str,
+        help="JSONL file of requests, or a directory with one prompt per file",
+    )
+    run_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The JSONL file to write results to (default: <input>.results.jsonl)",
+    )
+    run_parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="The number of requests to run at the same time",
+    )
+    run_parser.add_argument("-m", "--model", type=str, help="The AI model to use")
+    run_parser.add_argument(
+        "-t", "--temperature", type=float, help="The temperature value for the AI model"
+    )
+    run_parser.add_argument(
+        "-p",
+        "--persona",
+        type=str,
+        choices=list(SYSTEM_PROMPTS.keys()),
+        help="The AI persona to use",
+    )
+    run_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always send the request instead of using a cached response",
+    )
+
+    search_parser = subparsers.add_parser(
+        "search", help="Search the messages of all saved conversations"
+    )
+    search_parser.add_argument("query", nargs="+", help="The words to search for")
+    search_parser.add_argument(
+        "--role",
+        type=str,
+        choices=["user", "assistant"],
+        help="Only search messages from this role",
+    )
+    search_parser.add_argument(
+        "-m", "--model", type=str, help="Only search messages sent to this model"
+    )
+    search_parser.add_argument(
+        "--since",
+        type=parse_date,
+        help="Only search messages from this date (YYYY-MM-DD) onwards",
+    )
+    search_parser.add_argument(
+        "--until",
+        type=parse_date,
+        help="Only search messages before this date (YYYY-MM-DD)",
+    )
+    search_parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="The maximum number of results to show",
+    )
+
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        help="Keep a background process running that answers the other commands",
+    )
+    daemon_parser.add_argument(
+        "--stop", action="store_true", help="Stop the running daemon"
+    )
+
+    return parser
+
+
+def parse_args():
+    parser = build_parser()
+    # argcomplete is only needed when the shell is asking for completions.
+    if "_ARGCOMPLETE" in os.environ:
+        import argcomplete
+
+        argcomplete.autocomplete(parser)
     return parser.parse_args()
+
+
+def conversation_name_completer(prefix, **kwargs):
+    from user_config import load_user_config
+    from conversation_names import read_conversation_names
+
+    conversations_directory = load_user_config()["conversations_directory"]
+    if not os.path.isdir(conversations_directory):
+        return []
+    conversation_names = read_conversation_names(conversations_directory)
+    if conversation_names is None:
+        # The first completion records the names; saves keep them current.
+        from conversation_manager import get_conversation_names
+
+        conversation_names = get_conversation_names()
+    return [name for name in conversation_names if name.startswith(prefix)]
+
+
+def parse_date(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value!r}")
@@ -0,0 +1,152 @@
+import os
+import json
+import sys
+from time import sleep
+from logging import getLogger
+from anthropic_api import with_prompt_caching
+from bulk_requests import (
+    load_requests,
+    completed_request_ids,
+    open_results_file,
+    request_params,
+)
+from client_manager import get_client
+from file_lock import write_atomically
+from retry_policy import RetryPolicy
+from user_config import load_user_config
+
+logger = getLogger(__name__)
+
+MAX_BATCH_REQUESTS = 100000
+BATCH_STATE_SUFFIX = ".batch.json"
+
+
+def run_batch(
+    input_path,
+    output_path,
+    model=None,
+    temperature=None,
+    persona=None,
+    client=None,
+    poll_interval=10.0,
+    max_poll_interval=300.0,
+):
+    client = client or get_client()
+    state_path = output_path + BATCH_STATE_SUFFIX
+    state = _load_state(state_path)
+    completed_ids = completed_request_ids(output_path)
+
+    if state is None:
+        # "submitted" counts the requests of the input file, in order, that
+        # are already part of a batch.
+        state = {"batch_ids": [], "submitted": 0}
+    elif state["batch_ids"]:
+        print(f"Resuming batches {', '.join(state['batch_ids'])}", file=sys.stderr)
+    _submit_batches(
+        client,
+        load_requests(input_path),
+        completed_ids,
+        state,
+        state_path,
+        model,
+        temperature,
+        persona,
+    )
+
+    counts = {"succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    with open_results_file(output_path) as output_file:
+        for batch_id in state["batch_ids"]:
+            _wait_for_batch(client, batch_id, poll_interval, max_poll_interval)
+            for result in client.messages.batches.results(batch_id):
+                if result.custom_id in completed_ids:
+                    continue
+                record = _result_record(result)
+                output_file.write(json.dumps(record) + "\n")
+                output_file.flush()
+                completed_ids.add(result.custom_id)
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return counts
+
+
+def _submit_batches(
+    client, requests, completed_ids, state, state_path, model, temperature, persona
+):
+    user_config = load_user_config()
+    position = state["submitted"]
+    while position < len(requests):
+        batch_requests = []
+        while position < len(requests) and len(batch_requests) < MAX_BATCH_REQUESTS:
+            request = requests[position]
+            position += 1
+            if request["id"] in completed_ids:
+                continue
+            batch_requests.append(
+                {
+                    "custom_id": request["id"],
+                    "params": with_prompt_caching(
+                        request_params(
+                            request, user_config, model, temperature, persona
+                        )
+                    ),
+                }
+            )
+        if not batch_requests:
+            break
+        # Creating a batch is not idempotent: a lost response may belong to a
+        # batch that was created, and sending it again would pay for every
+        # request twice.
+        message_batch = RetryPolicy(idempotent=False).call(
+            client.messages.batches.create, requests=batch_requests
+        )
+        state["batch_ids"].append(message_batch.id)
+        state["submitted"] = position
+        # Saved after every submission so an interrupted run resumes the
+        # batches that were already created instead of paying for them twice,
+        # and goes on to submit the requests that were not.
+        write_atomically(state_path, json.dumps(state))
+        print(
+            f"Submitted batch {message_batch.id} with {len(batch_requests)} requests",
+            file=sys.stderr,
+        )
+
+
+def _wait_for_batch(client, batch_id, poll_interval, max_poll_interval):
+    delay = poll_interval
+    while True:
+        message_batch = RetryPolicy().call(client.messages.batches.retrieve, batch_id)
+        if message_batch.processing_status == "ended":
+            return message_batch
+        request_counts = message_batch.request_counts
+        print(
+            f"Batch {batch_id}: {request_counts.processing} processing, "
+            f"{request_counts.succeeded} succeeded, {request_counts.errored} errored. "
+            f"Checking again in {delay:g} seconds.",
+            file=sys.stderr,
+        )
+        sleep(delay)
+        delay = min(delay * 2, max_poll_interval)
+
+
+def _result_record(result):
+    status = result.result.type
+    record = {"id": result.custom_id, "status": status}
+    if status == "succeeded":
+        record["response"] = "".join(
+            block.text
+            for block in result.result.message.content
+            if block.type == "text"
+        )
+    elif status == "errored":
+        record["error"] = str(result.result.error)
+    return record
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
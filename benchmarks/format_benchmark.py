@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+import argparse
+from statistics import median
+from time import perf_counter
+
+# Times format_assistant_message on synthetic replies of increasing length
+# and fails when the time per line grows with the length of the reply,
+# i.e. when rendering stops being linear.
+#
+#   python benchmarks/format_benchmark.py [--runs N] [--max-growth X]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formatting  # noqa: E402
+from render_cache import RenderCache  # noqa: E402
+
+REPLY_LINES = [10, 100, 1000]
+
+
+def synthetic_reply(line_count):
+    # Prose with inline code, broken up by a short fenced code block every
+    # ten lines, like a typical answer.
+    lines = []
+    while len(lines) < line_count:
+        lines.append(f"Step {len(lines)}: call `run_step({len(lines)})` and check it.")
+        if len(lines) % 10 == 5:
+            lines += ["```python", "for item in items:", "    process(item)", "```"]
+    return "\n".join(lines[:line_count])
+
+
+def time_render(reply, runs, render_cache=None):
+    # Without a render cache every run renders the reply from scratch.
+    formatting.get_render_cache = lambda: render_cache
+    times = []
+    for _ in range(runs):
+        with formatting.redirect_output(io.StringIO(), force_terminal=True, width=100):
+            start = perf_counter()
+            formatting.format_assistant_message(reply)
+            times.append(perf_counter() - start)
+    return median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assistant message benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per reply")
+    parser.add_argument(
+        "--max-growth",
+        type=float,
+        default=2.0,
+        help="Largest allowed ratio between the longest and shortest "
+        "replies' time per line",
+    )
+    args = parser.parse_args()
+
+    # The first render loads the lexers and styles.
+    time_render(synthetic_reply(10), 1)
+
+    per_line = {}
+    print(f"{'lines':>6} {'median ms':>10} {'us per line':>12} {'cached ms':>10}")
+    for line_count in REPLY_LINES:
+        reply = synthetic_reply(line_count)
+        seconds = time_render(reply, args.runs)
+        per_line[line_count] = seconds / line_count
+        render_cache = RenderCache(memory_entries=1)
+        time_render(reply, 1, render_cache)
+        cached_seconds = time_render(reply, args.runs, render_cache)
+        print(
+            f"{line_count:6} {seconds * 1000:10.1f} "
+            f"{per_line[line_count] * 1e6:12.1f} {cached_seconds * 1000:10.2f}"
+        )
+
+    growth = per_line[REPLY_LINES[-1]] / per_line[REPLY_LINES[0]]
+    print(
+        f"Time per line grew {growth:.2f}x from {REPLY_LINES[0]} to {REPLY_LINES[-1]} lines"
+    )
+    if growth > args.max_growth:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
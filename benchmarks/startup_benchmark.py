@@ -0,0 +1,94 @@
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+from time import perf_counter
+
+# Measures how long each CLI command takes to start and which imports it pays
+# for, and fails when a command goes over its budget. Commands run against an
+# empty home directory so they never touch real conversations.
+#
+#   python benchmarks/startup_benchmark.py [--runs N] [--budget-scale X]
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median wall time per command, in milliseconds, including interpreter start.
+STARTUP_BUDGETS_MS = {
+    "reset": 250,
+    "history --raw": 250,
+    "import missing_conversation": 250,
+    "chat --list-personas": 400,
+    "chat --remove-last": 500,
+    "search startup": 600,
+}
+
+
+def run_command(command, home_directory, import_time=False):
+    arguments = [sys.executable]
+    if import_time:
+        arguments += ["-X", "importtime"]
+    arguments += [os.path.join(REPO_DIRECTORY, "chat.py"), *command.split()]
+    environment = {**os.environ, "HOME": home_directory}
+    environment.pop("_ARGCOMPLETE", None)
+
+    start = perf_counter()
+    completed = subprocess.run(
+        arguments, env=environment, capture_output=True, text=True, check=True
+    )
+    return (perf_counter() - start) * 1000, completed.stderr
+
+
+def top_level_imports(import_time_output):
+    # Each line of -X importtime output is "self | cumulative | name" in
+    # microseconds, with the name indented two spaces per level of nesting.
+    imports = []
+    for line in import_time_output.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:].rstrip()
+        if not name.startswith(" "):
+            imports.append((int(parts[1]) / 1000, name))
+    return sorted(imports, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command")
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiply every budget, for slower machines",
+    )
+    args = parser.parse_args()
+
+    over_budget = []
+    with tempfile.TemporaryDirectory() as home_directory:
+        print(f"{'command':32} {'median ms':>10} {'budget ms':>10}  slowest imports")
+        for command, budget in STARTUP_BUDGETS_MS.items():
+            budget *= args.budget_scale
+            wall_times = [
+                run_command(command, home_directory)[0] for _ in range(args.runs)
+            ]
+            _, import_time_output = run_command(
+                command, home_directory, import_time=True
+            )
+            slowest = ", ".join(
+                f"{name} {milliseconds:.0f}ms"
+                for milliseconds, name in top_level_imports(import_time_output)[:3]
+            )
+            wall_time = median(wall_times)
+            print(f"{command:32} {wall_time:10.0f} {budget:10.0f}  {slowest}")
+            if wall_time > budget:
+                over_budget.append(command)
+
+    if over_budget:
+        print(f"Over budget: {', '.join(over_budget)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+from system_prompts import SYSTEM_PROMPTS
+from anthropic_api import build_request
+
+REQUEST_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+
+def load_requests(path):
+    if os.path.isdir(path):
+        return _load_prompt_directory(path)
+
+    requests = []
+    seen_ids = set()
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}")
+            requests.append(_normalize_request(entry, path, line_number, seen_ids))
+    return requests
+
+
+def completed_request_ids(output_path, statuses=None):
+    # With statuses, only requests recorded with one of them count as
+    # completed; the others are run again.
+    completed_ids = set()
+    try:
+        with open(output_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    request_id = record["id"]
+                except (json.JSONDecodeError, KeyError):
+                    # A line cut short by an interrupted run is redone.
+                    continue
+                if statuses is None or record.get("status") in statuses:
+                    completed_ids.add(request_id)
+    except FileNotFoundError:
+        pass
+    return completed_ids
+
+
+def open_results_file(output_path):
+    output_file = open(output_path, "a+")
+    output_file.seek(0, os.SEEK_END)
+    if output_file.tell() > 0:
+        output_file.seek(output_file.tell() - 1)
+        if output_file.read(1) != "\n":
+            # Terminate a line cut short by an interrupted run so the next
+            # record starts on its own line.
+            output_file.write("\n")
+    return output_file
+
+
+def request_params(request, user_config, model=None, temperature=None, persona=None):
+    persona = request["persona"] or persona or user_config["persona"]
+    return build_request(
+        [{"role": "user", "content": request["message"]}],
+        request["model"] or model or user_config["model"],
+        _first_set(request["temperature"], temperature, user_config["temperature"]),
+        SYSTEM_PROMPTS[persona],
+    )
+
+
+def _load_prompt_directory(path):
+    requests = []
+    seen_ids = set()
+    for file_name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, file_name)
+        if file_name.startswith(".") or not os.path.isfile(file_path):
+            continue
+        with open(file_path, "r") as file:
+            message = file.read()
+        request_id = re.sub(r"[^a-zA-Z0-9_-]", "_", os.path.splitext(file_name)[0])
+        requests.append(
+            _normalize_request(
+                {"id": request_id[:64], "message": message},
+                file_path,
+                1,
+                seen_ids,
+            )
+        )
+    return requests
+
+
+def _normalize_request(entry, path, line_number, seen_ids):
+    if not isinstance(entry, dict) or not isinstance(entry.get("message"), str):
+        raise ValueError(f"{path}:{line_number}: expected an object with a message")
+
+    request_id = str(entry.get("id", f"request-{line_number}"))
+    if not REQUEST_ID_PATTERN.match(request_id):
+        raise ValueError(
+            f"{path}:{line_number}: id must be 1-64 letters, digits, '_' or '-'"
+        )
+    if request_id in seen_ids:
+        raise ValueError(f"{path}:{line_number}: duplicate id {request_id}")
+    seen_ids.add(request_id)
+
+    persona = entry.get("persona")
+    if persona is not None and persona not in SYSTEM_PROMPTS:
+        raise ValueError(f"{path}:{line_number}: unknown persona {persona}")
+
+    return {
+        "id": request_id,
+        "message": entry["message"],
+        "persona": persona,
+        "model": entry.get("model"),
+        "temperature": entry.get("temperature"),
+    }
+
+
+def _first_set(*values):
+    for value in values:
+        if value is not None:
+            return value
+    return None
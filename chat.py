@@ -1,46 +1,64 @@
-from rich.console import Console
-from rich.table import Table
-from conversation_history import (
-    reset_conversation,
-    display_conversation_history,
-    import_conversation,
-)
-
-from formatting import format_user_message, format_assistant_message
-from conversation_manager import (
-    invoke_conversation,
-    remove_last_interaction,
-)
-from system_prompts import SYSTEM_PROMPTS
+import os
+import sys
 from argument_parser import parse_args
-from interactive import interactive_chat
 
-
-console = Console()
+# Each command imports what it needs when it runs: the Anthropic SDK, rich
+# and prompt_toolkit take far longer to load than the short commands take to
+# run. Output goes through the backends in output.py, so rich is only loaded
+# when writing to a terminal.
 
 
 def main():
     args = parse_args()
-    console = Console()
-    if args.command == "chat":
-        if args.list_personas:
-            table = Table(title="Available Personas")
-            table.add_column("Persona", style="cyan")
-            table.add_column("Description", style="magenta")
+    command = COMMANDS.get(args.command)
+    if not command:
+        return
+    from daemon import served_by_daemon, run_in_daemon
+
+    # A running daemon already has everything loaded; without one the
+    # command runs here.
+    if served_by_daemon(args):
+        exit_code = run_in_daemon(args)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    command(args)
 
-            for persona, description in SYSTEM_PROMPTS.items():
-                table.add_row(persona, description)
 
-            console.print(table)
+def chat_command(args):
+    from output import select_output, use_output
+    from system_prompts import SYSTEM_PROMPTS
+
+    with use_output(select_output(args.json, args.stream)) as output:
+        if args.list_personas:
+            output.table(
+                "Available Personas",
+                ["Persona", "Description"],
+                SYSTEM_PROMPTS.items(),
+            )
+        elif args.cache_stats:
+            from response_cache import get_response_cache
+
+            response_cache = get_response_cache()
+            if response_cache:
+                output.table(
+                    "Response Cache",
+                    ["Statistic", "Value"],
+                    response_cache.stats().items(),
+                )
+            else:
+                output.notice("The response cache is disabled.")
         elif args.remove_last:
-            success = remove_last_interaction()
-            if success:
-                console.print("Last interaction removed from the conversation history.")
+            from conversation_manager import remove_last_interaction
+
+            if remove_last_interaction():
+                output.notice("Last interaction removed from the conversation history.")
             else:
-                console.print(
+                output.notice(
                     "No interactions to remove from the conversation history."
                 )
         else:
+            from conversation_manager import invoke_conversation
+
             system_message = SYSTEM_PROMPTS.get(args.persona, SYSTEM_PROMPTS["default"])
             role, response = invoke_conversation(
                 args.message,
@@ -48,28 +66,143 @@ def main():
                 args.temperature,
                 system_message,
                 args.conversations_directory,
+                stream=args.stream,
+                use_cache=not args.no_cache,
             )
-            if role == "assistant":
-                format_assistant_message(response)
+            if args.stream:
+                output.assistant_stream(response)
+            elif role == "assistant":
+                output.assistant_message(response)
             else:
-                format_user_message(response)
+                output.user_message(response)
+
+
+def reset_command(args):
+    from conversation_history import reset_conversation
+
+    reset_conversation()
+
+
+def history_command(args):
+    from conversation_history import display_conversation_history
+
+    if args.page is not None:
+        offset, limit = (args.page - 1) * args.page_size, args.page_size
+    elif args.offset is not None:
+        offset, limit = args.offset, args.page_size
+    else:
+        offset, limit = None, None
+    if not args.pager:
+        print("Conversation history:")
+    display_conversation_history(
+        args.raw,
+        last=args.last,
+        offset=offset,
+        limit=limit,
+        pager=args.pager,
+    )
 
-    elif args.command == "reset":
-        reset_conversation()
 
-    elif args.command == "history":
-        console.print("Conversation history:")
-        display_conversation_history(args.raw)
+def import_command(args):
+    from conversation_history import import_conversation
 
-    elif args.command == "import":
-        conversation_name = args.conversation_name
-        imported_conversation = import_conversation(conversation_name)
-        if imported_conversation:
-            console.print(f"Imported conversation: {imported_conversation}")
+    conversation_name = args.conversation_name
+    imported_conversation = import_conversation(conversation_name)
+    if imported_conversation:
+        print(f"Imported conversation: {imported_conversation}")
+    else:
+        print(f"Conversation file not found: {conversation_name}.jsonl")
+
+
+def interactive_command(args):
+    from interactive import interactive_chat
+
+    interactive_chat(use_cache=not args.no_cache)
+
+
+def search_command(args):
+    from conversation_manager import search_conversations
+    from output import get_output
+
+    output = get_output()
+    results = search_conversations(
+        " ".join(args.query),
+        role=args.role,
+        model=args.model,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    )
+    if results is None:
+        output.notice("Search is unavailable: SQLite was built without FTS5.")
+    elif not results:
+        output.notice("No matching messages.")
+    else:
+        for result in results:
+            output.search_result(result)
+
+
+def batch_command(args):
+    from batch import run_batch
+
+    output_path = args.output or f"{os.path.splitext(args.input_file)[0]}.results.jsonl"
+    counts = run_batch(
+        args.input_file,
+        output_path,
+        model=args.model,
+        temperature=args.temperature,
+        persona=args.persona,
+        poll_interval=args.poll_interval,
+    )
+    summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+    print(f"Batch complete: {summary}. Results written to {output_path}")
+
+
+def run_command(args):
+    from runner import run_requests
+
+    output_path = (
+        args.output or f"{os.path.splitext(args.input.rstrip(os.sep))[0]}.results.jsonl"
+    )
+    try:
+        counts = run_requests(
+            args.input,
+            output_path,
+            concurrency=args.concurrency,
+            model=args.model,
+            temperature=args.temperature,
+            persona=args.persona,
+            use_cache=not args.no_cache,
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+    print(f"Run complete: {summary}. Results written to {output_path}")
+
+
+def daemon_command(args):
+    from daemon import serve, stop_daemon
+
+    if args.stop:
+        if stop_daemon():
+            print("Chat daemon stopped.")
         else:
-            console.print(f"Conversation file not found: {conversation_name}.json")
-    elif args.command == "interactive":
-        interactive_chat()
+            print("The chat daemon is not running.")
+    else:
+        sys.exit(serve())
+
+
+COMMANDS = {
+    "chat": chat_command,
+    "reset": reset_command,
+    "history": history_command,
+    "import": import_command,
+    "interactive": interactive_command,
+    "search": search_command,
+    "batch": batch_command,
+    "run": run_command,
+    "daemon": daemon_command,
+}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+import os
+from threading import Lock
+from logging import getLogger
+from user_config import load_user_config
+from rate_limiter import get_rate_limiter
+
+logger = getLogger(__name__)
+
+ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
+
+DEFAULT_CONNECTION_POOL = {
+    "max_connections": 10,
+    "max_keepalive_connections": 5,
+    "keepalive_expiry": 60.0,
+}
+DEFAULT_TIMEOUT = {"connect": 5.0, "read": 600.0, "write": 600.0, "pool": 600.0}
+
+_client = None
+_async_client = None
+_client_lock = Lock()
+_connection_stats = {"opened": 0, "reused": 0}
+_stats_lock = Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_client()
+        return _client
+
+
+def get_async_client():
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = _create_async_client()
+        return _async_client
+
+
+def reset_client():
+    global _client, _async_client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        # The async client's connections belong to the event loop that opened
+        # them, so it is dropped rather than closed from synchronous code.
+        _async_client = None
+
+
+def get_connection_stats():
+    with _stats_lock:
+        return dict(_connection_stats)
+
+
+def _client_settings():
+    user_config = load_user_config()
+    pool = {**DEFAULT_CONNECTION_POOL, **user_config.get("connection_pool", {})}
+    timeout = {**DEFAULT_TIMEOUT, **user_config.get("timeout", {})}
+    logger.debug(f"Creating Anthropic client with pool {pool} and timeout {timeout}")
+    return pool, timeout
+
+
+def _create_client():
+    # The SDK takes most of the CLI's startup time, so it is only imported
+    # once a client is needed.
+    import anthropic
+
+    pool, timeout = _client_settings()
+    http_client = anthropic.DefaultHttpxClient(
+        limits=_httpx().Limits(**pool),
+        event_hooks={
+            "request": [_trace_request],
+            "response": [_count_connection, _update_rate_limits],
+        },
+    )
+    return anthropic.Client(
+        api_key=ANTHROPIC_API_KEY,
+        http_client=http_client,
+        timeout=anthropic.Timeout(**timeout),
+        # Retries are handled by retry_policy.RetryPolicy; letting the SDK
+        # retry as well would multiply the attempts.
+        max_retries=0,
+    )
+
+
+def _create_async_client():
+    import anthropic
+
+    pool, timeout = _client_settings()
+    http_client = anthropic.DefaultAsyncHttpxClient(
+        limits=_httpx().Limits(**pool),
+        event_hooks={
+            "request": [_async_trace_request],
+            "response": [_async_count_connection, _async_update_rate_limits],
+        },
+    )
+    return anthropic.AsyncAnthropic(
+        api_key=ANTHROPIC_API_KEY,
+        http_client=http_client,
+        timeout=anthropic.Timeout(**timeout),
+        max_retries=0,
+    )
+
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:  # Newer SDK releases ship their transport as httpx2.
+        import httpx2 as httpx
+    return httpx
+
+
+def _trace_request(request):
+    def trace(event_name, info):
+        if event_name.endswith("connect_tcp.complete"):
+            request.extensions["chat_new_connection"] = True
+
+    request.extensions["trace"] = trace
+
+
+def _count_connection(response):
+    if response.request.extensions.get("chat_new_connection"):
+        key = "opened"
+    else:
+        key = "reused"
+    with _stats_lock:
+        _connection_stats[key] += 1
+
+
+def _update_rate_limits(response):
+    get_rate_limiter().update_from_headers(response.headers)
+
+
+async def _async_trace_request(request):
+    async def trace(event_name, info):
+        if event_name.endswith("connect_tcp.complete"):
+            request.extensions["chat_new_connection"] = True
+
+    request.extensions["trace"] = trace
+
+
+async def _async_count_connection(response):
+    _count_connection(response)
+
+
+async def _async_update_rate_limits(response):
+    _update_rate_limits(response)
@@ -0,0 +1,17 @@
+import argcomplete
+from argument_parser import build_parser
+
+# A completion-only entry point: it builds the argument parser and nothing
+# else, so pressing TAB never loads the modules behind the commands. Register
+# it for chat.py with
+#
+#   eval "$(register-python-argcomplete \
+#       --external-argcomplete-script completion.py chat.py)"
+
+
+def main():
+    argcomplete.autocomplete(build_parser())
+
+
+if __name__ == "__main__":
+    main()
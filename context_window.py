@@ -0,0 +1,157 @@
+from time import time
+from logging import getLogger
+from anthropic_api import invoke_anthropic_api
+from utils import estimate_tokens, extract_response_text
+
+logger = getLogger(__name__)
+
+DEFAULT_CONTEXT_BUDGET_TOKENS = 100000
+# After compaction the kept messages use at most this share of the budget, so
+# a summary is not regenerated on every turn once the budget is reached.
+COMPACTION_TARGET = 0.5
+SUMMARY_MODEL = "claude-3-haiku-20240307"
+
+SUMMARY_SYSTEM_MESSAGE = """
+You maintain a running summary of a chat session between a user and an AI assistant so the conversation can continue after older messages are dropped.
+You will be given the existing summary, if there is one, and a transcript of the messages that follow it.
+Write an updated summary that keeps every decision, fact, requirement, open question and piece of code that later messages may depend on.
+Output only the summary enclosed in <summary>...</summary> tags.
+"""
+
+
+def new_message(role, content, model=None):
+    message = {"role": role, "content": content, "timestamp": time()}
+    if model:
+        message["model"] = model
+    count_message_tokens(message)
+    return message
+
+
+def count_message_tokens(message):
+    # The count is stored on the message itself, so it is saved with the
+    # history and never computed twice.
+    if "tokens" not in message:
+        message["tokens"] = estimate_tokens([message])
+    return message["tokens"]
+
+
+def latest_summary(conversation_history):
+    for message in reversed(conversation_history):
+        if "summary" in message:
+            return message["summary"]
+    return None
+
+
+def remove_last_turn(conversation_history):
+    # The summary is kept on the message that was newest when it was made,
+    # which undoing that turn removes. It moves to the last message kept, so
+    # the messages it covers are not summarized again.
+    remaining_history = conversation_history[:-2]
+    summary = latest_summary(conversation_history)
+    if (
+        summary
+        and remaining_history
+        and latest_summary(remaining_history) != summary
+        and summary["covers"] <= len(remaining_history)
+    ):
+        remaining_history[-1] = {**remaining_history[-1], "summary": summary}
+    return remaining_history
+
+
+def fit_context_window(conversation_history, system_message, budget_tokens=None):
+    budget_tokens = budget_tokens or DEFAULT_CONTEXT_BUDGET_TOKENS
+    summary = latest_summary(conversation_history)
+    covered = summary["covers"] if summary else 0
+
+    if _context_tokens(conversation_history, system_message, summary) > budget_tokens:
+        new_covered = _compaction_boundary(
+            conversation_history, covered, system_message, budget_tokens
+        )
+        if new_covered > covered:
+            summary = _summarize(
+                conversation_history, summary, new_covered, budget_tokens
+            )
+            # The summary is attached to the newest message so that saving the
+            # history persists it while the full transcript stays on disk.
+            conversation_history[-1]["summary"] = summary
+            covered = new_covered
+
+    api_history = [
+        {"role": message["role"], "content": message["content"]}
+        for message in conversation_history[covered:]
+    ]
+    if summary:
+        system_message = f"{system_message}\n\n<conversation_summary>\n{summary['text']}\n</conversation_summary>"
+    return api_history, system_message
+
+
+def _context_tokens(conversation_history, system_message, summary):
+    covered = summary["covers"] if summary else 0
+    tokens = estimate_tokens([], system_message)
+    if summary:
+        tokens += summary["tokens"]
+    for message in conversation_history[covered:]:
+        tokens += count_message_tokens(message)
+    return tokens
+
+
+def _compaction_boundary(conversation_history, covered, system_message, budget_tokens):
+    target_tokens = budget_tokens * COMPACTION_TARGET
+    kept_tokens = estimate_tokens([], system_message)
+    boundary = len(conversation_history) - 1
+
+    # Walk back from the newest message and keep whole turns while they fit.
+    for index in range(len(conversation_history) - 1, covered - 1, -1):
+        kept_tokens += count_message_tokens(conversation_history[index])
+        if kept_tokens > target_tokens and index < len(conversation_history) - 1:
+            break
+        if conversation_history[index]["role"] == "user":
+            boundary = index
+
+    return max(boundary, covered)
+
+
+def _summarize(conversation_history, summary, new_covered, budget_tokens):
+    previous_covered = summary["covers"] if summary else 0
+    summary_text = summary["text"] if summary else ""
+    logger.info(
+        f"Summarizing messages {previous_covered + 1}-{new_covered} to fit the context window"
+    )
+
+    batch = []
+    batch_tokens = 0
+    for message in conversation_history[previous_covered:new_covered]:
+        message_tokens = count_message_tokens(message)
+        if batch and batch_tokens + message_tokens > budget_tokens * COMPACTION_TARGET:
+            summary_text = _summarize_batch(summary_text, batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(message)
+        batch_tokens += message_tokens
+    if batch:
+        summary_text = _summarize_batch(summary_text, batch)
+
+    return {
+        "text": summary_text,
+        "covers": new_covered,
+        "tokens": estimate_tokens([{"content": summary_text}]),
+    }
+
+
+def _summarize_batch(summary_text, messages):
+    transcript = "\n\n".join(
+        f"<{message['role']}>\n{message['content']}\n</{message['role']}>"
+        for message in messages
+    )
+    content_text = invoke_anthropic_api(
+        [
+            {
+                "role": "user",
+                "content": f"<existing_summary>\n{summary_text}\n</existing_summary>\n<transcript>\n{transcript}\n</transcript>",
+            }
+        ],
+        model=SUMMARY_MODEL,
+        temperature=0.0,
+        system_message=SUMMARY_SYSTEM_MESSAGE,
+    )
+    return extract_response_text(content_text, "summary")
@@ -0,0 +1,158 @@
+import os
+import json
+import gzip
+from time import time
+from logging import getLogger
+from file_lock import file_lock, write_atomically
+from conversation_log import log_lock, read_log, forget_log, LOG_EXTENSION
+
+logger = getLogger(__name__)
+
+ARCHIVE_DIRECTORY = ".archive"
+INDEX_FILE = "index.json"
+LOCK_FILE = "archive.lock"
+LAST_CHECK_FILE = "last_check"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_EXTENSION = ".gz"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# Looking for stale conversations lists the whole directory, so it happens at
+# most this often.
+CHECK_INTERVAL_SECONDS = 24 * 60 * 60
+COMPRESSION_LEVEL = 6
+
+
+class ConversationArchive:
+    # Every archived conversation is a separate gzip member appended to a
+    # segment file, and the index records where each one starts. Reading a
+    # conversation back only decompresses its own member.
+    def __init__(self, conversations_directory):
+        self.conversations_directory = conversations_directory
+        self.directory = os.path.join(conversations_directory, ARCHIVE_DIRECTORY)
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.lock_path = os.path.join(self.directory, LOCK_FILE)
+
+    def titles(self):
+        return list(self._load_index())
+
+    def has_conversation(self, title):
+        return title in self._load_index()
+
+    def read(self, title):
+        entry = self._load_index().get(title)
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, entry["segment"]), "rb") as file:
+            file.seek(entry["offset"])
+            data = gzip.decompress(file.read(entry["length"]))
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    def restore(self, title):
+        path = self._log_path(title)
+        with file_lock(self.lock_path), log_lock(path):
+            index = self._load_index()
+            messages = self.read(title)
+            if messages is None:
+                return None
+            write_atomically(
+                path, "".join(json.dumps(message) + "\n" for message in messages)
+            )
+            segment = index.pop(title)["segment"]
+            self._save_index(index)
+            if not any(entry["segment"] == segment for entry in index.values()):
+                os.remove(os.path.join(self.directory, segment))
+        logger.info(f"Restored {title} from the archive")
+        return messages
+
+    def archive(self, title):
+        path = self._log_path(title)
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.lock_path), log_lock(path):
+            if not os.path.exists(path):
+                return False
+            messages = read_log(path)
+            data = gzip.compress(
+                "".join(json.dumps(message) + "\n" for message in messages).encode(),
+                compresslevel=COMPRESSION_LEVEL,
+            )
+            index = self._load_index()
+            segment = self._active_segment()
+            with open(os.path.join(self.directory, segment), "ab") as file:
+                offset = file.tell()
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            index[title] = {
+                "segment": segment,
+                "offset": offset,
+                "length": len(data),
+                "messages": len(messages),
+                "updated_at": os.path.getmtime(path),
+            }
+            # The log is only removed once the index can find its copy.
+            self._save_index(index)
+            os.remove(path)
+            forget_log(path)
+        return True
+
+    def archive_stale(self, max_age_days, exclude=()):
+        if not self._check_due():
+            return 0
+        cutoff = time() - max_age_days * 24 * 60 * 60
+        archived = 0
+        for file_name in os.listdir(self.conversations_directory):
+            title, extension = os.path.splitext(file_name)
+            if extension != LOG_EXTENSION or title in exclude:
+                continue
+            path = os.path.join(self.conversations_directory, file_name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if self.archive(title):
+                archived += 1
+        if archived:
+            logger.info(f"Archived {archived} conversations")
+        return archived
+
+    def _check_due(self):
+        os.makedirs(self.directory, exist_ok=True)
+        last_check_path = os.path.join(self.directory, LAST_CHECK_FILE)
+        try:
+            if time() - os.path.getmtime(last_check_path) < CHECK_INTERVAL_SECONDS:
+                return False
+        except FileNotFoundError:
+            pass
+        with open(last_check_path, "w"):
+            pass
+        return True
+
+    def _active_segment(self):
+        segments = sorted(
+            file_name
+            for file_name in os.listdir(self.directory)
+            if file_name.startswith(SEGMENT_PREFIX)
+            and file_name.endswith(SEGMENT_EXTENSION)
+        )
+        if segments:
+            latest = segments[-1]
+            size = os.path.getsize(os.path.join(self.directory, latest))
+            if size < SEGMENT_MAX_BYTES:
+                return latest
+            number = int(latest[len(SEGMENT_PREFIX) : -len(SEGMENT_EXTENSION)]) + 1
+        else:
+            number = 1
+        return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_EXTENSION}"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _save_index(self, index):
+        write_atomically(self.index_path, json.dumps(index))
+
+    def _log_path(self, title):
+        return os.path.join(self.conversations_directory, title + LOG_EXTENSION)
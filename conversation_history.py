@@ -1,38 +1,167 @@
 import os
 import sys
-import json
+import sqlite3
+from functools import lru_cache
+from logging import getLogger
 from user_config import load_user_config
-from formatting import format_assistant_message, format_user_message
+from conversation_log import (
+    load_log,
+    save_log,
+    read_log_range,
+    count_log_messages,
+    rename_log,
+    legacy_path,
+    LOG_EXTENSION,
+)
+from conversation_store import get_conversation_store, SQLITE_BACKEND
+from search_index import get_search_index
+from conversation_archive import ConversationArchive
+from conversation_names import add_conversation_name, rename_conversation_name
+from file_lock import write_atomically
 
-CONVERSATION_DIRECTORY = load_user_config()["conversations_directory"]
-CURRENT_CONVERSATION_FILE = CONVERSATION_DIRECTORY + "current_conversation.txt"
+logger = getLogger(__name__)
+
+# These settings are read from the user config when first needed rather than
+# at import time. Setting one of them overrides the config.
+CONVERSATION_DIRECTORY = None
+CURRENT_CONVERSATION_FILE = None
+STORAGE_BACKEND = None
+ARCHIVE_AFTER_DAYS = None
+CURRENT_CONVERSATION_KEY = "current_conversation"
+HISTORY_BATCH_SIZE = 50
+
+
+@lru_cache(maxsize=None)
+def _user_config():
+    return load_user_config()
+
+
+def conversation_directory():
+    return CONVERSATION_DIRECTORY or _user_config()["conversations_directory"]
+
+
+def current_conversation_path():
+    return CURRENT_CONVERSATION_FILE or os.path.join(
+        conversation_directory(), "current_conversation.txt"
+    )
+
+
+def storage_backend():
+    # "jsonl" keeps one log file per conversation, "sqlite" a single indexed
+    # database in the conversations directory.
+    return STORAGE_BACKEND or _user_config().get("storage_backend", "jsonl")
+
+
+def archive_after_days():
+    # Log files untouched for this many days are moved into compressed
+    # archive segments; None keeps every conversation as a plain log.
+    if ARCHIVE_AFTER_DAYS is not None:
+        return ARCHIVE_AFTER_DAYS
+    return _user_config().get("archive_after_days")
+
+
+def conversation_title(conversation_file):
+    return os.path.splitext(conversation_file)[0]
+
+
+def conversation_path(conversation_file):
+    return os.path.join(
+        conversation_directory(), conversation_title(conversation_file) + LOG_EXTENSION
+    )
 
 
 def save_conversation_history(conversation_history):
-    with open(CURRENT_CONVERSATION_FILE, "w") as file:
-        json_string = json.dumps(conversation_history)
-        file.write(json_string)
+    current_conversation_file = get_current_conversation_file()
+    if not current_conversation_file:
+        return
+    save_conversation(current_conversation_file, conversation_history)
+
+
+def save_conversation(conversation_file, conversation_history):
+    # The saved history can differ from the one passed in when another
+    # process added turns to the same conversation in the meantime.
+    if storage_backend() == SQLITE_BACKEND:
+        saved_history = get_conversation_store(conversation_directory()).save_messages(
+            conversation_title(conversation_file), conversation_history
+        )
+    else:
+        os.makedirs(conversation_directory(), exist_ok=True)
+        saved_history = save_log(
+            conversation_path(conversation_file), conversation_history
+        )
+    index_conversation(conversation_file, saved_history)
+    add_conversation_name(
+        conversation_directory(), conversation_title(conversation_file)
+    )
+    return saved_history
 
 
 def load_conversation_history():
-    try:
-        with open(CURRENT_CONVERSATION_FILE, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
+    current_conversation_file = get_current_conversation_file()
+    if not current_conversation_file:
         return []
+    return load_conversation(current_conversation_file)
+
+
+def load_conversation(conversation_file):
+    if storage_backend() == SQLITE_BACKEND:
+        return get_conversation_store(conversation_directory()).load_messages(
+            conversation_title(conversation_file)
+        )
+    log_path = conversation_path(conversation_file)
+    if not _log_exists(log_path):
+        # Archived conversations are read in place; they only become logs
+        # again when imported.
+        archived_messages = get_conversation_archive().read(
+            conversation_title(conversation_file)
+        )
+        if archived_messages is not None:
+            return archived_messages
+    return load_log(log_path)
+
+
+def get_conversation_archive():
+    return ConversationArchive(conversation_directory())
+
+
+def archive_stale_conversations():
+    if storage_backend() == SQLITE_BACKEND or archive_after_days() is None:
+        return 0
+    current_conversation_file = get_current_conversation_file()
+    exclude = [conversation_title(current_conversation_file or "")]
+    return get_conversation_archive().archive_stale(archive_after_days(), exclude)
+
+
+def index_conversation(conversation_file, conversation_history):
+    search_index = get_search_index(conversation_directory())
+    if search_index is None:
+        return
+    try:
+        search_index.update(conversation_title(conversation_file), conversation_history)
+    except sqlite3.Error as error:
+        # The history itself is already saved; a stale index only affects
+        # search results.
+        logger.warning(f"Could not update the search index: {error}")
 
 
 def get_current_conversation_file():
+    if storage_backend() == SQLITE_BACKEND:
+        store = get_conversation_store(conversation_directory())
+        return store.get_state(CURRENT_CONVERSATION_KEY)
     try:
-        with open(CURRENT_CONVERSATION_FILE, "r") as file:
+        with open(current_conversation_path(), "r") as file:
             return file.read().strip()
     except FileNotFoundError:
         return None
 
 
 def set_current_conversation_file(file_name):
-    with open(CURRENT_CONVERSATION_FILE, "w") as file:
-        file.write(file_name)
+    if storage_backend() == SQLITE_BACKEND:
+        store = get_conversation_store(conversation_directory())
+        store.set_state(CURRENT_CONVERSATION_KEY, file_name)
+        return
+    os.makedirs(conversation_directory(), exist_ok=True)
+    write_atomically(current_conversation_path(), file_name)
 
 
 def reset_conversation():
@@ -42,27 +171,145 @@ def reset_conversation():
     print("Conversation reset.", file=sys.stderr)
 
 
-def display_conversation_history(raw=False):
-    conversation_history = load_conversation_history()
-    if conversation_history:
-        for message in conversation_history:
-            role = message["role"]
-            content = message["content"]
-            if not raw:
-                if role == "assistant":
-                    format_assistant_message(content)
-                else:
-                    format_user_message(content)
+def display_conversation_history(
+    raw=False, last=None, offset=None, limit=None, pager=False
+):
+    start, stop = history_range(count_conversation_messages(), last, offset, limit)
+    messages = iter_conversation_messages(start, stop)
+    if pager:
+        from formatting import pager_output
+
+        with pager_output() as output:
+            _display_messages(messages, raw, output)
+    else:
+        _display_messages(messages, raw, sys.stdout)
+
+
+def _display_messages(messages, raw, output):
+    # Formatted messages go through the output backend, which only loads
+    # Rich when writing to a terminal.
+    if not raw:
+        from output import get_output
+
+        backend = get_output()
+
+    for message in messages:
+        role = message["role"]
+        content = message["content"]
+        if not raw:
+            if role == "assistant":
+                backend.assistant_message(content)
             else:
-                print(f"{role}: {content}")
+                backend.user_message(content)
+        else:
+            print(f"{role}: {content}", file=output)
+
+
+def history_range(message_count, last=None, offset=None, limit=None):
+    if last is not None:
+        return max(message_count - last, 0), message_count
+    start = min(offset or 0, message_count)
+    if limit is None:
+        return start, message_count
+    return start, min(start + limit, message_count)
+
+
+def iter_conversation_messages(start, stop):
+    # Messages are read a batch at a time, so a long history is never held in
+    # memory at once and the first ones render straight away.
+    for batch_start in range(start, stop, HISTORY_BATCH_SIZE):
+        batch_stop = min(batch_start + HISTORY_BATCH_SIZE, stop)
+        yield from load_conversation_messages(batch_start, batch_stop)
+
+
+def count_conversation_messages():
+    current_conversation_file = get_current_conversation_file()
+    if not current_conversation_file:
+        return 0
+    if storage_backend() == SQLITE_BACKEND:
+        return get_conversation_store(conversation_directory()).count_messages(
+            conversation_title(current_conversation_file)
+        )
+    log_path = _readable_log_path(current_conversation_file)
+    return count_log_messages(log_path) if log_path else 0
+
+
+def load_conversation_messages(start, stop):
+    current_conversation_file = get_current_conversation_file()
+    if not current_conversation_file:
+        return []
+    if storage_backend() == SQLITE_BACKEND:
+        return get_conversation_store(conversation_directory()).load_message_range(
+            conversation_title(current_conversation_file), start, stop
+        )
+    log_path = _readable_log_path(current_conversation_file)
+    return read_log_range(log_path, start, stop) if log_path else []
+
+
+def _readable_log_path(conversation_file):
+    log_path = conversation_path(conversation_file)
+    if not os.path.exists(log_path):
+        # Loading migrates a legacy .json file to a log.
+        load_log(log_path)
+    return log_path if os.path.exists(log_path) else None
 
 
 def import_conversation(conversation_name):
-    conversation_file = f"{conversation_name}.json"
-    conversation_path = os.path.join(CONVERSATION_DIRECTORY, conversation_file)
+    conversation_file = f"{conversation_name}{LOG_EXTENSION}"
 
-    if os.path.exists(conversation_path):
+    if conversation_exists(conversation_file):
+        if storage_backend() != SQLITE_BACKEND and not _log_exists(
+            conversation_path(conversation_file)
+        ):
+            get_conversation_archive().restore(conversation_name)
         set_current_conversation_file(conversation_file)
         return conversation_name
     else:
         return None
+
+
+def rename_conversation(conversation_file, conversation_name):
+    # Returns the conversation's new file name. A name already taken gets a
+    # number added, so that two conversations are never joined into one.
+    title = conversation_title(conversation_file)
+    new_title = conversation_name
+    number = 1
+    while conversation_exists(f"{new_title}{LOG_EXTENSION}"):
+        number += 1
+        new_title = f"{conversation_name}_{number}"
+    new_conversation_file = f"{new_title}{LOG_EXTENSION}"
+
+    if storage_backend() == SQLITE_BACKEND:
+        get_conversation_store(conversation_directory()).rename_conversation(
+            title, new_title
+        )
+    else:
+        rename_log(
+            conversation_path(conversation_file),
+            conversation_path(new_conversation_file),
+        )
+    search_index = get_search_index(conversation_directory())
+    if search_index is not None:
+        try:
+            search_index.rename(title, new_title)
+        except sqlite3.Error as error:
+            logger.warning(f"Could not update the search index: {error}")
+    rename_conversation_name(conversation_directory(), title, new_title)
+    if get_current_conversation_file() == conversation_file:
+        set_current_conversation_file(new_conversation_file)
+    return new_conversation_file
+
+
+def conversation_exists(conversation_file):
+    if storage_backend() == SQLITE_BACKEND:
+        store = get_conversation_store(conversation_directory())
+        return store.has_conversation(conversation_title(conversation_file))
+    if _log_exists(conversation_path(conversation_file)):
+        return True
+    return get_conversation_archive().has_conversation(
+        conversation_title(conversation_file)
+    )
+
+
+def _log_exists(log_path):
+    return os.path.exists(log_path) or os.path.exists(legacy_path(log_path))
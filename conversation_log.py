@@ -0,0 +1,355 @@
+import os
+import json
+import struct
+from array import array
+from logging import getLogger
+from file_lock import file_lock, write_atomically
+
+logger = getLogger(__name__)
+
+LOG_EXTENSION = ".jsonl"
+LEGACY_EXTENSION = ".json"
+LOCK_SUFFIX = ".lock"
+# A legacy file that cannot be parsed is kept under this suffix.
+CORRUPT_SUFFIX = ".corrupt"
+INDEX_SUFFIX = ".idx"
+# The offset index starts with the inode and length of the log it covers,
+# followed by the byte offset of every live message.
+INDEX_HEADER = struct.Struct("<QQ")
+# A log is rewritten once its superseded records outnumber the live messages
+# (and there are at least this many of them).
+COMPACTION_MIN_DEAD_RECORDS = 16
+
+# Each line of a log is either a message, or a truncation marker of the form
+# {"truncate": n} that drops every message after the first n. Appending is
+# therefore enough both to add a turn and to undo one.
+_log_state = {}
+
+
+def load_log(path):
+    # Every log has its own lock, so sessions on different conversations
+    # never wait for each other.
+    with log_lock(path):
+        if not os.path.exists(path) and not _migrate_legacy_file(path):
+            _log_state.pop(path, None)
+            return []
+
+        # A long-running process keeps the messages it last read or wrote,
+        # and only reads the log again once another process has changed it.
+        state = _log_state.get(path)
+        if state is not None and state["stat"] == _stat(path):
+            return _copy_messages(state["messages"])
+
+        messages, record_count = _read_records(path)
+        _remember(path, messages, record_count)
+        return _copy_messages(messages)
+
+
+def save_log(path, messages):
+    with log_lock(path):
+        state = _log_state.get(path)
+        stat = _stat(path)
+        if state is None or stat is None:
+            _rewrite(path, messages)
+            return messages
+        if state["stat"] != stat:
+            return _merge(path, messages, state["messages"])
+
+        # A history can lose its last turns and gain new ones between two
+        # saves, so what is already in the log is found by comparing the
+        # messages rather than counting them.
+        shared_count = shared_prefix_length(state["messages"], messages)
+        records = []
+        if shared_count < state["message_count"]:
+            records.append({"truncate": shared_count})
+        records.extend(messages[shared_count:])
+        if not records:
+            return messages
+
+        _append_records(path, records)
+        record_count = state["record_count"] + len(records)
+
+        dead_records = record_count - len(messages)
+        if dead_records >= max(COMPACTION_MIN_DEAD_RECORDS, len(messages)):
+            _compact(path, messages)
+        else:
+            _remember(path, messages, record_count)
+        return messages
+
+
+def read_log_range(path, start, stop):
+    # Only the requested messages are decoded, found through the offset index.
+    with log_lock(path):
+        offsets = _message_offsets(path)[start:stop]
+        messages = []
+        with open(path, "rb") as file:
+            for offset in offsets:
+                file.seek(offset)
+                try:
+                    messages.append(json.loads(file.readline()))
+                except ValueError:
+                    logger.warning(f"Skipping a corrupt record in {path}")
+        return messages
+
+
+def count_log_messages(path):
+    with log_lock(path):
+        return len(_message_offsets(path))
+
+
+def compact_log(path, messages=None):
+    with log_lock(path):
+        if messages is None:
+            messages, _ = _read_records(path)
+        _compact(path, messages)
+
+
+def log_lock(path):
+    return file_lock(lock_path(path))
+
+
+def read_log(path):
+    # Unlike load_log this neither locks nor tracks the log, for callers that
+    # already hold log_lock(path).
+    messages, _ = _read_records(path)
+    return messages
+
+
+def forget_log(path):
+    # For a log that has been moved away or archived. Its lock file goes
+    # too; the caller still holds the lock, so nobody else is using it.
+    _log_state.pop(path, None)
+    _remove_index(path)
+    try:
+        os.remove(lock_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def rename_log(path, new_path):
+    with log_lock(path):
+        os.rename(path, new_path)
+        forget_log(path)
+
+
+def shared_prefix_length(messages, other_messages, key=None):
+    # The number of leading messages the two histories have in common.
+    key = key or message_identity
+    for position, (message, other_message) in enumerate(zip(messages, other_messages)):
+        if key(message) != key(other_message):
+            return position
+    return min(len(messages), len(other_messages))
+
+
+def message_identity(message):
+    # Fields added to a message after it was saved, like its token count,
+    # do not make it a different message. A context summary does, so that one
+    # moved onto a saved message by an undo is written.
+    return (
+        message["role"],
+        message["content"],
+        message.get("timestamp"),
+        message.get("summary"),
+    )
+
+
+def legacy_path(path):
+    return os.path.splitext(path)[0] + LEGACY_EXTENSION
+
+
+def lock_path(path):
+    return path + LOCK_SUFFIX
+
+
+def _merge(path, messages, loaded_messages):
+    # Another process saved this conversation after it was loaded here. The
+    # turns added on each side are kept, ours after theirs.
+    loaded_count = len(loaded_messages)
+    current_messages, record_count = _read_records(path)
+    if shared_prefix_length(loaded_messages, messages) < loaded_count:
+        logger.warning(f"{path} changed while removing messages, overwriting it")
+        _rewrite(path, messages)
+        return messages
+
+    new_messages = messages[loaded_count:]
+    logger.info(
+        f"{path} was changed by another process, "
+        f"appending {len(new_messages)} messages after its changes"
+    )
+    _append_records(path, new_messages)
+    merged_messages = current_messages + new_messages
+    _remember(path, merged_messages, record_count + len(new_messages))
+    return merged_messages
+
+
+def _message_offsets(path):
+    stat = os.stat(path)
+    offsets = array("Q")
+    covered_size = 0
+    try:
+        with open(path + INDEX_SUFFIX, "rb") as file:
+            inode, indexed_size = INDEX_HEADER.unpack(file.read(INDEX_HEADER.size))
+            if inode == stat.st_ino and indexed_size <= stat.st_size:
+                offsets.frombytes(file.read())
+                covered_size = indexed_size
+    except (FileNotFoundError, struct.error, ValueError):
+        # A missing or unreadable index is rebuilt from the log.
+        pass
+    if covered_size == stat.st_size:
+        return offsets
+
+    # Logs only ever grow by appending, so just the records written since
+    # the index was last updated need to be scanned.
+    with open(path, "rb") as file:
+        file.seek(covered_size)
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            if line.startswith(b'{"truncate"'):
+                del offsets[json.loads(line)["truncate"] :]
+            elif line.strip():
+                offsets.append(covered_size)
+            covered_size += len(line)
+    write_atomically(
+        path + INDEX_SUFFIX,
+        INDEX_HEADER.pack(stat.st_ino, covered_size) + offsets.tobytes(),
+    )
+    return offsets
+
+
+def _remove_index(path):
+    try:
+        os.remove(path + INDEX_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def _compact(path, messages):
+    logger.info(f"Compacting conversation log {path}")
+    _rewrite(path, messages)
+
+
+def _read_records(path):
+    messages = []
+    record_count = 0
+    size = 0
+    valid_size = 0
+    with open(path, "rb") as file:
+        for line in file:
+            size += len(line)
+            if not line.strip():
+                valid_size += len(line)
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line.endswith(b"\n"):
+                    logger.warning(f"Skipping a corrupt record in {path}")
+                    valid_size += len(line)
+                    continue
+                # Only the final write can be cut short by a crash.
+                logger.warning(f"Discarding an incomplete record at the end of {path}")
+                break
+            valid_size += len(line)
+            record_count += 1
+            if "truncate" in record:
+                del messages[record["truncate"] :]
+            else:
+                messages.append(record)
+
+    if size > valid_size or (size and not line.endswith(b"\n")):
+        _repair_tail(path, valid_size)
+    return messages, record_count
+
+
+def _repair_tail(path, valid_size):
+    # Appends must start on a fresh line, so a torn record is cut off and a
+    # complete one missing its newline is terminated.
+    with open(path, "rb+") as file:
+        file.truncate(valid_size)
+        if valid_size:
+            file.seek(valid_size - 1)
+            if file.read(1) != b"\n":
+                file.write(b"\n")
+
+
+def _append_records(path, records):
+    with open(path, "a") as file:
+        file.write("".join(json.dumps(record) + "\n" for record in records))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _rewrite(path, messages):
+    write_atomically(path, "".join(json.dumps(message) + "\n" for message in messages))
+    _remove_index(path)
+    _remember(path, messages, len(messages))
+
+
+def _migrate_legacy_file(path):
+    legacy_file = legacy_path(path)
+    try:
+        with open(legacy_file, "r") as file:
+            text = file.read()
+    except FileNotFoundError:
+        return False
+    try:
+        messages = json.loads(text)
+    except ValueError:
+        # A crash while the whole file was being written leaves it cut
+        # short. The messages written before that point are kept, and the
+        # file itself is set aside rather than failing every later load.
+        messages = _recover_messages(text)
+        logger.warning(
+            f"{legacy_file} is incomplete, recovered {len(messages)} messages "
+            f"and moved it to {legacy_file + CORRUPT_SUFFIX}"
+        )
+        _rewrite(path, messages)
+        os.replace(legacy_file, legacy_file + CORRUPT_SUFFIX)
+        return True
+    logger.info(f"Migrating {legacy_file} to {path}")
+    _rewrite(path, messages)
+    os.remove(legacy_file)
+    return True
+
+
+def _recover_messages(text):
+    # Decodes the complete messages at the start of a truncated JSON list.
+    decoder = json.JSONDecoder()
+    messages = []
+    position = text.find("[") + 1
+    if not position:
+        return messages
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        try:
+            message, position = decoder.raw_decode(text, position)
+        except ValueError:
+            return messages
+        if not isinstance(message, dict):
+            return messages
+        messages.append(message)
+
+
+def _remember(path, messages, record_count):
+    _log_state[path] = {
+        "stat": _stat(path),
+        "message_count": len(messages),
+        "record_count": record_count,
+        "messages": _copy_messages(messages),
+    }
+
+
+def _copy_messages(messages):
+    # Callers add fields to the messages they are given, which must not
+    # change the remembered ones.
+    return [dict(message) for message in messages]
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
@@ -1,63 +1,47 @@
 import os
+import re
+import sqlite3
+from uuid import uuid4
+from threading import Lock
+from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor
 from conversation_history import (
     save_conversation_history,
     load_conversation_history,
+    load_conversation,
+    index_conversation,
+    archive_stale_conversations,
     get_current_conversation_file,
     set_current_conversation_file,
+    reset_conversation,
+    rename_conversation,
 )
-from formatting import format_conversation_title
-from anthropic_api import invoke_anthropic_api
+from anthropic_api import (
+    invoke_anthropic_api,
+    stream_anthropic_api,
+    async_invoke_anthropic_api,
+    async_stream_anthropic_api,
+)
+from context_window import fit_context_window, new_message, remove_last_turn
+from conversation_log import LOG_EXTENSION, LEGACY_EXTENSION
+from conversation_store import get_conversation_store, SQLITE_BACKEND
+from search_index import get_search_index
+from conversation_archive import ConversationArchive
+from conversation_names import write_conversation_names
 from user_config import load_user_config
 from system_prompts import SYSTEM_PROMPTS
 from utils import extract_response_text
+from output import get_output
 
+logger = getLogger(__name__)
 
-def invoke_conversation(
-    message,
-    model=None,
-    temperature=None,
-    system_message=None,
-    conversations_directory=None,
-):
-    current_conversation_file = get_current_conversation_file()
-
-    if not current_conversation_file:
-        conversation_name = generate_conversation_name(message)
-        current_conversation_file = f"{conversation_name}.json"
-        set_current_conversation_file(current_conversation_file)
-        save_conversation_history([])
-
-    user_config = load_user_config()
-    model = model or user_config["model"]
-    temperature = temperature or user_config["temperature"]
-    system_message = system_message or SYSTEM_PROMPTS[user_config["persona"]]
-    conversations_directory = (
-        conversations_directory or user_config["conversations_directory"]
-    )
-
-    conversation_history = load_conversation_history()
-    conversation_history.append({"role": "user", "content": message})
-
-    assistant_response = invoke_anthropic_api(
-        conversation_history, model, temperature, system_message
-    )
-
-    conversation_history.append({"role": "assistant", "content": assistant_response})
-
-    save_conversation_history(conversation_history)
-
-    return "assistant", assistant_response
-
+# A new conversation is saved under a temporary name until its title has
+# been generated, which happens alongside the first reply.
+UNTITLED_PREFIX = "untitled_"
 
-def generate_conversation_name(first_message):
-    conversation_history = [
-        {
-            "role": "user",
-            "content": f"<first_user_message>\n{first_message}\n</first_user_message>\nRemember your system message. Output only the filename enclosed in filename tags.",
-        }
-    ]
+CONVERSATION_NAME_MODEL = "claude-3-haiku-20240307"
 
-    system_message = """
+CONVERSATION_NAME_SYSTEM_MESSAGE = """
 You will be provided with the first user message in a chat session with an LLM. We're going to save this conversation to the filesystem and we want to create a meaningful name so we can refrence it and continue a conversation later if we choose. Please create a short filename, 3-7 words maximum, that describes the user's query. Focus more on the user's query or issue 
 than any supporting documentation or code.
 
@@ -85,40 +69,358 @@ than any supporting documentation or code.
 Your output should be only a filename enclosed in <filename>...</filename> tags.
     """
 
-    content_text = invoke_anthropic_api(
+
+def invoke_conversation(
+    message,
+    model=None,
+    temperature=None,
+    system_message=None,
+    conversations_directory=None,
+    stream=False,
+    use_cache=True,
+):
+    current_conversation_file = get_current_conversation_file()
+
+    title_future = None
+    if not current_conversation_file:
+        current_conversation_file = _start_untitled_conversation()
+        # The title is generated while the reply is requested, and the
+        # conversation renamed once both have arrived.
+        executor = ThreadPoolExecutor(max_workers=1)
+        title_future = executor.submit(generate_conversation_title, message)
+        executor.shutdown(wait=False)
+
+    user_config = load_user_config()
+    model, temperature, system_message, conversations_directory = _resolve_settings(
+        user_config, model, temperature, system_message, conversations_directory
+    )
+
+    conversation_history = load_conversation_history()
+    conversation_history.append(new_message("user", message, model))
+    api_history, system_message = fit_context_window(
         conversation_history,
-        model="claude-3-haiku-20240307",
+        system_message,
+        user_config.get("context_budget_tokens"),
+    )
+
+    if stream:
+        return "assistant", _stream_assistant_response(
+            conversation_history,
+            api_history,
+            model,
+            temperature,
+            system_message,
+            use_cache,
+            current_conversation_file,
+            title_future,
+        )
+
+    assistant_response = invoke_anthropic_api(
+        api_history, model, temperature, system_message, use_cache=use_cache
+    )
+
+    conversation_history.append(new_message("assistant", assistant_response, model))
+
+    save_conversation_history(conversation_history)
+    if title_future:
+        _name_conversation(current_conversation_file, _title_result(title_future))
+
+    return "assistant", assistant_response
+
+
+def _start_conversation(conversation_name):
+    set_current_conversation_file(f"{conversation_name}{LOG_EXTENSION}")
+    save_conversation_history([])
+    archive_stale_conversations()
+
+
+def _start_untitled_conversation():
+    conversation_name = f"{UNTITLED_PREFIX}{uuid4().hex[:12]}"
+    _start_conversation(conversation_name)
+    return f"{conversation_name}{LOG_EXTENSION}"
+
+
+def _name_conversation(conversation_file, title):
+    # Returns the conversation's file name, which stays the temporary one
+    # when no title could be generated.
+    conversation_name = _conversation_name_from_title(title or "")
+    if not conversation_name:
+        return conversation_file
+    try:
+        conversation_file = rename_conversation(conversation_file, conversation_name)
+    except (OSError, sqlite3.Error) as error:
+        # As when no title could be generated, the reply is already saved
+        # under the temporary name.
+        logger.warning(f"Could not rename the conversation to {title}: {error}")
+        return conversation_file
+    get_output().conversation_title(title)
+    return conversation_file
+
+
+def _title_result(title_future):
+    try:
+        return title_future.result()
+    except Exception as error:
+        # The reply is already saved; the conversation keeps its temporary
+        # name, and can still be imported by it.
+        logger.warning(f"Could not generate a conversation title: {error}")
+        return None
+
+
+async def _async_title_result(title_task):
+    try:
+        return await title_task
+    except Exception as error:
+        logger.warning(f"Could not generate a conversation title: {error}")
+        return None
+
+
+def _resolve_settings(
+    user_config, model, temperature, system_message, conversations_directory
+):
+    model = model or user_config["model"]
+    temperature = temperature or user_config["temperature"]
+    system_message = system_message or SYSTEM_PROMPTS[user_config["persona"]]
+    conversations_directory = (
+        conversations_directory or user_config["conversations_directory"]
+    )
+    return model, temperature, system_message, conversations_directory
+
+
+def _stream_assistant_response(
+    conversation_history,
+    api_history,
+    model,
+    temperature,
+    system_message,
+    use_cache,
+    conversation_file=None,
+    title_future=None,
+):
+    chunks = []
+    for chunk in stream_anthropic_api(
+        api_history, model, temperature, system_message, use_cache=use_cache
+    ):
+        chunks.append(chunk)
+        yield chunk
+
+    # Only a completed reply is persisted; an interrupted stream leaves the
+    # stored history untouched.
+    conversation_history.append(new_message("assistant", "".join(chunks), model))
+    save_conversation_history(conversation_history)
+    if title_future:
+        _name_conversation(conversation_file, _title_result(title_future))
+
+
+def generate_conversation_title(first_message):
+    content_text = invoke_anthropic_api(
+        _conversation_name_request(first_message),
+        model=CONVERSATION_NAME_MODEL,
+        temperature=1.0,
+        system_message=CONVERSATION_NAME_SYSTEM_MESSAGE,
+        # A cached title would reuse another conversation's file name.
+        use_cache=False,
+    )
+    return _conversation_title_from_response(content_text)
+
+
+async def async_generate_conversation_title(first_message):
+    content_text = await async_invoke_anthropic_api(
+        _conversation_name_request(first_message),
+        model=CONVERSATION_NAME_MODEL,
         temperature=1.0,
-        system_message=system_message,
+        system_message=CONVERSATION_NAME_SYSTEM_MESSAGE,
+        use_cache=False,
     )
+    return _conversation_title_from_response(content_text)
+
+
+def _conversation_name_request(first_message):
+    return [
+        {
+            "role": "user",
+            "content": f"<first_user_message>\n{first_message}\n</first_user_message>\nRemember your system message. Output only the filename enclosed in filename tags.",
+        }
+    ]
+
+
+def _conversation_title_from_response(content_text):
     extracted_text = extract_response_text(content_text, "filename")
+    return extracted_text[:100]
 
-    truncated_message = extracted_text[:100]
-    format_conversation_title(truncated_message)
-    conversation_name = truncated_message.replace(" ", "_").replace(".", "")
-    return conversation_name
+
+def _conversation_name_from_title(title):
+    # The name becomes a file name, so only word characters and hyphens from
+    # the model's title are kept; path separators and dots never reach it.
+    conversation_name = re.sub(r"\s+", "_", title.strip())
+    return re.sub(r"[^\w-]", "", conversation_name).strip("_-")
 
 
 def get_conversation_names():
-    conversations_directory = load_user_config()["conversations_directory"]
-    conversation_files = os.listdir(conversations_directory)
-    conversation_names = [
-        file_name[:-5]
-        for file_name in conversation_files
-        if file_name.endswith(".json")
-    ]
+    user_config = load_user_config()
+    conversations_directory = user_config["conversations_directory"]
+    if user_config.get("storage_backend") == SQLITE_BACKEND:
+        store = get_conversation_store(conversations_directory)
+        conversation_names = store.conversation_titles()
+    else:
+        conversation_names = []
+        for file_name in os.listdir(conversations_directory):
+            conversation_name, extension = os.path.splitext(file_name)
+            if extension in (LOG_EXTENSION, LEGACY_EXTENSION):
+                conversation_names.append(conversation_name)
+        conversation_names.extend(ConversationArchive(conversations_directory).titles())
+        # A legacy .json file is migrated the first time it is loaded, so a
+        # name can briefly appear twice.
+        conversation_names = list(dict.fromkeys(conversation_names))
+    # Shell completion reads the names back from this list; saves add new
+    # conversations to it.
+    write_conversation_names(conversations_directory, conversation_names)
     return conversation_names
 
 
+def search_conversations(
+    query, role=None, model=None, since=None, until=None, limit=20
+):
+    conversations_directory = load_user_config()["conversations_directory"]
+    search_index = get_search_index(conversations_directory)
+    if search_index is None:
+        return None
+    if not search_index.is_built:
+        # Conversations saved before the index existed are indexed once;
+        # after that every save keeps it up to date.
+        for conversation_name in get_conversation_names():
+            conversation_file = f"{conversation_name}{LOG_EXTENSION}"
+            index_conversation(conversation_file, load_conversation(conversation_file))
+        search_index.mark_built()
+    return search_index.search(
+        query, role=role, model=model, since=since, until=until, limit=limit
+    )
+
+
 def remove_last_interaction():
     current_conversation_file = get_current_conversation_file()
     if current_conversation_file:
         conversation_history = load_conversation_history()
         if len(conversation_history) >= 2:
-            conversation_history = conversation_history[:-2]
-            save_conversation_history(conversation_history)
+            save_conversation_history(remove_last_turn(conversation_history))
             return True
         else:
             return False
     else:
         return False
+
+
+class ChatSession:
+    # An interactive session loads the user config and the current
+    # conversation once and keeps them in memory. Each turn only appends to
+    # the history here; a HistoryWriter saves it in the background, so the
+    # time a turn takes does not depend on how long the conversation is.
+    def __init__(self):
+        from history_writer import HistoryWriter
+
+        self.user_config = load_user_config()
+        self.conversation_file = get_current_conversation_file() or None
+        self.history = (
+            load_conversation(self.conversation_file) if self.conversation_file else []
+        )
+        self.title_task = None
+        self.lock = Lock()
+        self.writer = HistoryWriter(on_saved=self._on_saved)
+
+    async def send(self, message, use_cache=True):
+        # Returns the reply as an async iterator of text chunks. The history
+        # is saved once the whole reply has arrived.
+        import asyncio
+
+        if not self.conversation_file:
+            conversation_file = await asyncio.to_thread(_start_untitled_conversation)
+            # The conversation is renamed after the first complete reply.
+            self.title_task = asyncio.create_task(
+                async_generate_conversation_title(message)
+            )
+            with self.lock:
+                self.conversation_file = conversation_file
+                self.history = []
+
+        model, temperature, system_message, _ = _resolve_settings(
+            self.user_config, None, None, None, None
+        )
+        with self.lock:
+            self.history.append(new_message("user", message, model))
+            conversation_history = self.history
+        api_history, system_message = await asyncio.to_thread(
+            fit_context_window,
+            conversation_history,
+            system_message,
+            self.user_config.get("context_budget_tokens"),
+        )
+        return self._stream_reply(
+            api_history, model, temperature, system_message, use_cache
+        )
+
+    async def _stream_reply(
+        self, api_history, model, temperature, system_message, use_cache
+    ):
+        import asyncio
+
+        chunks = []
+        async for chunk in async_stream_anthropic_api(
+            api_history, model, temperature, system_message, use_cache=use_cache
+        ):
+            chunks.append(chunk)
+            yield chunk
+
+        with self.lock:
+            self.history.append(new_message("assistant", "".join(chunks), model))
+            self.writer.schedule(self.conversation_file, self.history)
+
+        if self.title_task:
+            title_task, self.title_task = self.title_task, None
+            title = await _async_title_result(title_task)
+            await asyncio.to_thread(self._rename, title)
+
+    def undo(self):
+        with self.lock:
+            if len(self.history) < 2:
+                return False
+            self.history = remove_last_turn(self.history)
+            self.writer.schedule(self.conversation_file, self.history)
+            return True
+
+    def reset(self):
+        # Whatever is still waiting is saved to the conversation it belongs
+        # to before the session moves on.
+        self.writer.flush()
+        reset_conversation()
+        with self.lock:
+            self.conversation_file = None
+            self.history = []
+        # A title still on its way belonged to the conversation just left.
+        self.title_task = None
+
+    def close(self):
+        self.writer.close()
+
+    def _rename(self, title):
+        # The save waiting for the temporary name is written before the
+        # conversation is renamed.
+        self.writer.flush()
+        conversation_file = _name_conversation(self.conversation_file, title)
+        with self.lock:
+            self.conversation_file = conversation_file
+
+    def _on_saved(self, conversation_file, messages, saved_messages):
+        if len(saved_messages) == len(messages):
+            return
+        # Another process added turns, which were merged in before the ones
+        # saved here. The history is rebuilt on the merged one, and replaces
+        # any save still waiting, which would otherwise drop those turns.
+        with self.lock:
+            if conversation_file != self.conversation_file:
+                return
+            if len(self.history) >= len(messages):
+                self.history = saved_messages + self.history[len(messages) :]
+            else:
+                undone = len(messages) - len(self.history)
+                self.history = saved_messages[: len(saved_messages) - undone]
+            self.writer.schedule(conversation_file, self.history)
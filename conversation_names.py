@@ -0,0 +1,66 @@
+import os
+import json
+from file_lock import file_lock, write_atomically
+
+# The names of all saved conversations, kept in a small file so that shell
+# completion can list them without loading any storage backend. The file has
+# no extension so it is never mistaken for a conversation log.
+NAMES_FILE = ".conversation_names"
+LOCK_SUFFIX = ".lock"
+
+# Names this process has already seen in the file, per directory.
+_known_names = {}
+
+
+def names_path(directory):
+    return os.path.join(directory, NAMES_FILE)
+
+
+def read_conversation_names(directory):
+    # None means the names have never been recorded for this directory.
+    try:
+        with open(names_path(directory), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_conversation_names(directory, names):
+    os.makedirs(directory, exist_ok=True)
+    path = names_path(directory)
+    with file_lock(path + LOCK_SUFFIX):
+        write_atomically(path, json.dumps(names))
+    _known_names[directory] = set(names)
+
+
+def add_conversation_name(directory, name):
+    # Called on every save, so the file is only read the first time and only
+    # rewritten when a conversation is new.
+    if name in _known_names.get(directory, ()):
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = names_path(directory)
+    with file_lock(path + LOCK_SUFFIX):
+        names = read_conversation_names(directory)
+        if names is None:
+            # Without a recorded list the next completion rebuilds it from
+            # the conversations themselves.
+            return
+        if name not in names:
+            names.append(name)
+            write_atomically(path, json.dumps(names))
+        _known_names[directory] = set(names)
+
+
+def rename_conversation_name(directory, name, new_name):
+    os.makedirs(directory, exist_ok=True)
+    path = names_path(directory)
+    with file_lock(path + LOCK_SUFFIX):
+        names = read_conversation_names(directory)
+        if names is None:
+            return
+        names = [new_name if known == name else known for known in names]
+        if new_name not in names:
+            names.append(new_name)
+        write_atomically(path, json.dumps(names))
+        _known_names[directory] = set(names)
@@ -0,0 +1,258 @@
+import os
+import json
+import sqlite3
+from threading import Lock
+from time import time
+from logging import getLogger
+from conversation_log import (
+    load_log,
+    shared_prefix_length,
+    LOG_EXTENSION,
+    LEGACY_EXTENSION,
+)
+
+logger = getLogger(__name__)
+
+SQLITE_BACKEND = "sqlite"
+DATABASE_FILE = "conversations.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    model TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    token_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversations_created_at ON conversations (created_at);
+CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+CREATE INDEX IF NOT EXISTS conversations_model ON conversations (model);
+CREATE INDEX IF NOT EXISTS conversations_token_count ON conversations (token_count);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    model TEXT,
+    timestamp REAL,
+    tokens INTEGER,
+    message TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_stores = {}
+_stores_lock = Lock()
+
+
+class ConversationStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        # The messages of each conversation last read or written here, to
+        # tell our own changes from another process's.
+        self.loaded_messages = {}
+        # The connection is shared by the threads of this process and guarded
+        # by self.lock; WAL mode lets other processes read while one writes.
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def load_messages(self, title):
+        with self.lock:
+            messages = self._select_messages(title)
+            self.loaded_messages[title] = _copy_messages(messages)
+        return messages
+
+    def save_messages(self, title, messages):
+        now = time()
+        with self.lock, self.connection:
+            # Taking the write lock up front keeps another process from
+            # saving between the count below and the inserts.
+            self.connection.execute("BEGIN IMMEDIATE")
+            conversation_id, message_count = self._ensure_conversation(title, now)
+            loaded_messages = self.loaded_messages.get(title)
+            if loaded_messages is None:
+                loaded_messages = self._select_messages(title)
+            loaded_count = len(loaded_messages)
+            shared_count = shared_prefix_length(loaded_messages, messages)
+            merged = message_count != loaded_count and shared_count == loaded_count
+            if merged:
+                # Another process saved this conversation after it was loaded
+                # here. The turns added on each side are kept, ours after theirs.
+                start = message_count
+                new_messages = messages[loaded_count:]
+                logger.info(
+                    f"{title} was changed by another process, "
+                    f"appending {len(new_messages)} messages after its changes"
+                )
+            else:
+                # Only the messages after those the stored history shares
+                # with this one are written. Comparing them, rather than the
+                # lengths, catches turns undone and replaced between saves.
+                start = min(message_count, shared_count)
+                new_messages = messages[start:]
+
+            self.connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ? AND position >= ?",
+                (conversation_id, start),
+            )
+            self.connection.executemany(
+                "INSERT INTO messages"
+                " (conversation_id, position, role, model, timestamp, tokens, message)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        conversation_id,
+                        position,
+                        message["role"],
+                        message.get("model"),
+                        message.get("timestamp"),
+                        message.get("tokens"),
+                        json.dumps(message),
+                    )
+                    for position, message in enumerate(new_messages, start)
+                ],
+            )
+            self.connection.execute(
+                "UPDATE conversations SET model = coalesce(?, model),"
+                " updated_at = ?, message_count = ?, token_count ="
+                " (SELECT coalesce(sum(tokens), 0) FROM messages"
+                " WHERE conversation_id = ?)"
+                " WHERE id = ?",
+                (
+                    messages[-1].get("model") if messages else None,
+                    now,
+                    start + len(new_messages),
+                    conversation_id,
+                    conversation_id,
+                ),
+            )
+            saved_messages = self._select_messages(title) if merged else messages
+            self.loaded_messages[title] = _copy_messages(saved_messages)
+            return saved_messages
+
+    def load_message_range(self, title, start, stop):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT message FROM messages"
+                " JOIN conversations ON conversations.id = messages.conversation_id"
+                " WHERE conversations.title = ? AND position >= ? AND position < ?"
+                " ORDER BY position",
+                (title, start, stop),
+            ).fetchall()
+        return [json.loads(message) for (message,) in rows]
+
+    def count_messages(self, title):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT message_count FROM conversations WHERE title = ?", (title,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def has_conversation(self, title):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM conversations WHERE title = ?", (title,)
+            ).fetchone()
+        return row is not None
+
+    def rename_conversation(self, title, new_title):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE conversations SET title = ? WHERE title = ?", (new_title, title)
+            )
+            if title in self.loaded_messages:
+                self.loaded_messages[new_title] = self.loaded_messages.pop(title)
+
+    def conversation_titles(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT title FROM conversations ORDER BY updated_at DESC"
+            ).fetchall()
+        return [title for (title,) in rows]
+
+    def get_state(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+    def import_logs(self, directory):
+        imported = 0
+        for file_name in sorted(os.listdir(directory)):
+            title, extension = os.path.splitext(file_name)
+            if extension not in (LOG_EXTENSION, LEGACY_EXTENSION):
+                continue
+            if self.has_conversation(title):
+                continue
+            messages = load_log(os.path.join(directory, title + LOG_EXTENSION))
+            self.save_messages(title, messages)
+            imported += 1
+        if imported:
+            logger.info(f"Imported {imported} conversations into {self.path}")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _select_messages(self, title):
+        rows = self.connection.execute(
+            "SELECT message FROM messages"
+            " JOIN conversations ON conversations.id = messages.conversation_id"
+            " WHERE conversations.title = ? ORDER BY position",
+            (title,),
+        ).fetchall()
+        return [json.loads(message) for (message,) in rows]
+
+    def _ensure_conversation(self, title, now):
+        row = self.connection.execute(
+            "SELECT id, message_count FROM conversations WHERE title = ?", (title,)
+        ).fetchone()
+        if row:
+            return row
+        cursor = self.connection.execute(
+            "INSERT INTO conversations (title, created_at, updated_at)"
+            " VALUES (?, ?, ?)",
+            (title, now, now),
+        )
+        return cursor.lastrowid, 0
+
+
+def _copy_messages(messages):
+    return [dict(message) for message in messages]
+
+
+def get_conversation_store(directory):
+    path = os.path.join(directory, DATABASE_FILE)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            os.makedirs(directory, exist_ok=True)
+            is_new = not os.path.exists(path)
+            store = ConversationStore(path)
+            if is_new:
+                # Conversations saved as log files before the switch stay
+                # available.
+                store.import_logs(directory)
+            _stores[path] = store
+        return store
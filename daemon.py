@@ -0,0 +1,263 @@
+import os
+import io
+import sys
+import json
+import socket
+import traceback
+from pathlib import Path
+from threading import Event, Thread
+from contextvars import ContextVar
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# `chat.py daemon` keeps the Anthropic client, the loaded conversations and
+# the imported modules in one long-running process and runs the other
+# commands for chat.py over a Unix socket. A request is a single JSON line
+# holding the parsed arguments; the reply is a stream of {"stdout": text} and
+# {"stderr": text} lines, written as the output is produced, ending with
+# {"exit": code}.
+SOCKET_FILE = ".chat_daemon.sock"
+# Interactive sessions, paged history and file jobs need the caller's own
+# terminal or files, so they always run in the calling process.
+DAEMON_COMMANDS = {"chat", "reset", "history", "import", "search"}
+# Paths given on the command line are relative to the client's directory,
+# which the daemon does not share.
+PATH_ARGUMENTS = ("conversations_directory", "directory")
+# How often the daemon checks whether it has been asked to stop.
+ACCEPT_TIMEOUT_SECONDS = 0.5
+
+
+def socket_path():
+    return str(Path.home() / SOCKET_FILE)
+
+
+def served_by_daemon(args):
+    return args.command in DAEMON_COMMANDS and not getattr(args, "pager", False)
+
+
+def run_in_daemon(args):
+    # Returns the command's exit code, or None when no daemon is running and
+    # the command has to run in this process.
+    arguments = dict(vars(args))
+    for name in PATH_ARGUMENTS:
+        if arguments.get(name):
+            arguments[name] = os.path.abspath(arguments[name])
+    reply = _request({"args": arguments, **_terminal_details()})
+    if reply is None:
+        return None
+    for message in reply:
+        if "stdout" in message:
+            sys.stdout.write(message["stdout"])
+            sys.stdout.flush()
+        elif "stderr" in message:
+            sys.stderr.write(message["stderr"])
+            sys.stderr.flush()
+        elif "exit" in message:
+            return message["exit"]
+    print("The chat daemon stopped before the command finished.", file=sys.stderr)
+    return 1
+
+
+def stop_daemon():
+    reply = _request({"stop": True})
+    if reply is None:
+        return False
+    for _ in reply:
+        pass
+    return True
+
+
+def serve():
+    path = socket_path()
+    reply = _request({"ping": True})
+    if reply is not None:
+        for _ in reply:
+            pass
+        print(f"The chat daemon is already running on {path}", file=sys.stderr)
+        return 1
+    if os.path.exists(path):
+        # Left behind by a daemon that did not shut down cleanly.
+        os.remove(path)
+
+    _warm_up()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The socket runs commands as this user, so nobody else may connect.
+    previous_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(previous_umask)
+    server.listen()
+    server.settimeout(ACCEPT_TIMEOUT_SECONDS)
+    print(f"Chat daemon listening on {path}", file=sys.stderr)
+    # Each request runs on its own thread, so a long model call never holds
+    # up the others. Conversations are guarded by their own locks, as they
+    # are between separate processes, and each thread sees only its own
+    # output streams.
+    sys.stdout = ThreadOutput(sys.stdout)
+    sys.stderr = ThreadOutput(sys.stderr)
+    stopping = Event()
+    threads = []
+    try:
+        while not stopping.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            thread = Thread(
+                target=_serve_connection, args=(connection, stopping), daemon=True
+            )
+            thread.start()
+            threads = [thread for thread in threads if thread.is_alive()] + [thread]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(path)
+    # Requests already running are finished before the daemon exits.
+    for thread in threads:
+        thread.join()
+    sys.stdout = sys.stdout.stream
+    sys.stderr = sys.stderr.stream
+    print("Chat daemon stopped.", file=sys.stderr)
+    return 0
+
+
+class ThreadOutput(io.TextIOBase):
+    # Replaces stdout or stderr in the daemon. A request thread redirects it
+    # to its client; everything else still goes to the daemon's own stream.
+    def __init__(self, stream):
+        self.stream = stream
+        self.redirected = ContextVar("redirected", default=None)
+
+    def current(self):
+        redirected = self.redirected.get()
+        return self.stream if redirected is None else redirected
+
+    def write(self, text):
+        return self.current().write(text)
+
+    def flush(self):
+        self.current().flush()
+
+    def isatty(self):
+        return self.current().isatty()
+
+    def fileno(self):
+        return self.current().fileno()
+
+    def writable(self):
+        return True
+
+
+class SocketOutput(io.TextIOBase):
+    # Stands in for stdout or stderr while a command runs, passing every
+    # write straight on to the client so streamed responses stay streamed.
+    def __init__(self, connection, stream, terminal):
+        self.connection = connection
+        self.stream = stream
+        self.terminal = terminal
+
+    def write(self, text):
+        if text:
+            _send(self.connection, {self.stream: text})
+        return len(text)
+
+    def isatty(self):
+        return self.terminal
+
+    def writable(self):
+        return True
+
+
+def _serve_connection(connection, stopping):
+    with connection:
+        if not _handle(connection):
+            stopping.set()
+
+
+def _handle(connection):
+    from argparse import Namespace
+    from formatting import redirect_output
+    from chat import COMMANDS
+    from conversation_history import _user_config
+
+    request = json.loads(connection.makefile("rb").readline() or "{}")
+    if request.get("stop"):
+        _send(connection, {"exit": 0})
+        return False
+    if "args" not in request:
+        _send(connection, {"exit": 0})
+        return True
+
+    # The config is small and may have been edited since the last request.
+    _user_config.cache_clear()
+    args = Namespace(**request["args"])
+    terminal = request.get("terminal", False)
+    stdout = SocketOutput(connection, "stdout", terminal)
+    stderr = SocketOutput(connection, "stderr", terminal)
+    exit_code = 0
+    stdout_token = sys.stdout.redirected.set(stdout)
+    stderr_token = sys.stderr.redirected.set(stderr)
+    try:
+        with redirect_output(
+            stdout, force_terminal=terminal, width=request.get("width")
+        ):
+            try:
+                COMMANDS[args.command](args)
+            except SystemExit as exit:
+                exit_code = exit.code if isinstance(exit.code, int) else 1
+            except (BrokenPipeError, ConnectionError):
+                raise
+            except Exception:
+                # The client shows the traceback as if the command had failed
+                # in its own process.
+                traceback.print_exc()
+                exit_code = 1
+        _send(connection, {"exit": exit_code})
+    except (BrokenPipeError, ConnectionError):
+        logger.info("The client disconnected before the command finished")
+    finally:
+        sys.stdout.redirected.reset(stdout_token)
+        sys.stderr.redirected.reset(stderr_token)
+    return True
+
+
+def _warm_up():
+    # Everything a command would otherwise load on each run is loaded once.
+    import chat
+    import formatting
+    import conversation_manager
+    from client_manager import get_client
+
+    get_client()
+
+
+def _request(request):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+    client.sendall(json.dumps(request).encode() + b"\n")
+    return _replies(client)
+
+
+def _replies(client):
+    with client, client.makefile("rb") as reader:
+        for line in reader:
+            yield json.loads(line)
+
+
+def _send(connection, message):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _terminal_details():
+    try:
+        width = os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        width = None
+    return {"terminal": sys.stdout.isatty(), "width": width}
@@ -0,0 +1,51 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from logging import getLogger
+
+try:
+    import fcntl
+except ImportError:  # Advisory locks are unavailable on Windows.
+    fcntl = None
+
+logger = getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    if fcntl is None:
+        logger.debug(f"File locking unavailable, not locking {path}")
+        yield
+        return
+
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_atomically(path, data, sync=True):
+    # Caches that can be rebuilt pass sync=False and skip waiting for the
+    # disk.
+    # Each call gets its own temporary file, so threads writing the same
+    # path never share one.
+    descriptor, temporary_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(path) or None,
+    )
+    try:
+        with open(descriptor, "wb" if isinstance(data, bytes) else "w") as file:
+            file.write(data)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -1,11 +1,26 @@
-from rich.console import Console
+import os
+import sys
+import shlex
+import subprocess
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from rich.console import Console, Group
 from rich.style import Style
 from rich.syntax import Syntax
 from rich.text import Text
 from rich.progress import Progress
 from rich.markdown import Markdown
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+from datetime import datetime
+from search_index import HIGHLIGHT_START, HIGHLIGHT_END
+from render_cache import get_render_cache, render_key
 
 console = Console()
+# While output is redirected, for example for one request to the daemon, the
+# redirected console is only seen by the thread or task that redirected it.
+_redirected_console = ContextVar("redirected_console", default=None)
 
 title_style = Style(
     color="green",
@@ -13,65 +28,235 @@ title_style = Style(
 )
 user_style = Style(color="magenta")
 assistant_style = Style(color="#7dcfff")
+match_style = Style(color="black", bgcolor="yellow", bold=True)
+# Part of every render cache key: increase it whenever the way messages are
+# rendered changes, so output cached by an older version is not reused.
+RENDER_VERSION = 1
 
 
 def format_user_message(message):
-    console.print(Markdown(message, style=user_style, code_theme="ansi_dark"))
+    _print_message(
+        "user",
+        message,
+        lambda: Markdown(message, style=user_style, code_theme="ansi_dark"),
+    )
 
 
 def format_assistant_message(message):
-    lines = message.split("\n")
-    in_code_block = False
-    code_block_lines = []
+    _print_message(
+        "assistant", message, lambda: Group(*assistant_message_renderables(message))
+    )
+
+
+def _print_message(role, message, renderable):
+    console = get_console()
+    render_cache = get_render_cache()
+    if render_cache is None:
+        console.print(renderable(), highlight=False)
+        return
+
+    # The same message renders differently at another width or without
+    # colour, so both are part of the key.
+    theme = f"{RENDER_VERSION}:{console.color_system}"
+    key = render_key(role, message, console.width, theme)
+    rendered = render_cache.get(key)
+    if rendered is None:
+        with console.capture() as capture:
+            console.print(renderable(), highlight=False)
+        rendered = capture.get()
+        render_cache.set(key, rendered)
+    console.file.write(rendered)
+    console.file.flush()
+
+
+def assistant_message_renderables(message):
+    # The reply is split once into runs of prose and fenced code blocks, and
+    # each run is rendered once, so the time taken grows with its length.
+    renderables = []
+    prose_lines = []
+    code_block_lines = None
     language = "python"
-    formatted_lines = []
 
-    for line in lines:
+    for line in message.split("\n"):
         if line.startswith("```"):
-            if in_code_block:
-                # End of code block
-                code_block = "\n".join(code_block_lines)
-                syntax = Syntax(
-                    code_block, language, line_numbers=False, word_wrap=True
-                )
-                console.print(syntax)
+            if code_block_lines is None:
+                if prose_lines:
+                    renderables.append(_prose_text(prose_lines))
+                    prose_lines = []
                 code_block_lines = []
-                in_code_block = False
+                language = line[3:].strip() or "python"
+            else:
+                renderables.append(_code_block_syntax(code_block_lines, language))
+                code_block_lines = None
+        elif code_block_lines is not None:
+            code_block_lines.append(line)
+        else:
+            prose_lines.append(line)
+
+    if code_block_lines is not None:
+        # The reply ended without closing its code block.
+        renderables.append(_code_block_syntax(code_block_lines, language))
+    if prose_lines:
+        renderables.append(_prose_text(prose_lines))
+    return renderables
+
+
+def _prose_text(lines):
+    text = Text(style=assistant_style)
+    for line_number, line in enumerate(lines):
+        if line_number:
+            text.append("\n")
+        # Inline code is delimited by backticks within a single line.
+        for i, part in enumerate(line.split("`")):
+            if i % 2 == 0:
+                text.append(part)
+            else:
+                text.append(part, style="bold yellow")
+    return text
+
+
+def _code_block_syntax(lines, language):
+    return Syntax(
+        "\n".join(lines),
+        cached_lexer(language) or "text",
+        line_numbers=False,
+        word_wrap=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def cached_lexer(language):
+    # Syntax looks its lexer up by name, which searches all of Pygments'
+    # lexers, each time it is rendered.
+    try:
+        return get_lexer_by_name(language, stripnl=False, ensurenl=True, tabsize=4)
+    except ClassNotFound:
+        return None
+
+
+class AssistantStreamRenderer:
+    def __init__(self):
+        self.chunks = []
+        self.pending = ""
+        self.printed = 0
+        self.in_inline_code = False
+        self.in_code_block = False
+        self.code_block_lines = []
+        self.language = "python"
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        self.pending += chunk
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            self._finish_line(line)
+        if not self.in_code_block and not self._may_be_fence(self.pending):
+            self._print_prose(self.pending[self.printed :])
+            self.printed = len(self.pending)
+
+    def close(self):
+        if self.pending:
+            self._finish_line(self.pending)
+            self.pending = ""
+        if self.in_code_block:
+            # The reply ended without closing its code block.
+            self._print_code_block()
+
+    def _finish_line(self, line):
+        if line.startswith("```"):
+            if self.in_code_block:
+                self._print_code_block()
             else:
-                # Start of code block
-                in_code_block = True
-                language = line[
-                    3:
-                ].strip()  # Extract the language from the code block delimiter
-                if not language:
-                    language = "python"
+                self.in_code_block = True
+                self.language = line[3:].strip() or "python"
+        elif self.in_code_block:
+            self.code_block_lines.append(line)
         else:
-            if in_code_block:
-                code_block_lines.append(line)
+            self._print_prose(line[self.printed :] + "\n")
+            self.in_inline_code = False
+        self.printed = 0
+
+    def _may_be_fence(self, partial_line):
+        return partial_line.startswith("```") or "```".startswith(partial_line)
+
+    def _print_prose(self, text):
+        if not text:
+            return
+        formatted_text = Text()
+        parts = text.split("`")
+        for i, part in enumerate(parts):
+            if i > 0:
+                self.in_inline_code = not self.in_inline_code
+            if self.in_inline_code:
+                formatted_text.append(Text(part, style="bold yellow"))
             else:
-                # Format inline code
-                formatted_line = Text()
-                parts = line.split("`")
-                for i, part in enumerate(parts):
-                    if i % 2 == 0:
-                        formatted_line.append(part)
-                    else:
-                        formatted_line.append(Text(part, style="bold yellow"))
-                formatted_line.append(
-                    "\n"
-                )  # Add a line break after each formatted line
-                formatted_lines.append(formatted_line)
-
-            console.print(*formatted_lines, style=assistant_style, highlight=False)
+                formatted_text.append(part)
+        get_console().print(
+            formatted_text,
+            style=assistant_style,
+            highlight=False,
+            end="",
+            soft_wrap=True,
+        )
+
+    def _print_code_block(self):
+        get_console().print(_code_block_syntax(self.code_block_lines, self.language))
+        self.code_block_lines = []
+        self.in_code_block = False
+
+
+def format_assistant_stream(chunks):
+    renderer = AssistantStreamRenderer()
+    for chunk in chunks:
+        renderer.feed(chunk)
+    renderer.close()
+    return renderer.text
+
+
+async def async_format_assistant_stream(chunks):
+    renderer = AssistantStreamRenderer()
+    async for chunk in chunks:
+        renderer.feed(chunk)
+    renderer.close()
+    return renderer.text
 
 
 def format_conversation_title(title):
-    console.print(f"Title: {title}", style=title_style)
+    get_console().print(f"Title: {title}", style=title_style)
+
+
+def format_search_result(result):
+    details = [result.role]
+    if result.model:
+        details.append(result.model)
+    if result.timestamp is not None:
+        details.append(
+            datetime.fromtimestamp(result.timestamp).strftime("%Y-%m-%d %H:%M")
+        )
+    header = Text(result.conversation, style=title_style)
+    header.append(f"  #{result.position}  {' · '.join(details)}", style="dim")
+
+    snippet = Text(style=user_style if result.role == "user" else assistant_style)
+    first_part, *highlighted_parts = result.snippet.split(HIGHLIGHT_START)
+    snippet.append(first_part)
+    for part in highlighted_parts:
+        match, _, rest = part.partition(HIGHLIGHT_END)
+        snippet.append(match, style=match_style)
+        snippet.append(rest)
+
+    console = get_console()
+    console.print(header, highlight=False)
+    console.print(snippet, highlight=False)
+    console.print()
 
 
 def format_code_block(code, language):
     syntax = Syntax(code, language, line_numbers=True)
-    console.print(syntax)
+    get_console().print(syntax)
 
 
 def format_progress(total, current, description):
@@ -82,10 +267,55 @@ def format_progress(total, current, description):
 
 def format_markdown(markdown):
     md = Markdown(markdown)
-    console.print(md)
+    get_console().print(md)
 
 
 def format_image(image_path):
     with open(image_path, "r") as image_file:
         image = image_file.read()
-    console.print(image)
+    get_console().print(image)
+
+
+def get_console():
+    redirected_console = _redirected_console.get()
+    return console if redirected_console is None else redirected_console
+
+
+@contextmanager
+def redirect_output(file, force_terminal=None, width=None):
+    redirected_console = Console(
+        file=file,
+        force_terminal=force_terminal,
+        width=width or get_console().width,
+    )
+    token = _redirected_console.set(redirected_console)
+    try:
+        yield redirected_console
+    finally:
+        _redirected_console.reset(token)
+
+
+@contextmanager
+def pager_output():
+    if not sys.stdout.isatty():
+        yield sys.stdout
+        return
+
+    # Output is written to the pager as it is rendered. Once the pipe is full
+    # rendering blocks until the user scrolls, and it stops when they quit.
+    pager = subprocess.Popen(
+        shlex.split(os.environ.get("PAGER", "less -R")),
+        stdin=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        with redirect_output(pager.stdin, force_terminal=True):
+            yield pager.stdin
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pager.stdin.close()
+        except BrokenPipeError:
+            pass
+        pager.wait()
@@ -0,0 +1,94 @@
+import atexit
+from threading import Condition, Thread
+from logging import getLogger
+from conversation_history import save_conversation
+
+logger = getLogger(__name__)
+
+
+class HistoryWriter:
+    # Saves conversations on a background thread so that a turn never waits
+    # for the disk. The histories waiting for each conversation are saved in
+    # the order they were scheduled. A burst of new turns is still written
+    # once, as a history that only adds messages to the one waiting before
+    # it takes its place.
+    def __init__(self, on_saved=None):
+        # on_saved(conversation_file, messages, saved_messages) is called
+        # after every save, from the writer thread.
+        self.on_saved = on_saved
+        self.condition = Condition()
+        # Per conversation, the histories waiting to be saved, each with
+        # whether it only adds messages to the history scheduled before it.
+        self.pending = {}
+        self.scheduled = {}
+        self.writing = False
+        self.closed = False
+        self.thread = Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+        # Histories still waiting are saved even if close() is never reached.
+        atexit.register(self.flush)
+
+    def schedule(self, conversation_file, messages):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The history writer is closed")
+            messages = list(messages)
+            previous_messages = self.scheduled.get(conversation_file)
+            adds_only = previous_messages is not None and _extends(
+                messages, previous_messages
+            )
+            queue = self.pending.setdefault(conversation_file, [])
+            if queue and queue[-1][1] and _extends(messages, queue[-1][0]):
+                queue[-1] = (messages, True)
+            else:
+                # A history that removed messages, like an undo, is saved
+                # before any turn that follows it, never skipped over.
+                queue.append((messages, adds_only))
+            self.scheduled[conversation_file] = messages
+            self.condition.notify_all()
+
+    def flush(self):
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        atexit.unregister(self.flush)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                conversation_file = next(iter(self.pending))
+                queue = self.pending[conversation_file]
+                messages, _ = queue.pop(0)
+                if not queue:
+                    del self.pending[conversation_file]
+                self.writing = True
+            try:
+                saved_messages = save_conversation(conversation_file, messages)
+                if self.on_saved:
+                    self.on_saved(conversation_file, messages, saved_messages)
+            except Exception:
+                # The session goes on; the next change saves the whole
+                # history again.
+                logger.exception(f"Could not save {conversation_file}")
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+
+def _extends(messages, earlier_messages):
+    return (
+        len(messages) >= len(earlier_messages)
+        and messages[: len(earlier_messages)] == earlier_messages
+    )
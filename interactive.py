@@ -1,51 +1,83 @@
+import signal
+import asyncio
 from prompt_toolkit import PromptSession
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.completion import WordCompleter
-from conversation_manager import (
-    invoke_conversation,
-    remove_last_interaction,
-)
-from conversation_history import reset_conversation
-from formatting import format_user_message, format_assistant_message
+from conversation_manager import ChatSession
+from client_manager import get_connection_stats
+from anthropic_api import get_usage_stats
+from formatting import async_format_assistant_stream
 
 
-def interactive_chat():
+def interactive_chat(use_cache=True):
+    asyncio.run(async_interactive_chat(use_cache))
+
+
+async def async_interactive_chat(use_cache=True):
     print(
         "Entering interactive chat mode. Type 'quit' or 'exit' to end the conversation."
     )
 
     session = PromptSession(
         auto_suggest=AutoSuggestFromHistory(),
-        completer=WordCompleter(["reset", "undo", "quit", "exit"]),
+        completer=WordCompleter(["reset", "undo", "stats", "quit", "exit"]),
     )
+    chat_session = await asyncio.to_thread(ChatSession)
+    # Being terminated or losing the terminal ends the session like "quit",
+    # so the history still waiting to be saved is written.
+    loop = asyncio.get_running_loop()
+    for signal_name in ("SIGTERM", "SIGHUP"):
+        try:
+            loop.add_signal_handler(
+                getattr(signal, signal_name), asyncio.current_task().cancel
+            )
+        except (NotImplementedError, AttributeError):
+            # Windows has neither SIGHUP nor loop signal handlers.
+            pass
 
+    try:
+        await _chat_loop(session, chat_session, use_cache)
+    except asyncio.CancelledError:
+        print("\nExiting interactive chat mode.")
+    finally:
+        await asyncio.to_thread(chat_session.close)
+
+
+async def _chat_loop(session, chat_session, use_cache):
     while True:
         try:
-            user_input = session.prompt("User: ")
+            user_input = await session.prompt_async("User: ")
 
             if user_input.lower() in ["quit", "exit"]:
                 print("Exiting interactive chat mode.")
                 break
 
             if user_input.lower() == "reset":
-                reset_conversation()
+                await asyncio.to_thread(chat_session.reset)
                 print("Conversation history has been reset.")
                 continue
 
             if user_input.lower() == "undo":
-                success = remove_last_interaction()
-                if success:
+                if chat_session.undo():
                     print("Last interaction removed from the conversation history.")
                 else:
                     print("No interactions to remove from the conversation history.")
                 continue
 
-            role, response = invoke_conversation(user_input)
+            if user_input.lower() == "stats":
+                stats = get_connection_stats()
+                usage = get_usage_stats()
+                print(
+                    f"Connections opened: {stats['opened']}, reused: {stats['reused']}"
+                )
+                print(
+                    f"Prompt cache tokens read: {usage['cache_read_input_tokens']}, "
+                    f"written: {usage['cache_creation_input_tokens']}"
+                )
+                continue
 
-            if role == "assistant":
-                format_assistant_message(response)
-            else:
-                format_user_message(response)
+            response = await chat_session.send(user_input, use_cache=use_cache)
+            await async_format_assistant_stream(response)
 
         except KeyboardInterrupt:
             print("\nExiting interactive chat mode.")
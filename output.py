@@ -0,0 +1,210 @@
+import sys
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from search_index import HIGHLIGHT_START, HIGHLIGHT_END
+
+# Commands show their results through an output backend rather than through
+# Rich directly. Rich formats for a terminal; piped output is written as plain
+# text, and --json writes JSON (or NDJSON events when streaming). Only the
+# Rich backend loads Rich.
+
+# Set by use_output(); like a redirected console it is only seen by the
+# thread or task that set it.
+_output = ContextVar("output", default=None)
+
+
+class RichOutput:
+    def user_message(self, text):
+        from formatting import format_user_message
+
+        format_user_message(text)
+
+    def assistant_message(self, text):
+        from formatting import format_assistant_message
+
+        format_assistant_message(text)
+
+    def assistant_stream(self, chunks):
+        from formatting import format_assistant_stream
+
+        return format_assistant_stream(chunks)
+
+    def conversation_title(self, title):
+        from formatting import format_conversation_title
+
+        format_conversation_title(title)
+
+    def notice(self, text):
+        from formatting import get_console
+
+        get_console().print(text)
+
+    def table(self, title, columns, rows):
+        from rich.table import Table
+        from formatting import get_console
+
+        table = Table(title=title)
+        table.add_column(columns[0], style="cyan")
+        for column in columns[1:]:
+            table.add_column(column, style="magenta")
+        for row in rows:
+            table.add_row(*(str(value) for value in row))
+        get_console().print(table)
+
+    def search_result(self, result):
+        from formatting import format_search_result
+
+        format_search_result(result)
+
+    def close(self):
+        pass
+
+
+class PlainOutput:
+    def user_message(self, text):
+        print(text)
+
+    def assistant_message(self, text):
+        print(text)
+
+    def assistant_stream(self, chunks):
+        parts = []
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+            parts.append(chunk)
+        text = "".join(parts)
+        if not text.endswith("\n"):
+            sys.stdout.write("\n")
+        return text
+
+    def conversation_title(self, title):
+        print(f"Title: {title}")
+
+    def notice(self, text):
+        print(text)
+
+    def table(self, title, columns, rows):
+        # Tab-separated, one row per line, for cut and awk.
+        for row in rows:
+            print("\t".join(str(value) for value in row))
+
+    def search_result(self, result):
+        print(
+            f"{result.conversation} #{result.position} {result.role}: "
+            f"{plain_snippet(result.snippet)}"
+        )
+
+    def close(self):
+        pass
+
+
+class JsonOutput:
+    # Everything a command shows is collected into one JSON document, written
+    # once the command has finished.
+    def __init__(self):
+        self.document = {}
+
+    def user_message(self, text):
+        self.document.update(role="user", content=text)
+
+    def assistant_message(self, text):
+        self.document.update(role="assistant", content=text)
+
+    def assistant_stream(self, chunks):
+        text = "".join(chunks)
+        self.assistant_message(text)
+        return text
+
+    def conversation_title(self, title):
+        self.document["title"] = title
+
+    def notice(self, text):
+        self.document["message"] = text
+
+    def table(self, title, columns, rows):
+        self.document["rows"] = [dict(zip(_keys(columns), row)) for row in rows]
+
+    def search_result(self, result):
+        self.document.setdefault("results", []).append(_search_result_fields(result))
+
+    def close(self):
+        from utils import output_json
+
+        output_json(self.document)
+
+
+class NdjsonOutput:
+    # Every event is written as one line of JSON as soon as it happens, so a
+    # streamed reply arrives as "delta" events followed by the full message.
+    def user_message(self, text):
+        self._event("message", role="user", content=text)
+
+    def assistant_message(self, text):
+        self._event("message", role="assistant", content=text)
+
+    def assistant_stream(self, chunks):
+        parts = []
+        for chunk in chunks:
+            self._event("delta", text=chunk)
+            parts.append(chunk)
+        text = "".join(parts)
+        self.assistant_message(text)
+        return text
+
+    def conversation_title(self, title):
+        self._event("title", title=title)
+
+    def notice(self, text):
+        self._event("notice", message=text)
+
+    def table(self, title, columns, rows):
+        for row in rows:
+            self._event("row", **dict(zip(_keys(columns), row)))
+
+    def search_result(self, result):
+        self._event("result", **_search_result_fields(result))
+
+    def close(self):
+        pass
+
+    def _event(self, event_type, **fields):
+        print(json.dumps({"type": event_type, **fields}), flush=True)
+
+
+def get_output():
+    output = _output.get()
+    if output is not None:
+        return output
+    return RichOutput() if sys.stdout.isatty() else PlainOutput()
+
+
+def select_output(json_output=False, stream=False):
+    if json_output:
+        return NdjsonOutput() if stream else JsonOutput()
+    return get_output()
+
+
+@contextmanager
+def use_output(output):
+    # Everything shown while the block runs, including by the modules the
+    # command calls, goes through this backend.
+    token = _output.set(output)
+    try:
+        yield output
+        output.close()
+    finally:
+        _output.reset(token)
+
+
+def plain_snippet(snippet):
+    return snippet.replace(HIGHLIGHT_START, "").replace(HIGHLIGHT_END, "")
+
+
+def _search_result_fields(result):
+    return {**result._asdict(), "snippet": plain_snippet(result.snippet)}
+
+
+def _keys(columns):
+    return [column.lower().replace(" ", "_") for column in columns]
@@ -0,0 +1,242 @@
+import os
+import json
+from datetime import datetime, timezone
+from threading import Lock
+from time import sleep, monotonic, time
+from logging import getLogger
+from file_lock import file_lock, write_atomically
+from user_config import load_user_config
+
+logger = getLogger(__name__)
+
+HEADER_PREFIX = "anthropic-ratelimit-"
+BUCKET_NAMES = ["requests", "tokens", "input-tokens"]
+# Conversation scans treat every .json file in the conversations directory
+# as a legacy conversation, so the shared state must not use that extension.
+SHARED_STATE_FILE = ".rate_limit_state"
+# Anthropic rate limits are expressed per minute.
+LIMIT_WINDOW_SECONDS = 60.0
+
+_rate_limiter = None
+_rate_limiter_lock = Lock()
+
+
+class TokenBucket:
+    def __init__(self, clock=None):
+        self.clock = clock or monotonic
+        self.capacity = None
+        self.tokens = None
+        self.refill_rate = None
+        self.updated_at = self.clock()
+
+    def update(self, limit, remaining, reset_at=None):
+        now = self.clock()
+        if self.capacity is None:
+            self.tokens = min(remaining, limit)
+        else:
+            # Keep reservations that other callers have made but not yet sent.
+            self._refill()
+            self.tokens = min(self.tokens, remaining, limit)
+        self.capacity = limit
+        self.refill_rate = limit / LIMIT_WINDOW_SECONDS
+        if reset_at is not None:
+            seconds_until_reset = (
+                reset_at - datetime.now(timezone.utc)
+            ).total_seconds()
+            if seconds_until_reset > 0 and limit > remaining:
+                self.refill_rate = (limit - remaining) / seconds_until_reset
+        self.updated_at = now
+
+    def wait_time(self, cost):
+        if self.capacity is None:
+            return 0.0
+        self._refill()
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.refill_rate
+
+    def consume(self, cost):
+        if self.capacity is None:
+            return
+        self._refill()
+        self.tokens -= min(cost, self.capacity)
+
+    def reserve(self, cost):
+        wait = self.wait_time(cost)
+        self.consume(cost)
+        return wait
+
+    def to_dict(self):
+        return {
+            "capacity": self.capacity,
+            "tokens": self.tokens,
+            "refill_rate": self.refill_rate,
+            "updated_at": self.updated_at,
+        }
+
+    def load_dict(self, data):
+        self.capacity = data["capacity"]
+        self.tokens = data["tokens"]
+        self.refill_rate = data["refill_rate"]
+        self.updated_at = data["updated_at"]
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate
+        )
+        self.updated_at = now
+
+
+class RateLimiter:
+    def __init__(self):
+        self.buckets = {name: TokenBucket() for name in BUCKET_NAMES}
+        self.lock = Lock()
+
+    def acquire(self, estimated_tokens):
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait <= 0:
+                return
+            sleep(wait)
+
+    async def async_acquire(self, estimated_tokens):
+        # asyncio is already loaded whenever a coroutine runs; importing it
+        # here keeps it out of the synchronous commands' startup.
+        import asyncio
+
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        with self.lock:
+            _update_buckets(self.buckets, headers)
+
+    def _reserve(self, estimated_tokens):
+        with self.lock:
+            costs = _request_costs(estimated_tokens)
+            wait = max(
+                self.buckets[name].wait_time(cost) for name, cost in costs.items()
+            )
+            if wait <= 0:
+                for name, cost in costs.items():
+                    self.buckets[name].consume(cost)
+                return 0.0
+        logger.info(
+            f"Pacing request for {wait:.2f} seconds to stay under the rate limit"
+        )
+        return wait
+
+
+class SharedRateLimiter:
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.lock_path = f"{state_path}.lock"
+
+    def acquire(self, estimated_tokens):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            sleep(wait)
+
+    async def async_acquire(self, estimated_tokens):
+        import asyncio
+
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        with file_lock(self.lock_path):
+            buckets = self._load_buckets()
+            _update_buckets(buckets, headers)
+            self._save_buckets(buckets)
+
+    def _reserve(self, estimated_tokens):
+        # Every process takes its slot while holding the lock, driving the
+        # shared buckets negative. Later arrivals therefore queue behind
+        # earlier ones instead of all waking up and retrying at once.
+        with file_lock(self.lock_path):
+            buckets = self._load_buckets()
+            costs = _request_costs(estimated_tokens)
+            wait = max(buckets[name].reserve(cost) for name, cost in costs.items())
+            self._save_buckets(buckets)
+        if wait > 0:
+            logger.info(
+                f"Pacing request for {wait:.2f} seconds to stay under the shared rate limit"
+            )
+        return wait
+
+    def _load_buckets(self):
+        buckets = {name: TokenBucket(clock=time) for name in BUCKET_NAMES}
+        try:
+            with open(self.state_path, "r") as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return buckets
+        for name, data in state.get("buckets", {}).items():
+            if name in buckets and data.get("capacity") is not None:
+                buckets[name].load_dict(data)
+        return buckets
+
+    def _save_buckets(self, buckets):
+        state = {
+            "buckets": {name: bucket.to_dict() for name, bucket in buckets.items()}
+        }
+        write_atomically(self.state_path, json.dumps(state))
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = _create_rate_limiter()
+        return _rate_limiter
+
+
+def _create_rate_limiter():
+    user_config = load_user_config()
+    if not user_config.get("shared_rate_limit", False):
+        return RateLimiter()
+    conversations_directory = user_config["conversations_directory"]
+    os.makedirs(conversations_directory, exist_ok=True)
+    return SharedRateLimiter(os.path.join(conversations_directory, SHARED_STATE_FILE))
+
+
+def _request_costs(estimated_tokens):
+    return {
+        "requests": 1,
+        "tokens": estimated_tokens,
+        "input-tokens": estimated_tokens,
+    }
+
+
+def _update_buckets(buckets, headers):
+    for name, bucket in buckets.items():
+        limit = headers.get(f"{HEADER_PREFIX}{name}-limit")
+        remaining = headers.get(f"{HEADER_PREFIX}{name}-remaining")
+        if limit is None or remaining is None:
+            continue
+        try:
+            bucket.update(
+                int(limit),
+                int(remaining),
+                _parse_reset(headers.get(f"{HEADER_PREFIX}{name}-reset")),
+            )
+        except ValueError:
+            logger.debug(f"Ignoring malformed {name} rate limit headers")
+
+
+def _parse_reset(reset):
+    if not reset:
+        return None
+    try:
+        reset_at = datetime.fromisoformat(reset.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return reset_at
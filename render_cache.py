@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from logging import getLogger
+from file_lock import write_atomically
+from user_config import load_user_config
+
+logger = getLogger(__name__)
+
+CACHE_DIRECTORY = ".render_cache"
+ENTRY_EXTENSION = ".ansi"
+# Rendered messages are kept in memory, which helps the daemon and long
+# sessions. Keeping them on disk as well, so separate runs share them, is
+# turned on with "disk": true.
+DEFAULT_RENDER_CACHE_SETTINGS = {
+    "enabled": True,
+    "memory_entries": 512,
+    "disk": False,
+    "max_size_mb": 50,
+}
+# Listing the directory to evict entries happens once per this many writes.
+EVICTION_INTERVAL = 64
+
+_render_cache = None
+_render_cache_lock = Lock()
+
+
+class RenderCache:
+    # Holds messages already rendered to terminal output, most recently used
+    # last in memory and optionally as one file each on disk, so displaying
+    # a message again skips parsing and highlighting it.
+    def __init__(self, memory_entries, directory=None, max_size_bytes=None):
+        self.memory_entries = memory_entries
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.writes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        with self.lock:
+            rendered = self.entries.get(key)
+            if rendered is not None:
+                self.entries.move_to_end(key)
+                return rendered
+        if not self.directory:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                rendered = file.read()
+        except FileNotFoundError:
+            return None
+        # The modification time doubles as the last-used time for eviction.
+        os.utime(path)
+        self._remember(key, rendered)
+        return rendered
+
+    def set(self, key, rendered):
+        self._remember(key, rendered)
+        if not self.directory:
+            return
+        try:
+            write_atomically(
+                self._entry_path(key), rendered.encode("utf-8"), sync=False
+            )
+        except OSError as error:
+            logger.warning(f"Could not write to the render cache: {error}")
+            return
+        self.writes += 1
+        if self.writes % EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(ENTRY_EXTENSION):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def _remember(self, key, rendered):
+        with self.lock:
+            self.entries[key] = rendered
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.memory_entries:
+                self.entries.popitem(last=False)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+
+def render_key(role, content, width, theme):
+    serialized = json.dumps([role, content, width, theme], ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_render_cache():
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            user_config = load_user_config()
+            settings = {
+                **DEFAULT_RENDER_CACHE_SETTINGS,
+                **user_config.get("render_cache", {}),
+            }
+            if not settings["enabled"]:
+                return None
+            directory = None
+            if settings["disk"]:
+                directory = os.path.join(
+                    user_config["conversations_directory"], CACHE_DIRECTORY
+                )
+            _render_cache = RenderCache(
+                settings["memory_entries"],
+                directory,
+                settings["max_size_mb"] * 1024 * 1024,
+            )
+        return _render_cache
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+from threading import Lock
+from time import time
+from logging import getLogger
+from file_lock import file_lock, write_atomically
+from user_config import load_user_config
+
+logger = getLogger(__name__)
+
+CACHE_DIRECTORY = ".response_cache"
+STATS_FILE = "stats.json"
+# Off unless the config turns it on: with a temperature above zero a cached
+# reply replays one sample instead of asking for a new one.
+DEFAULT_CACHE_SETTINGS = {
+    "enabled": False,
+    "max_size_mb": 100,
+    "ttl_seconds": 7 * 24 * 60 * 60,
+}
+
+_response_cache = None
+_response_cache_lock = Lock()
+
+
+class ResponseCache:
+    def __init__(self, directory, max_size_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats_path = os.path.join(directory, STATS_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, payload):
+        path = self._entry_path(payload)
+        try:
+            with open(path, "r") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._record("misses")
+            return None
+
+        if time() - entry["created_at"] > self.ttl_seconds:
+            self._remove(path)
+            self._record("misses")
+            return None
+
+        # The modification time doubles as the last-used time for LRU eviction.
+        os.utime(path)
+        self._record("hits")
+        return entry["response"]
+
+    def set(self, payload, response):
+        entry = {"created_at": time(), "response": response}
+        write_atomically(self._entry_path(payload), json.dumps(entry))
+        self.evict()
+
+    def evict(self):
+        now = time()
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json") or file_name == STATS_FILE:
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def stats(self):
+        stats = self._load_stats()
+        entries = 0
+        size_bytes = 0
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".json") and file_name != STATS_FILE:
+                entries += 1
+                size_bytes += os.path.getsize(os.path.join(self.directory, file_name))
+        return {**stats, "entries": entries, "size_bytes": size_bytes}
+
+    def _entry_path(self, payload):
+        return os.path.join(self.directory, f"{cache_key(payload)}.json")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"hits": 0, "misses": 0}
+
+    def _record(self, outcome):
+        with file_lock(f"{self.stats_path}.lock"):
+            stats = self._load_stats()
+            stats[outcome] += 1
+            write_atomically(self.stats_path, json.dumps(stats))
+
+
+def cache_key(payload):
+    serialized_payload = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized_payload.encode("utf-8")).hexdigest()
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            user_config = load_user_config()
+            settings = {
+                **DEFAULT_CACHE_SETTINGS,
+                **user_config.get("response_cache", {}),
+            }
+            if not settings["enabled"]:
+                return None
+            _response_cache = ResponseCache(
+                os.path.join(user_config["conversations_directory"], CACHE_DIRECTORY),
+                settings["max_size_mb"] * 1024 * 1024,
+                settings["ttl_seconds"],
+            )
+        return _response_cache
@@ -0,0 +1,163 @@
+import sys
+import random
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from time import sleep, monotonic
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+RetryAttempt = namedtuple("RetryAttempt", ["attempt", "error", "delay", "elapsed"])
+
+# 408 request timeout, 409 lock conflict, 429 rate limited, 529 overloaded and
+# every other 5xx are transient on the API side.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts=3,
+        base_delay=1.0,
+        max_delay=30.0,
+        deadline=120.0,
+        idempotent=True,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.idempotent = idempotent
+        self.attempts = []
+        self.started_at = monotonic()
+
+    def start(self):
+        self.attempts = []
+        self.started_at = monotonic()
+
+    def call(self, function, *args, **kwargs):
+        self.start()
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                self.wait(e)
+
+    async def async_call(self, function, *args, **kwargs):
+        self.start()
+        while True:
+            try:
+                return await function(*args, **kwargs)
+            except Exception as e:
+                await self.async_wait(e)
+
+    def wait(self, error):
+        sleep(self.backoff(error))
+
+    async def async_wait(self, error):
+        import asyncio
+
+        await asyncio.sleep(self.backoff(error))
+
+    def backoff(self, error):
+        attempt = len(self.attempts) + 1
+        elapsed = monotonic() - self.started_at
+        description = describe_error(error)
+
+        if not is_retryable(error, self.idempotent):
+            self.attempts.append(RetryAttempt(attempt, error, None, elapsed))
+            logger.error(f"{description}: {str(error)}")
+            raise error
+
+        if attempt >= self.max_attempts:
+            self.attempts.append(RetryAttempt(attempt, error, None, elapsed))
+            logger.error(f"{description}. Max retries reached.")
+            raise error
+
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter keeps concurrent clients from retrying in lockstep.
+            delay = random.uniform(
+                0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            )
+
+        if elapsed + delay > self.deadline:
+            self.attempts.append(RetryAttempt(attempt, error, None, elapsed))
+            logger.error(
+                f"{description}. Retry deadline of {self.deadline:g} seconds reached."
+            )
+            raise error
+
+        self.attempts.append(RetryAttempt(attempt, error, delay, elapsed))
+        wait_message = f"{description}. Retrying in {delay:g} seconds. Attempt {attempt}/{self.max_attempts}"
+        print(wait_message, file=sys.stderr)
+        logger.warning(wait_message)
+        return delay
+
+
+def is_retryable(error, idempotent=True):
+    # Imported here so that loading this module does not load the SDK.
+    import anthropic
+
+    if isinstance(error, anthropic.APIConnectionError):
+        # Without a response the request may still have been carried out, so
+        # only a call that is safe to repeat is sent again.
+        return idempotent
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000, 0)
+        except ValueError:
+            pass
+
+    retry_after_header = headers.get("retry-after")
+    if retry_after_header:
+        try:
+            return max(float(retry_after_header), 0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after_header)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            pass
+
+    return None
+
+
+def describe_error(error):
+    import anthropic
+
+    if isinstance(error, anthropic.BadRequestError):
+        return "Bad request error"
+    if isinstance(error, anthropic.AuthenticationError):
+        return "Authentication error"
+    if isinstance(error, anthropic.PermissionDeniedError):
+        return "Permission denied error"
+    if isinstance(error, anthropic.RateLimitError):
+        return "Rate limit exceeded"
+    if isinstance(error, anthropic.APITimeoutError):
+        return "Request timed out"
+    if isinstance(error, anthropic.APIConnectionError):
+        return "Connection error"
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code == 529:
+            return "API overloaded"
+        if error.status_code >= 500:
+            return f"Server error {error.status_code}"
+        return "Unexpected API error"
+    if isinstance(error, anthropic.APIError):
+        return "Unexpected API error"
+    return "Unexpected error"
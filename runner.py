@@ -0,0 +1,90 @@
+import sys
+import json
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import getLogger
+from anthropic_api import invoke_anthropic_api
+from bulk_requests import (
+    load_requests,
+    completed_request_ids,
+    open_results_file,
+    request_params,
+)
+from user_config import load_user_config
+
+logger = getLogger(__name__)
+
+
+def run_requests(
+    input_path,
+    output_path,
+    concurrency=4,
+    model=None,
+    temperature=None,
+    persona=None,
+    use_cache=True,
+):
+    user_config = load_user_config()
+    # A request that errored, for example on a connection error that
+    # outlasted the retries, is tried again. The output file then holds more
+    # than one record for it, and the last one is its result.
+    completed_ids = completed_request_ids(output_path, statuses={"succeeded"})
+    requests = load_requests(input_path)
+    pending_requests = [
+        request for request in requests if request["id"] not in completed_ids
+    ]
+    if len(pending_requests) < len(requests):
+        print(
+            f"Skipping {len(requests) - len(pending_requests)} requests completed by an earlier run",
+            file=sys.stderr,
+        )
+
+    counts = {"succeeded": 0, "errored": 0}
+    output_lock = Lock()
+
+    def run_request(request):
+        params = request_params(request, user_config, model, temperature, persona)
+        try:
+            response = invoke_anthropic_api(
+                params["messages"],
+                params["model"],
+                params["temperature"],
+                params["system"],
+                use_cache=use_cache,
+            )
+            record = {"id": request["id"], "status": "succeeded", "response": response}
+        except Exception as e:
+            record = {"id": request["id"], "status": "errored", "error": str(e)}
+
+        # Each finished request is flushed right away; the output file is also
+        # the checkpoint that a resumed run reads back.
+        with output_lock:
+            output_file.write(json.dumps(record) + "\n")
+            output_file.flush()
+            counts[record["status"]] += 1
+            print(
+                f"[{sum(counts.values())}/{len(pending_requests)}] {request['id']}: {record['status']}",
+                file=sys.stderr,
+            )
+        return record
+
+    with open_results_file(output_path) as output_file:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        futures = [
+            executor.submit(run_request, request) for request in pending_requests
+        ]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except KeyboardInterrupt:
+            # Requests already in flight are allowed to finish and be recorded;
+            # the rest are picked up by the next run.
+            print(
+                "\nInterrupted. Waiting for in-flight requests; rerun to resume.",
+                file=sys.stderr,
+            )
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    return counts
@@ -0,0 +1,208 @@
+import os
+import sqlite3
+from collections import namedtuple
+from threading import Lock
+from logging import getLogger
+from conversation_log import shared_prefix_length
+
+logger = getLogger(__name__)
+
+INDEX_FILE = ".search_index.db"
+# Control characters cannot appear in a tokenized match, so they delimit the
+# highlighted terms in a snippet without any escaping.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+SNIPPET_TOKENS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    conversation TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    model TEXT,
+    timestamp REAL,
+    UNIQUE (conversation, position)
+);
+CREATE INDEX IF NOT EXISTS documents_timestamp ON documents (timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5 (
+    content, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+SearchResult = namedtuple(
+    "SearchResult",
+    ["conversation", "position", "role", "model", "timestamp", "snippet", "score"],
+)
+
+_search_indexes = {}
+_search_indexes_lock = Lock()
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        # What was last indexed for each conversation here, as document_key()
+        # values, so an update need not read the documents back.
+        self.indexed_keys = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    @property
+    def is_built(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM state WHERE key = 'built'"
+            ).fetchone()
+        return row is not None
+
+    def mark_built(self):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('built', '1')"
+            )
+
+    def update(self, conversation, messages):
+        with self.lock, self.connection:
+            # Like the stored history, only the messages after those already
+            # indexed in the same order are indexed again.
+            indexed_keys = self._indexed_keys(conversation)
+            keys = [document_key(message) for message in messages]
+            start = shared_prefix_length(indexed_keys, keys, key=tuple)
+            stale_ids = self.connection.execute(
+                "SELECT id FROM documents WHERE conversation = ? AND position >= ?",
+                (conversation, start),
+            ).fetchall()
+            self.connection.executemany(
+                "DELETE FROM document_text WHERE rowid = ?", stale_ids
+            )
+            self.connection.executemany("DELETE FROM documents WHERE id = ?", stale_ids)
+
+            for position, message in enumerate(messages[start:], start):
+                cursor = self.connection.execute(
+                    "INSERT INTO documents"
+                    " (conversation, position, role, model, timestamp)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (
+                        conversation,
+                        position,
+                        message["role"],
+                        message.get("model"),
+                        message.get("timestamp"),
+                    ),
+                )
+                self.connection.execute(
+                    "INSERT INTO document_text (rowid, content) VALUES (?, ?)",
+                    (cursor.lastrowid, message_text(message["content"])),
+                )
+            self.indexed_keys[conversation] = keys
+
+    def rename(self, conversation, new_conversation):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE documents SET conversation = ? WHERE conversation = ?",
+                (new_conversation, conversation),
+            )
+            if conversation in self.indexed_keys:
+                self.indexed_keys[new_conversation] = self.indexed_keys.pop(
+                    conversation
+                )
+
+    def search(self, query, role=None, model=None, since=None, until=None, limit=20):
+        conditions = ["document_text MATCH ?"]
+        parameters = [match_expression(query)]
+        if role:
+            conditions.append("documents.role = ?")
+            parameters.append(role)
+        if model:
+            conditions.append("documents.model = ?")
+            parameters.append(model)
+        if since is not None:
+            conditions.append("documents.timestamp >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("documents.timestamp < ?")
+            parameters.append(until)
+        parameters.append(limit)
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT documents.conversation, documents.position, documents.role,"
+                " documents.model, documents.timestamp,"
+                f" snippet(document_text, 0, ?, ?, '…', {SNIPPET_TOKENS}),"
+                " bm25(document_text) AS score"
+                " FROM document_text"
+                " JOIN documents ON documents.id = document_text.rowid"
+                f" WHERE {' AND '.join(conditions)}"
+                " ORDER BY score LIMIT ?",
+                [HIGHLIGHT_START, HIGHLIGHT_END, *parameters],
+            ).fetchall()
+        return [SearchResult(*row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _indexed_keys(self, conversation):
+        (indexed_count,) = self.connection.execute(
+            "SELECT count(*) FROM documents WHERE conversation = ?",
+            (conversation,),
+        ).fetchone()
+        indexed_keys = self.indexed_keys.get(conversation)
+        if indexed_keys is not None and len(indexed_keys) == indexed_count:
+            return indexed_keys
+        # Another process indexed this conversation, or nothing was indexed
+        # here yet.
+        rows = self.connection.execute(
+            "SELECT documents.role, documents.model, documents.timestamp,"
+            " document_text.content FROM documents"
+            " JOIN document_text ON document_text.rowid = documents.id"
+            " WHERE documents.conversation = ? ORDER BY documents.position",
+            (conversation,),
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+
+def document_key(message):
+    return (
+        message["role"],
+        message.get("model"),
+        message.get("timestamp"),
+        message_text(message["content"]),
+    )
+
+
+def message_text(content):
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content)
+    return content
+
+
+def match_expression(query):
+    # Every term is quoted so that punctuation in a query is searched for
+    # rather than parsed as FTS5 syntax; the terms must all match.
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def get_search_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    with _search_indexes_lock:
+        search_index = _search_indexes.get(path)
+        if search_index is None:
+            os.makedirs(directory, exist_ok=True)
+            try:
+                search_index = SearchIndex(path)
+            except sqlite3.OperationalError as error:
+                # Some SQLite builds are compiled without FTS5.
+                logger.warning(f"Search index unavailable: {error}")
+                return None
+            _search_indexes[path] = search_index
+        return search_index
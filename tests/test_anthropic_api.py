@@ -1,7 +1,15 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import anthropic
-from anthropic_api import invoke_anthropic_api
+from anthropic_api import (
+    invoke_anthropic_api,
+    stream_anthropic_api,
+    async_invoke_anthropic_api,
+    async_stream_anthropic_api,
+    build_request,
+    with_prompt_caching,
+    get_usage_stats,
+)
 
 
 class TestInvokeAnthropicAPI(unittest.TestCase):
@@ -165,5 +173,257 @@ def test_rate_limit_error_max_retries_exceeded(self, mock_client):
     )
 
 
+class TestStreamAnthropicAPI(unittest.TestCase):
+    def setUp(self):
+        self.conversation_history = [
+            {"role": "user", "content": "What is the capital of France?"},
+        ]
+        cache_patcher = patch("anthropic_api.get_response_cache", return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    @patch("anthropic_api.get_client")
+    def test_stream_yields_text_deltas(self, mock_get_client):
+        mock_stream = MagicMock()
+        mock_stream.text_stream = iter(["The capital ", "of France ", "is Paris."])
+        mock_get_client.return_value.messages.stream.return_value.__enter__.return_value = (
+            mock_stream
+        )
+
+        chunks = list(
+            stream_anthropic_api(
+                self.conversation_history, "claude-v1", 0.7, "You are helpful."
+            )
+        )
+
+        self.assertEqual(chunks, ["The capital ", "of France ", "is Paris."])
+        mock_get_client.return_value.messages.stream.assert_called_once()
+
+    @patch("retry_policy.sleep")
+    @patch("anthropic_api.get_client")
+    def test_stream_retries_before_first_delta(self, mock_get_client, mock_sleep):
+        mock_response = MagicMock()
+        mock_response.status_code = 429
+        mock_response.headers = {"retry-after": "1"}
+        mock_stream = MagicMock()
+        mock_stream.text_stream = iter(["Paris."])
+        mock_get_client.return_value.messages.stream.return_value.__enter__.side_effect = [
+            anthropic.RateLimitError(
+                message="Rate limit exceeded",
+                response=mock_response,
+                body="Rate limit exceeded",
+            ),
+            mock_stream,
+        ]
+
+        with self.assertLogs(level="WARNING"):
+            chunks = list(
+                stream_anthropic_api(
+                    self.conversation_history, "claude-v1", 0.7, "You are helpful."
+                )
+            )
+
+        self.assertEqual(chunks, ["Paris."])
+        mock_sleep.assert_called_once_with(1.0)
+
+    @patch("anthropic_api.get_client")
+    def test_stream_interrupted_after_delta_is_not_retried(self, mock_get_client):
+        def interrupted_stream():
+            yield "Paris"
+            raise anthropic.APIConnectionError(request=MagicMock())
+
+        mock_stream = MagicMock()
+        mock_stream.text_stream = interrupted_stream()
+        mock_get_client.return_value.messages.stream.return_value.__enter__.return_value = (
+            mock_stream
+        )
+
+        chunks = []
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(anthropic.APIConnectionError):
+                for chunk in stream_anthropic_api(
+                    self.conversation_history, "claude-v1", 0.7, "You are helpful."
+                ):
+                    chunks.append(chunk)
+
+        self.assertEqual(chunks, ["Paris"])
+        mock_get_client.return_value.messages.stream.assert_called_once()
+
+
+class TestAnthropicAPIResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.conversation_history = [
+            {"role": "user", "content": "What is the capital of France?"},
+        ]
+
+    @patch("anthropic_api.get_client")
+    @patch("anthropic_api.get_response_cache")
+    def test_cache_hit_skips_the_api(self, mock_get_response_cache, mock_get_client):
+        mock_get_response_cache.return_value.get.return_value = "Paris."
+
+        with self.assertLogs(level="INFO"):
+            result = invoke_anthropic_api(
+                self.conversation_history, "claude-v1", 0.0, "You are helpful."
+            )
+
+        self.assertEqual(result, "Paris.")
+        mock_get_client.return_value.messages.create.assert_not_called()
+
+    @patch("anthropic_api.get_client")
+    @patch("anthropic_api.get_response_cache")
+    def test_cache_miss_stores_the_response(
+        self, mock_get_response_cache, mock_get_client
+    ):
+        mock_get_response_cache.return_value.get.return_value = None
+        mock_response = MagicMock()
+        mock_response.content = [MagicMock(text="Paris.")]
+        mock_get_client.return_value.messages.create.return_value = mock_response
+
+        invoke_anthropic_api(
+            self.conversation_history, "claude-v1", 0.0, "You are helpful."
+        )
+
+        mock_get_response_cache.return_value.set.assert_called_once_with(
+            build_request(
+                self.conversation_history, "claude-v1", 0.0, "You are helpful."
+            ),
+            "Paris.",
+        )
+
+    @patch("anthropic_api.get_client")
+    @patch("anthropic_api.get_response_cache")
+    def test_use_cache_false_bypasses_the_cache(
+        self, mock_get_response_cache, mock_get_client
+    ):
+        mock_response = MagicMock()
+        mock_response.content = [MagicMock(text="Paris.")]
+        mock_get_client.return_value.messages.create.return_value = mock_response
+
+        invoke_anthropic_api(
+            self.conversation_history,
+            "claude-v1",
+            0.0,
+            "You are helpful.",
+            use_cache=False,
+        )
+
+        mock_get_response_cache.assert_not_called()
+
+
+class TestPromptCaching(unittest.TestCase):
+    def test_breakpoints_on_system_prompt_and_newest_message(self):
+        conversation_history = [
+            {"role": "user", "content": "What is the capital of France?"},
+            {"role": "assistant", "content": "Paris."},
+            {"role": "user", "content": "And of Spain?"},
+        ]
+        request = build_request(
+            conversation_history, "claude-v1", 0.7, "You are helpful."
+        )
+
+        cached_request = with_prompt_caching(request)
+
+        self.assertEqual(
+            cached_request["system"],
+            [
+                {
+                    "type": "text",
+                    "text": "You are helpful.",
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        )
+        self.assertEqual(cached_request["messages"][:2], conversation_history[:2])
+        self.assertEqual(
+            cached_request["messages"][2]["content"],
+            [
+                {
+                    "type": "text",
+                    "text": "And of Spain?",
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        )
+        # The stored history is left untouched.
+        self.assertEqual(request["messages"], conversation_history)
+        self.assertEqual(conversation_history[2]["content"], "And of Spain?")
+
+    @patch("anthropic_api.get_response_cache", return_value=None)
+    @patch("anthropic_api.get_client")
+    def test_cache_usage_is_reported(self, mock_get_client, mock_get_response_cache):
+        mock_response = MagicMock()
+        mock_response.content = [MagicMock(text="Paris.")]
+        mock_response.usage = MagicMock(
+            input_tokens=10,
+            output_tokens=5,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=2048,
+        )
+        mock_get_client.return_value.messages.create.return_value = mock_response
+        usage_before = get_usage_stats()
+
+        with self.assertLogs(level="INFO") as log_records:
+            invoke_anthropic_api(
+                [{"role": "user", "content": "Hello"}], "claude-v1", 0.7, "System"
+            )
+
+        usage_after = get_usage_stats()
+        self.assertEqual(
+            usage_after["cache_read_input_tokens"]
+            - usage_before["cache_read_input_tokens"],
+            2048,
+        )
+        self.assertIn(
+            "Prompt cache read 2048 tokens, wrote 0 tokens", log_records.output[0]
+        )
+
+
+class TestAsyncAnthropicAPI(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.conversation_history = [
+            {"role": "user", "content": "What is the capital of France?"},
+        ]
+        cache_patcher = patch("anthropic_api.get_response_cache", return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    @patch("anthropic_api.get_async_client")
+    async def test_async_invoke(self, mock_get_async_client):
+        mock_response = MagicMock()
+        mock_response.content = [MagicMock(text="Paris.")]
+        mock_get_async_client.return_value.messages.create = AsyncMock(
+            return_value=mock_response
+        )
+
+        result = await async_invoke_anthropic_api(
+            self.conversation_history, "claude-v1", 0.7, "You are helpful."
+        )
+
+        self.assertEqual(result, "Paris.")
+
+    @patch("anthropic_api.get_async_client")
+    async def test_async_stream_yields_text_deltas(self, mock_get_async_client):
+        async def text_stream():
+            for text in ["Par", "is."]:
+                yield text
+
+        mock_stream = MagicMock()
+        mock_stream.text_stream = text_stream()
+        mock_stream.get_final_message = AsyncMock()
+        stream_manager = MagicMock()
+        stream_manager.__aenter__ = AsyncMock(return_value=mock_stream)
+        stream_manager.__aexit__ = AsyncMock(return_value=False)
+        mock_get_async_client.return_value.messages.stream.return_value = stream_manager
+
+        chunks = [
+            chunk
+            async for chunk in async_stream_anthropic_api(
+                self.conversation_history, "claude-v1", 0.7, "You are helpful."
+            )
+        ]
+
+        self.assertEqual(chunks, ["Par", "is."])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,195 @@
+import os
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+import anthropic
+
+from batch import run_batch
+from bulk_requests import load_requests
+
+
+class FakeBatches:
+    def __init__(self, polls_until_ended=1):
+        self.polls_until_ended = polls_until_ended
+        self.batches = {}
+        self.created = []
+
+    def create(self, requests):
+        batch_id = f"msgbatch_{len(self.batches) + 1}"
+        self.batches[batch_id] = {"requests": requests, "polls": 0}
+        self.created.append(batch_id)
+        return SimpleNamespace(id=batch_id, processing_status="in_progress")
+
+    def retrieve(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        ended = batch["polls"] > self.polls_until_ended
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(
+                processing=0 if ended else len(batch["requests"]),
+                succeeded=len(batch["requests"]) if ended else 0,
+                errored=0,
+            ),
+        )
+
+    def results(self, batch_id):
+        for request in self.batches[batch_id]["requests"]:
+            message = request["params"]["messages"][0]["content"][0]["text"]
+            if message == "fail":
+                result = SimpleNamespace(type="errored", error="invalid_request")
+            else:
+                result = SimpleNamespace(
+                    type="succeeded",
+                    message=SimpleNamespace(
+                        content=[SimpleNamespace(type="text", text=f"echo: {message}")]
+                    ),
+                )
+            yield SimpleNamespace(custom_id=request["custom_id"], result=result)
+
+
+class FakeClient:
+    def __init__(self, batches):
+        self.messages = SimpleNamespace(batches=batches)
+
+
+@patch("batch.sleep")
+@patch(
+    "batch.load_user_config",
+    return_value={"model": "claude-v1", "temperature": 0.7, "persona": "default"},
+)
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, "requests.jsonl")
+        self.output_path = os.path.join(self.directory.name, "results.jsonl")
+        with open(self.input_path, "w") as file:
+            file.write(json.dumps({"id": "first", "message": "hello"}) + "\n")
+            file.write(
+                json.dumps({"message": "fail", "persona": "formal", "temperature": 0})
+                + "\n"
+            )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_output(self):
+        with open(self.output_path, "r") as file:
+            return [json.loads(line) for line in file]
+
+    def test_submits_polls_and_writes_results(self, mock_load_user_config, mock_sleep):
+        batches = FakeBatches(polls_until_ended=2)
+
+        with patch("sys.stderr"):
+            counts = run_batch(
+                self.input_path, self.output_path, client=FakeClient(batches)
+            )
+
+        self.assertEqual(counts["succeeded"], 1)
+        self.assertEqual(counts["errored"], 1)
+        self.assertEqual(
+            self.read_output(),
+            [
+                {"id": "first", "status": "succeeded", "response": "echo: hello"},
+                {"id": "request-2", "status": "errored", "error": "invalid_request"},
+            ],
+        )
+        params = batches.batches["msgbatch_1"]["requests"][1]["params"]
+        self.assertEqual(params["temperature"], 0)
+        self.assertIn("formal", params["system"][0]["text"])
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [10, 20])
+        self.assertFalse(os.path.exists(self.output_path + ".batch.json"))
+
+    def test_resumes_without_resubmitting(self, mock_load_user_config, mock_sleep):
+        batches = FakeBatches()
+        batches.create(
+            [
+                {
+                    "custom_id": "first",
+                    "params": {"messages": [{"content": [{"text": "hello"}]}]},
+                },
+                {
+                    "custom_id": "request-2",
+                    "params": {"messages": [{"content": [{"text": "fail"}]}]},
+                },
+            ]
+        )
+        with open(self.output_path + ".batch.json", "w") as file:
+            json.dump({"batch_ids": ["msgbatch_1"], "submitted": 2}, file)
+        with open(self.output_path, "w") as file:
+            file.write(json.dumps({"id": "first", "status": "succeeded"}) + "\n")
+
+        with patch("sys.stderr"):
+            counts = run_batch(
+                self.input_path, self.output_path, client=FakeClient(batches)
+            )
+
+        self.assertEqual(batches.created, ["msgbatch_1"])
+        self.assertEqual(counts["succeeded"], 0)
+        self.assertEqual(
+            [record["id"] for record in self.read_output()], ["first", "request-2"]
+        )
+
+    @patch("batch.MAX_BATCH_REQUESTS", 1)
+    def test_resume_submits_the_remaining_requests(
+        self, mock_load_user_config, mock_sleep
+    ):
+        batches = FakeBatches()
+        create = batches.create
+
+        def interrupted_create(requests):
+            if batches.created:
+                raise KeyboardInterrupt
+            return create(requests)
+
+        with patch("sys.stderr"), patch.object(
+            batches, "create", side_effect=interrupted_create
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                run_batch(self.input_path, self.output_path, client=FakeClient(batches))
+
+        with patch("sys.stderr"):
+            counts = run_batch(
+                self.input_path, self.output_path, client=FakeClient(batches)
+            )
+
+        self.assertEqual(batches.created, ["msgbatch_1", "msgbatch_2"])
+        self.assertEqual(counts["succeeded"] + counts["errored"], 2)
+        self.assertEqual(
+            [record["id"] for record in self.read_output()], ["first", "request-2"]
+        )
+
+    def test_lost_create_response_is_not_resubmitted(
+        self, mock_load_user_config, mock_sleep
+    ):
+        batches = FakeBatches()
+        create = batches.create
+
+        def create_and_lose_response(requests):
+            create(requests)
+            raise anthropic.APIConnectionError(request=MagicMock())
+
+        with patch("sys.stderr"), patch.object(
+            batches, "create", side_effect=create_and_lose_response
+        ), self.assertLogs("retry_policy", level="ERROR"):
+            with self.assertRaises(anthropic.APIConnectionError):
+                run_batch(self.input_path, self.output_path, client=FakeClient(batches))
+
+        self.assertEqual(batches.created, ["msgbatch_1"])
+
+
+class TestLoadRequests(unittest.TestCase):
+    def test_rejects_unknown_persona(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file:
+            file.write(json.dumps({"message": "hi", "persona": "pirate"}) + "\n")
+            file.flush()
+            with self.assertRaises(ValueError):
+                load_requests(file.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
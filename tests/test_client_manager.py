@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import client_manager
+from client_manager import get_client, reset_client, get_connection_stats
+
+
+class TestClientManager(unittest.TestCase):
+    def setUp(self):
+        client_manager._client = None
+        client_manager._connection_stats.update({"opened": 0, "reused": 0})
+
+    def tearDown(self):
+        client_manager._client = None
+
+    @patch("client_manager.load_user_config")
+    def test_get_client_is_shared(self, mock_load_user_config):
+        mock_load_user_config.return_value = {}
+
+        self.assertIs(get_client(), get_client())
+        mock_load_user_config.assert_called_once()
+
+    @patch("anthropic.DefaultHttpxClient")
+    @patch("anthropic.Client")
+    @patch("client_manager.load_user_config")
+    def test_pool_and_timeout_come_from_user_config(
+        self, mock_load_user_config, mock_client, mock_http_client
+    ):
+        mock_load_user_config.return_value = {
+            "connection_pool": {"max_connections": 2},
+            "timeout": {"read": 30.0},
+        }
+
+        get_client()
+
+        limits = mock_http_client.call_args.kwargs["limits"]
+        self.assertEqual(limits.max_connections, 2)
+        self.assertEqual(limits.max_keepalive_connections, 5)
+        timeout = mock_client.call_args.kwargs["timeout"]
+        self.assertEqual(timeout.read, 30.0)
+        self.assertEqual(timeout.connect, 5.0)
+
+    @patch("client_manager.load_user_config")
+    def test_reset_client_closes_the_shared_client(self, mock_load_user_config):
+        mock_load_user_config.return_value = {}
+        client = MagicMock()
+        client_manager._client = client
+
+        reset_client()
+
+        client.close.assert_called_once()
+        self.assertIsNot(get_client(), client)
+
+    def test_connection_stats_count_opened_and_reused(self):
+        for connects in [True, False, False]:
+            request = MagicMock(extensions={})
+            client_manager._trace_request(request)
+            if connects:
+                request.extensions["trace"]("connection.connect_tcp.complete", {})
+            client_manager._count_connection(MagicMock(request=request))
+
+        self.assertEqual(get_connection_stats(), {"opened": 1, "reused": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
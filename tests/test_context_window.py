@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+
+from context_window import (
+    count_message_tokens,
+    fit_context_window,
+    latest_summary,
+    new_message,
+    remove_last_turn,
+)
+
+
+def make_history(turns, characters_per_message=400):
+    conversation_history = []
+    for turn in range(turns):
+        conversation_history.append(
+            new_message("user", f"question {turn} " + "q" * characters_per_message)
+        )
+        conversation_history.append(
+            new_message("assistant", f"answer {turn} " + "a" * characters_per_message)
+        )
+    return conversation_history
+
+
+class TestContextWindow(unittest.TestCase):
+    def test_token_count_is_stored_on_the_message(self):
+        message = {"role": "user", "content": "x" * 400}
+
+        self.assertEqual(count_message_tokens(message), 104)
+        message["content"] = ""
+        self.assertEqual(count_message_tokens(message), 104)
+
+    @patch("context_window.invoke_anthropic_api")
+    def test_history_within_budget_is_sent_unchanged(self, mock_invoke_anthropic_api):
+        conversation_history = make_history(2)
+        conversation_history.append(new_message("user", "next question"))
+
+        api_history, system_message = fit_context_window(
+            conversation_history, "System", budget_tokens=10000
+        )
+
+        mock_invoke_anthropic_api.assert_not_called()
+        self.assertEqual(len(api_history), 5)
+        self.assertNotIn("tokens", api_history[0])
+        self.assertEqual(system_message, "System")
+
+    @patch("context_window.invoke_anthropic_api")
+    def test_older_turns_are_summarized(self, mock_invoke_anthropic_api):
+        mock_invoke_anthropic_api.return_value = "<summary>Earlier turns</summary>"
+        conversation_history = make_history(10)
+        conversation_history.append(new_message("user", "next question"))
+
+        with self.assertLogs(level="INFO"):
+            api_history, system_message = fit_context_window(
+                conversation_history, "System", budget_tokens=1000
+            )
+
+        summary = latest_summary(conversation_history)
+        self.assertEqual(summary["text"], "Earlier turns")
+        self.assertIs(conversation_history[-1]["summary"], summary)
+        self.assertEqual(len(conversation_history), 21)
+        self.assertEqual(api_history[0]["role"], "user")
+        self.assertEqual(len(api_history), 21 - summary["covers"])
+        self.assertLessEqual(
+            sum(
+                count_message_tokens(m)
+                for m in conversation_history[summary["covers"] :]
+            ),
+            500,
+        )
+        self.assertIn("<conversation_summary>\nEarlier turns\n", system_message)
+
+    @patch("context_window.invoke_anthropic_api")
+    def test_existing_summary_is_reused(self, mock_invoke_anthropic_api):
+        conversation_history = make_history(10)
+        conversation_history[8]["summary"] = {
+            "text": "Earlier turns",
+            "covers": 8,
+            "tokens": 5,
+        }
+        conversation_history.append(new_message("user", "next question"))
+
+        api_history, system_message = fit_context_window(
+            conversation_history, "System", budget_tokens=10000
+        )
+
+        mock_invoke_anthropic_api.assert_not_called()
+        self.assertEqual(api_history[0]["content"], conversation_history[8]["content"])
+        self.assertIn("Earlier turns", system_message)
+
+    @patch("context_window.invoke_anthropic_api")
+    def test_undo_after_compaction_keeps_the_summary(self, mock_invoke_anthropic_api):
+        mock_invoke_anthropic_api.return_value = "<summary>Earlier turns</summary>"
+        conversation_history = make_history(10)
+        conversation_history.append(new_message("user", "next question"))
+        with self.assertLogs(level="INFO"):
+            fit_context_window(conversation_history, "System", budget_tokens=1000)
+        summary = latest_summary(conversation_history)
+        summary_calls = mock_invoke_anthropic_api.call_count
+        conversation_history.append(new_message("assistant", "next answer"))
+
+        conversation_history = remove_last_turn(conversation_history)
+        conversation_history.append(new_message("user", "another question"))
+        api_history, system_message = fit_context_window(
+            conversation_history, "System", budget_tokens=1000
+        )
+
+        self.assertEqual(mock_invoke_anthropic_api.call_count, summary_calls)
+        self.assertEqual(len(conversation_history), 21)
+        self.assertIs(conversation_history[-2]["summary"], summary)
+        self.assertEqual(len(api_history), 21 - summary["covers"])
+        self.assertIn("Earlier turns", system_message)
+
+
+if __name__ == "__main__":
+    unittest.main()
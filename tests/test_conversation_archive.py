@@ -0,0 +1,127 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from conversation_archive import ConversationArchive
+from conversation_history import (
+    import_conversation,
+    load_conversation,
+    load_conversation_history,
+)
+from conversation_manager import get_conversation_names
+
+
+def write_log(directory, title, count, age_days=0):
+    path = os.path.join(directory, f"{title}.jsonl")
+    with open(path, "w") as file:
+        for i in range(count):
+            file.write(json.dumps({"role": "user", "content": f"{title} {i}"}) + "\n")
+    timestamp = os.path.getmtime(path) - age_days * 24 * 60 * 60
+    os.utime(path, (timestamp, timestamp))
+    return [{"role": "user", "content": f"{title} {i}"} for i in range(count)]
+
+
+class TestConversationArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = ConversationArchive(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_archive_and_read(self):
+        first = write_log(self.directory.name, "first", 3)
+        second = write_log(self.directory.name, "second", 2)
+
+        self.assertTrue(self.archive.archive("first"))
+        self.assertTrue(self.archive.archive("second"))
+        self.assertFalse(self.archive.archive("missing"))
+
+        for file_name in ["first.jsonl", "first.jsonl.lock"]:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.directory.name, file_name))
+            )
+        self.assertEqual(self.archive.titles(), ["first", "second"])
+        self.assertEqual(self.archive.read("first"), first)
+        self.assertEqual(self.archive.read("second"), second)
+        self.assertIsNone(self.archive.read("missing"))
+
+    def test_restore_removes_unreferenced_segments(self):
+        messages = write_log(self.directory.name, "first", 3)
+        self.archive.archive("first")
+
+        self.assertEqual(self.archive.restore("first"), messages)
+        self.assertFalse(self.archive.has_conversation("first"))
+        with open(os.path.join(self.directory.name, "first.jsonl")) as file:
+            self.assertEqual([json.loads(line) for line in file], messages)
+        self.assertEqual(
+            sorted(os.listdir(self.archive.directory)), ["archive.lock", "index.json"]
+        )
+
+    @patch("conversation_archive.SEGMENT_MAX_BYTES", 1)
+    def test_full_segments_are_not_appended_to(self):
+        write_log(self.directory.name, "first", 3)
+        write_log(self.directory.name, "second", 2)
+        self.archive.archive("first")
+        self.archive.archive("second")
+
+        segments = {entry["segment"] for entry in self.archive._load_index().values()}
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(self.archive.read("second")[0]["content"], "second 0")
+
+    def test_archive_stale_skips_recent_and_excluded_logs(self):
+        write_log(self.directory.name, "old", 1, age_days=40)
+        write_log(self.directory.name, "current", 1, age_days=40)
+        write_log(self.directory.name, "recent", 1)
+
+        self.assertEqual(self.archive.archive_stale(30, exclude=["current"]), 1)
+        self.assertEqual(self.archive.titles(), ["old"])
+
+        # The directory is only scanned once per check interval.
+        write_log(self.directory.name, "later", 1, age_days=40)
+        self.assertEqual(self.archive.archive_stale(30), 0)
+
+
+class TestArchivedConversationHistory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patches = [
+            patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name),
+            patch(
+                "conversation_history.CURRENT_CONVERSATION_FILE",
+                os.path.join(self.directory.name, "current_conversation.txt"),
+            ),
+            patch(
+                "conversation_manager.load_user_config",
+                return_value={"conversations_directory": self.directory.name},
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.messages = write_log(self.directory.name, "archived", 2)
+        ConversationArchive(self.directory.name).archive("archived")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_archived_conversations_are_listed_and_read_in_place(self):
+        self.assertEqual(get_conversation_names(), ["archived"])
+        self.assertEqual(load_conversation("archived.jsonl"), self.messages)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory.name, "archived.jsonl"))
+        )
+
+    def test_import_restores_archived_conversation(self):
+        self.assertEqual(import_conversation("archived"), "archived")
+        self.assertEqual(load_conversation_history(), self.messages)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory.name, "archived.jsonl"))
+        )
+        self.assertEqual(get_conversation_names(), ["archived"])
+
+
+if __name__ == "__main__":
+    unittest.main()
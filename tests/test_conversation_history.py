@@ -1,6 +1,9 @@
+import os
+import sys
+import json
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
-import json
 from conversation_history import (
     save_conversation_history,
     load_conversation_history,
@@ -8,56 +11,79 @@ from conversation_history import (
     set_current_conversation_file,
     display_conversation_history,
     import_conversation,
+    rename_conversation,
+    history_range,
 )
+from conversation_names import read_conversation_names, write_conversation_names
 
 
 class TestConversationHistory(unittest.TestCase):
-    @patch(
-        "conversation_history.CURRENT_CONVERSATION_FILE",
-        "test_conversations/current_conversation.txt",
-    )
-    @patch("builtins.open", new_callable=mock_open)
-    def test_save_conversation_history(self, mock_file):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.current_file = os.path.join(
+            self.directory.name, "current_conversation.txt"
+        )
+        patches = [
+            patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name),
+            patch("conversation_history.CURRENT_CONVERSATION_FILE", self.current_file),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_conversation_history(self):
+        with open(self.current_file, "w") as file:
+            file.write("test_conversation.jsonl")
         conversation_history = [
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hi there!"},
         ]
-        json_string = json.dumps(conversation_history)
         save_conversation_history(conversation_history)
-        mock_file.assert_called_once_with(
-            "test_conversations/current_conversation.txt", "w"
-        )
-        mock_file().write.assert_called_once_with(json_string)
 
-    @patch(
-        "conversation_history.CURRENT_CONVERSATION_FILE",
-        "test_conversations/current_conversation.txt",
-    )
-    @patch(
-        "builtins.open",
-        new_callable=mock_open,
-        read_data='[{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi there!"}]',
-    )
-    def test_load_conversation_history(self, mock_file):
+        with open(os.path.join(self.directory.name, "test_conversation.jsonl")) as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(records, conversation_history)
+        with open(self.current_file) as file:
+            self.assertEqual(file.read(), "test_conversation.jsonl")
+
+    def test_load_conversation_history(self):
+        with open(self.current_file, "w") as file:
+            file.write("test_conversation.jsonl")
+        with open(
+            os.path.join(self.directory.name, "test_conversation.jsonl"), "w"
+        ) as file:
+            file.write('{"role": "user", "content": "Hello"}\n')
+            file.write('{"role": "assistant", "content": "Hi there!"}\n')
+
         conversation_history = load_conversation_history()
         expected_history = [
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hi there!"},
         ]
         self.assertEqual(conversation_history, expected_history)
-        mock_file.assert_called_once_with(
-            "test_conversations/current_conversation.txt", "r"
-        )
 
-    @patch(
-        "conversation_history.CURRENT_CONVERSATION_FILE",
-        "test_conversations/current_conversation.txt",
-    )
-    @patch("builtins.open", new_callable=mock_open)
-    def test_load_conversation_history_file_not_found(self, mock_file):
-        mock_file.side_effect = FileNotFoundError
+    def test_load_conversation_history_migrates_legacy_pointer(self):
+        with open(self.current_file, "w") as file:
+            file.write("test_conversation.json")
+        with open(
+            os.path.join(self.directory.name, "test_conversation.json"), "w"
+        ) as file:
+            json.dump([{"role": "user", "content": "Hello"}], file)
+
         conversation_history = load_conversation_history()
-        self.assertEqual(conversation_history, [])
+        self.assertEqual(conversation_history, [{"role": "user", "content": "Hello"}])
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory.name, "test_conversation.jsonl"))
+        )
+
+    def test_load_conversation_history_file_not_found(self):
+        self.assertEqual(load_conversation_history(), [])
+        with open(self.current_file, "w") as file:
+            file.write("missing_conversation.jsonl")
+        self.assertEqual(load_conversation_history(), [])
 
     @patch(
         "conversation_history.CURRENT_CONVERSATION_FILE",
@@ -71,28 +97,74 @@ class TestConversationHistory(unittest.TestCase):
             "test_conversations/current_conversation.txt", "r"
         )
 
-    @patch(
-        "conversation_history.CURRENT_CONVERSATION_FILE",
-        "test_conversations/current_conversation.txt",
-    )
-    @patch("builtins.open", new_callable=mock_open)
-    def test_set_current_conversation_file(self, mock_file):
+    @patch("conversation_history.write_atomically")
+    def test_set_current_conversation_file(self, mock_write_atomically):
         set_current_conversation_file("new_conversation.json")
-        mock_file.assert_called_once_with(
-            "test_conversations/current_conversation.txt", "w"
+        mock_write_atomically.assert_called_once_with(
+            self.current_file, "new_conversation.json"
         )
-        mock_file().write.assert_called_once_with("new_conversation.json")
 
-    @patch("conversation_history.load_conversation_history")
-    @patch("conversation_history.format_assistant_message")
-    @patch("conversation_history.format_user_message")
+    def test_rename_conversation(self):
+        with open(os.path.join(self.directory.name, "greeting.jsonl"), "w") as file:
+            file.write('{"role": "user", "content": "Hi"}\n')
+        set_current_conversation_file("untitled.jsonl")
+        save_conversation_history([{"role": "user", "content": "Hello"}])
+        write_conversation_names(self.directory.name, ["greeting", "untitled"])
+
+        conversation_file = rename_conversation("untitled.jsonl", "greeting")
+
+        # "greeting" is taken, so the conversation gets a numbered name.
+        self.assertEqual(conversation_file, "greeting_2.jsonl")
+        self.assertEqual(get_current_conversation_file(), "greeting_2.jsonl")
+        self.assertEqual(
+            load_conversation_history(), [{"role": "user", "content": "Hello"}]
+        )
+        for file_name in ["untitled.jsonl", "untitled.jsonl.lock"]:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.directory.name, file_name))
+            )
+        self.assertEqual(
+            read_conversation_names(self.directory.name), ["greeting", "greeting_2"]
+        )
+
+    def test_history_range(self):
+        self.assertEqual(history_range(10), (0, 10))
+        self.assertEqual(history_range(10, last=3), (7, 10))
+        self.assertEqual(history_range(2, last=3), (0, 2))
+        self.assertEqual(history_range(10, offset=4, limit=3), (4, 7))
+        self.assertEqual(history_range(10, offset=8, limit=3), (8, 10))
+        self.assertEqual(history_range(10, offset=20, limit=3), (10, 10))
+
+    @patch("builtins.print")
+    @patch("conversation_history.HISTORY_BATCH_SIZE", 2)
+    def test_display_conversation_history_last(self, mock_print):
+        with open(self.current_file, "w") as file:
+            file.write("test_conversation.jsonl")
+        conversation_history = [
+            {"role": "user", "content": f"message {i}"} for i in range(5)
+        ]
+        save_conversation_history(conversation_history)
+
+        display_conversation_history(raw=True, last=3)
+        self.assertEqual(
+            [call.args[0] for call in mock_print.call_args_list],
+            ["user: message 2", "user: message 3", "user: message 4"],
+        )
+
+    @patch("conversation_history.count_conversation_messages", return_value=2)
+    @patch("conversation_history.load_conversation_messages")
+    @patch("formatting.format_assistant_message")
+    @patch("formatting.format_user_message")
+    @patch("output.sys.stdout.isatty", return_value=True)
     def test_display_conversation_history(
         self,
+        mock_isatty,
         mock_format_user_message,
         mock_format_assistant_message,
-        mock_load_conversation_history,
+        mock_load_conversation_messages,
+        mock_count_conversation_messages,
     ):
-        mock_load_conversation_history.return_value = [
+        mock_load_conversation_messages.return_value = [
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hi there!"},
         ]
@@ -100,18 +172,46 @@ class TestConversationHistory(unittest.TestCase):
         mock_format_user_message.assert_called_once_with("Hello")
         mock_format_assistant_message.assert_called_once_with("Hi there!")
 
-    @patch("conversation_history.load_conversation_history")
+    @patch("conversation_history.count_conversation_messages", return_value=2)
+    @patch("conversation_history.load_conversation_messages")
+    @patch("formatting.format_assistant_message")
+    @patch("builtins.print")
+    @patch("output.sys.stdout.isatty", return_value=False)
+    def test_display_conversation_history_piped(
+        self,
+        mock_isatty,
+        mock_print,
+        mock_format_assistant_message,
+        mock_load_conversation_messages,
+        mock_count_conversation_messages,
+    ):
+        mock_load_conversation_messages.return_value = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi there!"},
+        ]
+        display_conversation_history()
+        mock_format_assistant_message.assert_not_called()
+        self.assertEqual(
+            [call.args[0] for call in mock_print.call_args_list],
+            ["Hello", "Hi there!"],
+        )
+
+    @patch("conversation_history.count_conversation_messages", return_value=2)
+    @patch("conversation_history.load_conversation_messages")
     @patch("builtins.print")
     def test_display_conversation_history_raw(
-        self, mock_print, mock_load_conversation_history
+        self,
+        mock_print,
+        mock_load_conversation_messages,
+        mock_count_conversation_messages,
     ):
-        mock_load_conversation_history.return_value = [
+        mock_load_conversation_messages.return_value = [
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hi there!"},
         ]
         display_conversation_history(raw=True)
-        mock_print.assert_any_call("user: Hello")
-        mock_print.assert_any_call("assistant: Hi there!")
+        mock_print.assert_any_call("user: Hello", file=sys.stdout)
+        mock_print.assert_any_call("assistant: Hi there!", file=sys.stdout)
 
     @patch("conversation_history.set_current_conversation_file")
     @patch("os.path.exists")
@@ -120,7 +220,7 @@ class TestConversationHistory(unittest.TestCase):
         conversation_name = import_conversation("test_conversation")
         self.assertEqual(conversation_name, "test_conversation")
         mock_set_current_conversation_file.assert_called_once_with(
-            "test_conversation.json"
+            "test_conversation.jsonl"
         )
 
     @patch("os.path.exists")
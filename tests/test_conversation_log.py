@@ -0,0 +1,196 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import conversation_log
+from conversation_log import (
+    load_log,
+    save_log,
+    compact_log,
+    read_log_range,
+    count_log_messages,
+)
+
+
+class TestConversationLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "conversation.jsonl")
+        conversation_log._log_state.clear()
+
+    def tearDown(self):
+        conversation_log._log_state.clear()
+        self.directory.cleanup()
+
+    def read_records(self):
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def messages(self, count):
+        return [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+            for i in range(count)
+        ]
+
+    def test_save_appends_new_messages(self):
+        messages = self.messages(2)
+        save_log(self.path, messages)
+        with patch("conversation_log.write_atomically") as mock_write_atomically:
+            save_log(self.path, self.messages(4))
+        mock_write_atomically.assert_not_called()
+
+        self.assertEqual(self.read_records(), self.messages(4))
+        self.assertEqual(load_log(self.path), self.messages(4))
+
+    def test_save_appends_truncation_marker(self):
+        save_log(self.path, self.messages(4))
+        save_log(self.path, self.messages(2))
+
+        self.assertEqual(self.read_records()[-1], {"truncate": 2})
+        self.assertEqual(load_log(self.path), self.messages(2))
+
+        save_log(self.path, self.messages(3))
+        self.assertEqual(load_log(self.path), self.messages(3))
+
+    def test_save_replaces_turns_undone_since_the_last_save(self):
+        save_log(self.path, self.messages(4))
+        replaced = self.messages(2) + [
+            {"role": "user", "content": "other question"},
+            {"role": "assistant", "content": "other answer"},
+        ]
+        save_log(self.path, replaced)
+
+        self.assertEqual(self.read_records()[4], {"truncate": 2})
+        conversation_log._log_state.clear()
+        self.assertEqual(load_log(self.path), replaced)
+
+    def test_save_merges_turns_added_by_another_process(self):
+        save_log(self.path, self.messages(2))
+        elsewhere = {"role": "user", "content": "elsewhere"}
+        with open(self.path, "a") as file:
+            file.write(json.dumps(elsewhere) + "\n")
+
+        saved_messages = save_log(self.path, self.messages(4))
+        expected_messages = self.messages(2) + [elsewhere] + self.messages(4)[2:]
+        self.assertEqual(saved_messages, expected_messages)
+        self.assertEqual(self.read_records(), expected_messages)
+
+        conversation_log._log_state.clear()
+        self.assertEqual(load_log(self.path), expected_messages)
+
+    def test_load_reuses_messages_until_the_log_changes(self):
+        save_log(self.path, self.messages(2))
+        with patch("conversation_log._read_records") as mock_read_records:
+            messages = load_log(self.path)
+        mock_read_records.assert_not_called()
+        self.assertEqual(messages, self.messages(2))
+
+        # Changes made to loaded messages stay with the caller.
+        messages[0]["content"] = "changed"
+        self.assertEqual(load_log(self.path), self.messages(2))
+
+        elsewhere = {"role": "user", "content": "elsewhere"}
+        with open(self.path, "a") as file:
+            file.write(json.dumps(elsewhere) + "\n")
+        self.assertEqual(load_log(self.path), self.messages(2) + [elsewhere])
+
+    def test_load_discards_incomplete_last_record(self):
+        save_log(self.path, self.messages(2))
+        with open(self.path, "a") as file:
+            file.write('{"role": "user", "cont')
+
+        with self.assertLogs("conversation_log", level="WARNING"):
+            self.assertEqual(load_log(self.path), self.messages(2))
+        self.assertEqual(self.read_records(), self.messages(2))
+
+        save_log(self.path, self.messages(3))
+        self.assertEqual(load_log(self.path), self.messages(3))
+
+    def test_load_terminates_complete_last_record(self):
+        with open(self.path, "w") as file:
+            file.write(json.dumps(self.messages(1)[0]))
+
+        self.assertEqual(load_log(self.path), self.messages(1))
+        save_log(self.path, self.messages(2))
+        self.assertEqual(self.read_records(), self.messages(2))
+
+    @patch("conversation_log.COMPACTION_MIN_DEAD_RECORDS", 4)
+    def test_save_compacts_after_enough_dead_records(self):
+        save_log(self.path, self.messages(4))
+        save_log(self.path, self.messages(2))
+        save_log(self.path, self.messages(4))
+        self.assertEqual(len(self.read_records()), 7)
+
+        save_log(self.path, self.messages(2))
+        self.assertEqual(self.read_records(), self.messages(2))
+
+    def test_compact_log_reads_records(self):
+        save_log(self.path, self.messages(4))
+        save_log(self.path, self.messages(1))
+        compact_log(self.path)
+        self.assertEqual(self.read_records(), self.messages(1))
+
+    def test_read_log_range(self):
+        save_log(self.path, self.messages(6))
+        save_log(self.path, self.messages(4))
+        save_log(self.path, self.messages(4) + [{"role": "user", "content": "new"}])
+
+        self.assertEqual(count_log_messages(self.path), 5)
+        self.assertEqual(read_log_range(self.path, 2, 4), self.messages(4)[2:4])
+        self.assertEqual(
+            read_log_range(self.path, 3, 10),
+            [self.messages(4)[3], {"role": "user", "content": "new"}],
+        )
+
+    def test_offset_index_is_extended_after_appends(self):
+        save_log(self.path, self.messages(2))
+        self.assertEqual(count_log_messages(self.path), 2)
+        save_log(self.path, self.messages(4))
+
+        with patch("conversation_log.open", wraps=open) as mock_open:
+            self.assertEqual(count_log_messages(self.path), 4)
+        log_reads = [
+            call for call in mock_open.call_args_list if call.args[0] == self.path
+        ]
+        self.assertEqual(len(log_reads), 1)
+
+        self.assertEqual(read_log_range(self.path, 3, 4), self.messages(4)[3:])
+
+    def test_offset_index_is_rebuilt_after_rewrite(self):
+        save_log(self.path, self.messages(4))
+        self.assertEqual(count_log_messages(self.path), 4)
+        compact_log(self.path, self.messages(1))
+        self.assertEqual(count_log_messages(self.path), 1)
+
+        with open(self.path + ".idx", "wb") as file:
+            file.write(b"corrupt")
+        self.assertEqual(read_log_range(self.path, 0, 5), self.messages(1))
+
+    def test_load_migrates_legacy_file(self):
+        legacy_file = os.path.join(self.directory.name, "conversation.json")
+        with open(legacy_file, "w") as file:
+            json.dump(self.messages(2), file)
+
+        self.assertEqual(load_log(self.path), self.messages(2))
+        self.assertFalse(os.path.exists(legacy_file))
+        self.assertEqual(self.read_records(), self.messages(2))
+
+    def test_load_recovers_truncated_legacy_file(self):
+        legacy_file = os.path.join(self.directory.name, "conversation.json")
+        with open(legacy_file, "w") as file:
+            file.write(json.dumps(self.messages(3))[:-20])
+
+        with self.assertLogs("conversation_log", level="WARNING"):
+            self.assertEqual(load_log(self.path), self.messages(2))
+        self.assertEqual(load_log(self.path), self.messages(2))
+        self.assertFalse(os.path.exists(legacy_file))
+        self.assertTrue(os.path.exists(legacy_file + ".corrupt"))
+
+    def test_load_missing_log(self):
+        self.assertEqual(load_log(self.path), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,22 @@
+import os
+import json
+import asyncio
+import tempfile
 import unittest
+from threading import Event
 from unittest.mock import patch
 
 from conversation_manager import (
     invoke_conversation,
-    generate_conversation_name,
+    generate_conversation_title,
     get_conversation_names,
     remove_last_interaction,
+    ChatSession,
+    CONVERSATION_NAME_MODEL,
 )
+import conversation_log
+from conversation_log import load_log, log_lock
+from conversation_history import get_current_conversation_file, load_conversation
 
 
 class TestConversationManager(unittest.TestCase):
@@ -18,6 +28,56 @@ class TestConversationManager(unittest.TestCase):
         # Clean up any resources or reset any state
         pass
 
+    @patch("context_window.time", return_value=1700000000.0)
+    @patch("conversation_manager.load_user_config")
+    @patch("conversation_manager.get_current_conversation_file")
+    @patch("conversation_manager.save_conversation_history")
+    @patch("conversation_manager.load_conversation_history")
+    @patch("conversation_manager.stream_anthropic_api")
+    def test_invoke_conversation_stream_saves_on_completion(
+        self,
+        mock_stream_anthropic_api,
+        mock_load_conversation_history,
+        mock_save_conversation_history,
+        mock_get_current_conversation_file,
+        mock_load_user_config,
+        mock_time,
+    ):
+        mock_load_user_config.return_value = {
+            "model": "claude-v1",
+            "temperature": 0.7,
+            "persona": "default",
+            "conversations_directory": "/path/to/conversations",
+        }
+        mock_get_current_conversation_file.return_value = "current_conversation.json"
+        mock_load_conversation_history.return_value = []
+        mock_stream_anthropic_api.return_value = iter(["Hi ", "there!"])
+
+        role, response = invoke_conversation("Hello", stream=True)
+
+        self.assertEqual(role, "assistant")
+        self.assertEqual(next(response), "Hi ")
+        mock_save_conversation_history.assert_not_called()
+        self.assertEqual(list(response), ["there!"])
+        mock_save_conversation_history.assert_called_once_with(
+            [
+                {
+                    "role": "user",
+                    "content": "Hello",
+                    "timestamp": 1700000000.0,
+                    "model": "claude-v1",
+                    "tokens": 5,
+                },
+                {
+                    "role": "assistant",
+                    "content": "Hi there!",
+                    "timestamp": 1700000000.0,
+                    "model": "claude-v1",
+                    "tokens": 6,
+                },
+            ]
+        )
+
 
 @patch("conversation_manager.get_current_conversation_file")
 @patch("conversation_manager.set_current_conversation_file")
@@ -58,12 +118,10 @@ def test_invoke_conversation(
     mock_load_conversation_history.assert_called_once()
 
     @patch("conversation_manager.invoke_anthropic_api")
-    @patch("conversation_manager.format_conversation_title")
     @patch("conversation_manager.extract_response_text")
-    def test_generate_conversation_name(
+    def test_generate_conversation_title(
         self,
         mock_extract_response_text,
-        mock_format_conversation_title,
         mock_invoke_anthropic_api,
     ):
         # Set up the mock responses
@@ -71,13 +129,13 @@ def test_invoke_conversation(
         mock_invoke_anthropic_api.return_value = mock_summary
         mock_extract_response_text.return_value = "Test_conversation_name"
 
-        # Test the generate_conversation_name function
+        # Test the generate_conversation_title function
         first_message = "This is a test message."
-        conversation_name = generate_conversation_name(first_message)
+        conversation_title = generate_conversation_title(first_message)
 
         # Assert the expected behavior
-        expected_conversation_name = "Test_conversation_name"
-        self.assertEqual(conversation_name, expected_conversation_name)
+        expected_conversation_title = "Test_conversation_name"
+        self.assertEqual(conversation_title, expected_conversation_title)
 
         # Assert that the mock API function was called with the correct arguments
         mock_invoke_anthropic_api.assert_called_once()
@@ -87,18 +145,19 @@ def test_invoke_conversation(
         # Assert that the mock extract_response_text function was called with the correct arguments
         mock_extract_response_text.assert_called_once_with(mock_summary, "filename")
 
-        # Assert that the mock format_conversation_title function was called with the correct argument
-        mock_format_conversation_title.assert_called_once_with("Test_conversation_name")
-
+    @patch("conversation_manager.write_conversation_names")
     @patch("conversation_manager.os.listdir")
     @patch("conversation_manager.load_user_config")
-    def test_get_conversation_names(self, mock_load_user_config, mock_listdir):
+    def test_get_conversation_names(
+        self, mock_load_user_config, mock_listdir, mock_write_conversation_names
+    ):
         # Set up the mock return values
         mock_load_user_config.return_value = {
             "conversations_directory": "/path/to/conversations"
         }
         mock_listdir.return_value = [
             "conversation1.json",
+            "conversation2.jsonl",
             "conversation2.json",
             "not_a_conversation.txt",
         ]
@@ -113,6 +172,9 @@ def test_invoke_conversation(
         # Assert that the mock functions were called with the correct arguments
         mock_load_user_config.assert_called_once()
         mock_listdir.assert_called_once_with("/path/to/conversations")
+        mock_write_conversation_names.assert_called_once_with(
+            "/path/to/conversations", expected_conversation_names
+        )
 
     @patch("conversation_manager.get_current_conversation_file")
     @patch("conversation_manager.load_conversation_history")
@@ -159,5 +221,250 @@ def test_invoke_conversation(
         mock_save_conversation_history.assert_called_once()  # Ensure save_conversation_history is not called again
 
 
+async def stream_reply(*args, **kwargs):
+    for chunk in ["Hi ", "there!"]:
+        yield chunk
+
+
+class TestChatSession(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        current_file = os.path.join(self.directory.name, "current_conversation.txt")
+        with open(current_file, "w") as file:
+            file.write("chat.jsonl")
+        self.log_path = os.path.join(self.directory.name, "chat.jsonl")
+        with open(self.log_path, "w") as file:
+            file.write(json.dumps({"role": "user", "content": "Earlier"}) + "\n")
+            file.write(json.dumps({"role": "assistant", "content": "Reply"}) + "\n")
+
+        patches = [
+            patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name),
+            patch("conversation_history.CURRENT_CONVERSATION_FILE", current_file),
+            patch(
+                "conversation_manager.load_user_config",
+                return_value={
+                    "model": "claude-v1",
+                    "temperature": 0.7,
+                    "persona": "default",
+                    "conversations_directory": self.directory.name,
+                },
+            ),
+            patch(
+                "conversation_manager.async_stream_anthropic_api",
+                side_effect=stream_reply,
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_log(self):
+        with open(self.log_path) as file:
+            return [json.loads(line) for line in file]
+
+    async def send(self, chat_session, message):
+        return "".join([chunk async for chunk in await chat_session.send(message)])
+
+    async def test_turns_use_the_history_in_memory(self):
+        chat_session = ChatSession()
+        with patch("conversation_manager.load_conversation") as mock_load, patch(
+            "conversation_manager.get_current_conversation_file"
+        ) as mock_get_current_conversation_file:
+            self.assertEqual(await self.send(chat_session, "Hello"), "Hi there!")
+            await self.send(chat_session, "Again")
+        mock_load.assert_not_called()
+        mock_get_current_conversation_file.assert_not_called()
+        chat_session.close()
+
+        self.assertEqual(
+            [message["content"] for message in self.read_log()],
+            ["Earlier", "Reply", "Hello", "Hi there!", "Again", "Hi there!"],
+        )
+
+    async def test_undo_is_saved(self):
+        chat_session = ChatSession()
+        await self.send(chat_session, "Hello")
+        self.assertTrue(chat_session.undo())
+        chat_session.close()
+
+        self.assertEqual(
+            [message["content"] for message in ChatSession().history],
+            ["Earlier", "Reply"],
+        )
+
+    def test_undo_keeps_the_context_summary(self):
+        summary = {"text": "Earlier turns", "covers": 2, "tokens": 5}
+        with open(self.log_path, "a") as file:
+            file.write(
+                json.dumps({"role": "user", "content": "Hello", "summary": summary})
+                + "\n"
+            )
+            file.write(json.dumps({"role": "assistant", "content": "Hi"}) + "\n")
+
+        chat_session = ChatSession()
+        self.assertTrue(chat_session.undo())
+        chat_session.close()
+
+        conversation_log._log_state.clear()
+        messages = load_log(self.log_path)
+        self.assertEqual(
+            [message["content"] for message in messages], ["Earlier", "Reply"]
+        )
+        self.assertEqual(messages[-1]["summary"], summary)
+
+    async def test_undo_and_a_new_turn_while_the_log_is_busy(self):
+        chat_session = ChatSession()
+        with log_lock(self.log_path):
+            await self.send(chat_session, "Hello")
+            chat_session.undo()
+            await self.send(chat_session, "Again")
+        chat_session.close()
+
+        conversation_log._log_state.clear()
+        self.assertEqual(
+            [message["content"] for message in load_log(self.log_path)],
+            ["Earlier", "Reply", "Again", "Hi there!"],
+        )
+
+    async def test_turns_added_by_another_process_are_kept(self):
+        chat_session = ChatSession()
+        elsewhere = {"role": "user", "content": "Elsewhere"}
+        with open(self.log_path, "a") as file:
+            file.write(json.dumps(elsewhere) + "\n")
+
+        await self.send(chat_session, "Hello")
+        chat_session.writer.flush()
+        await self.send(chat_session, "Again")
+        chat_session.close()
+
+        contents = ["Earlier", "Reply", "Elsewhere", "Hello", "Hi there!"]
+        contents += ["Again", "Hi there!"]
+        self.assertEqual([message["content"] for message in self.read_log()], contents)
+        self.assertEqual(
+            [message["content"] for message in chat_session.history], contents
+        )
+
+
+class TestNewConversation(unittest.IsolatedAsyncioTestCase):
+    # The title of a new conversation is only returned once the reply has
+    # started, so these fail if the title is waited for first.
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.reply_started = Event()
+        self.async_reply_started = asyncio.Event()
+        self.title = "friendly greeting"
+        patches = [
+            patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name),
+            patch(
+                "conversation_history.CURRENT_CONVERSATION_FILE",
+                os.path.join(self.directory.name, "current_conversation.txt"),
+            ),
+            patch(
+                "conversation_manager.load_user_config",
+                return_value={
+                    "model": "claude-v1",
+                    "temperature": 0.7,
+                    "persona": "default",
+                    "conversations_directory": self.directory.name,
+                },
+            ),
+            patch("conversation_manager.get_output"),
+            patch(
+                "conversation_manager.invoke_anthropic_api",
+                side_effect=self.invoke_anthropic_api,
+            ),
+            patch(
+                "conversation_manager.async_invoke_anthropic_api",
+                side_effect=self.async_invoke_anthropic_api,
+            ),
+            patch(
+                "conversation_manager.async_stream_anthropic_api",
+                side_effect=self.async_stream_anthropic_api,
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def invoke_anthropic_api(self, messages, model=None, *args, **kwargs):
+        if model == CONVERSATION_NAME_MODEL:
+            self.assertTrue(self.reply_started.wait(timeout=5))
+            return f"<filename>{self.title}</filename>"
+        self.reply_started.set()
+        return "Hi there!"
+
+    async def async_invoke_anthropic_api(self, messages, model=None, *args, **kwargs):
+        await asyncio.wait_for(self.async_reply_started.wait(), timeout=5)
+        return f"<filename>{self.title}</filename>"
+
+    async def async_stream_anthropic_api(self, *args, **kwargs):
+        self.async_reply_started.set()
+        for chunk in ["Hi ", "there!"]:
+            yield chunk
+
+    def assertConversationSaved(
+        self, conversation_file, expected_file="friendly_greeting.jsonl"
+    ):
+        self.assertEqual(conversation_file, expected_file)
+        self.assertEqual(
+            [message["content"] for message in load_conversation(conversation_file)],
+            ["Hello", "Hi there!"],
+        )
+        self.assertEqual(
+            [
+                file_name
+                for file_name in os.listdir(self.directory.name)
+                if file_name.endswith(".jsonl")
+            ],
+            [expected_file],
+        )
+
+    def test_invoke_conversation(self):
+        role, response = invoke_conversation("Hello")
+
+        self.assertEqual(response, "Hi there!")
+        self.assertConversationSaved(get_current_conversation_file())
+
+    async def test_chat_session(self):
+        chat_session = ChatSession()
+        response = await chat_session.send("Hello")
+        self.assertEqual([chunk async for chunk in response], ["Hi ", "there!"])
+        chat_session.close()
+
+        self.assertConversationSaved(chat_session.conversation_file)
+        self.assertEqual(get_current_conversation_file(), "friendly_greeting.jsonl")
+
+    def test_title_with_path_separators(self):
+        self.title = "fix ../src/main.py bug"
+        invoke_conversation("Hello")
+
+        self.assertConversationSaved(
+            get_current_conversation_file(), "fix_srcmainpy_bug.jsonl"
+        )
+
+    async def test_failed_rename_keeps_the_temporary_name(self):
+        chat_session = ChatSession()
+        with patch(
+            "conversation_manager.rename_conversation",
+            side_effect=OSError("No such file or directory"),
+        ), self.assertLogs("conversation_manager", level="WARNING"):
+            response = await chat_session.send("Hello")
+            self.assertEqual("".join([chunk async for chunk in response]), "Hi there!")
+            response = await chat_session.send("Again")
+            self.assertEqual("".join([chunk async for chunk in response]), "Hi there!")
+        chat_session.close()
+
+        self.assertTrue(chat_session.conversation_file.startswith("untitled_"))
+        self.assertEqual(
+            [
+                message["content"]
+                for message in load_conversation(chat_session.conversation_file)
+            ],
+            ["Hello", "Hi there!", "Again", "Hi there!"],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from argparse import Namespace
+import conversation_names
+from conversation_names import (
+    read_conversation_names,
+    write_conversation_names,
+    add_conversation_name,
+)
+from argument_parser import conversation_name_completer
+
+
+class TestConversationNames(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        conversation_names._known_names.clear()
+
+    def tearDown(self):
+        conversation_names._known_names.clear()
+        self.temp_dir.cleanup()
+
+    def test_read_without_a_recorded_list(self):
+        self.assertIsNone(read_conversation_names(self.directory))
+
+    def test_write_and_read(self):
+        write_conversation_names(self.directory, ["first", "second"])
+        self.assertEqual(read_conversation_names(self.directory), ["first", "second"])
+
+    def test_add_appends_new_names_once(self):
+        write_conversation_names(self.directory, ["first"])
+        conversation_names._known_names.clear()
+        add_conversation_name(self.directory, "second")
+        add_conversation_name(self.directory, "second")
+        add_conversation_name(self.directory, "first")
+        self.assertEqual(read_conversation_names(self.directory), ["first", "second"])
+
+    def test_add_without_a_recorded_list(self):
+        add_conversation_name(self.directory, "first")
+        self.assertIsNone(read_conversation_names(self.directory))
+
+    def test_names_file_is_not_listed_as_a_conversation(self):
+        write_conversation_names(self.directory, ["first"])
+        extensions = [os.path.splitext(name)[1] for name in os.listdir(self.directory)]
+        self.assertNotIn(".json", extensions)
+        self.assertNotIn(".jsonl", extensions)
+
+    @patch("user_config.load_user_config")
+    def test_completer_uses_the_recorded_names(self, mock_load_user_config):
+        mock_load_user_config.return_value = {"conversations_directory": self.directory}
+        write_conversation_names(self.directory, ["python_help", "poetry", "rust"])
+        completions = conversation_name_completer("p", parsed_args=Namespace())
+        self.assertEqual(completions, ["python_help", "poetry"])
+
+    @patch("conversation_manager.get_conversation_names")
+    @patch("user_config.load_user_config")
+    def test_completer_records_names_the_first_time(
+        self, mock_load_user_config, mock_get_conversation_names
+    ):
+        mock_load_user_config.return_value = {"conversations_directory": self.directory}
+        mock_get_conversation_names.return_value = ["python_help"]
+        completions = conversation_name_completer("", parsed_args=Namespace())
+        self.assertEqual(completions, ["python_help"])
+        mock_get_conversation_names.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
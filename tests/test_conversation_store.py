@@ -0,0 +1,167 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import conversation_store
+from conversation_store import ConversationStore, get_conversation_store
+from conversation_history import (
+    save_conversation_history,
+    load_conversation_history,
+    get_current_conversation_file,
+    set_current_conversation_file,
+    import_conversation,
+    rename_conversation,
+)
+
+
+def make_messages(count, model="claude-v1"):
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"message {i}",
+            "timestamp": 1700000000.0 + i,
+            "model": model,
+            "tokens": 5,
+        }
+        for i in range(count)
+    ]
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ConversationStore(
+            os.path.join(self.directory.name, "conversations.db")
+        )
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_save_and_load_messages(self):
+        self.store.save_messages("first", make_messages(2))
+        self.store.save_messages("first", make_messages(4))
+        self.assertEqual(self.store.load_messages("first"), make_messages(4))
+
+        self.store.save_messages("first", make_messages(2))
+        self.assertEqual(self.store.load_messages("first"), make_messages(2))
+        self.assertEqual(self.store.load_messages("missing"), [])
+
+    def test_save_updates_metadata(self):
+        self.store.save_messages("first", make_messages(3, model="claude-v2"))
+        row = self.store.connection.execute(
+            "SELECT model, message_count, token_count FROM conversations"
+            " WHERE title = 'first'"
+        ).fetchone()
+        self.assertEqual(row, ("claude-v2", 3, 15))
+
+    def test_conversation_titles_most_recent_first(self):
+        with patch("conversation_store.time", side_effect=[1.0, 2.0, 3.0]):
+            self.store.save_messages("first", make_messages(1))
+            self.store.save_messages("second", make_messages(1))
+            self.store.save_messages("first", make_messages(2))
+        self.assertEqual(self.store.conversation_titles(), ["first", "second"])
+        self.assertTrue(self.store.has_conversation("second"))
+        self.assertFalse(self.store.has_conversation("third"))
+
+    def test_save_merges_turns_added_by_another_process(self):
+        self.store.save_messages("first", make_messages(2))
+        other_store = ConversationStore(self.store.path)
+        self.addCleanup(other_store.close)
+        other_messages = other_store.load_messages("first")
+        other_store.save_messages("first", other_messages + make_messages(1))
+
+        saved_messages = self.store.save_messages("first", make_messages(4))
+        expected_messages = make_messages(2) + make_messages(1) + make_messages(4)[2:]
+        self.assertEqual(saved_messages, expected_messages)
+        self.assertEqual(other_store.load_messages("first"), expected_messages)
+
+    def test_load_message_range(self):
+        self.store.save_messages("first", make_messages(5))
+        self.assertEqual(self.store.count_messages("first"), 5)
+        self.assertEqual(self.store.count_messages("missing"), 0)
+        self.assertEqual(
+            self.store.load_message_range("first", 3, 10), make_messages(5)[3:]
+        )
+
+    def test_save_replaces_turns_undone_since_the_last_save(self):
+        self.store.save_messages("first", make_messages(4))
+        replaced = make_messages(2) + make_messages(2, model="claude-v2")
+        self.store.save_messages("first", replaced)
+
+        other_store = ConversationStore(self.store.path)
+        self.addCleanup(other_store.close)
+        self.assertEqual(other_store.load_messages("first"), replaced)
+
+    def test_rename_conversation(self):
+        self.store.save_messages("untitled", make_messages(2))
+        self.store.rename_conversation("untitled", "greeting")
+        self.store.save_messages("greeting", make_messages(4))
+
+        self.assertFalse(self.store.has_conversation("untitled"))
+        self.assertEqual(self.store.load_messages("greeting"), make_messages(4))
+
+    def test_state(self):
+        self.assertIsNone(self.store.get_state("current_conversation"))
+        self.store.set_state("current_conversation", "first.jsonl")
+        self.assertEqual(self.store.get_state("current_conversation"), "first.jsonl")
+
+    def test_uses_wal_journal(self):
+        (journal_mode,) = self.store.connection.execute(
+            "PRAGMA journal_mode"
+        ).fetchone()
+        self.assertEqual(journal_mode, "wal")
+
+
+class TestSQLiteConversationHistory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "legacy.json"), "w") as file:
+            json.dump(make_messages(2), file)
+        patches = [
+            patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name),
+            patch("conversation_history.STORAGE_BACKEND", "sqlite"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for store in conversation_store._stores.values():
+            store.close()
+        conversation_store._stores.clear()
+        self.directory.cleanup()
+
+    def test_save_and_load_current_conversation(self):
+        self.assertEqual(load_conversation_history(), [])
+        set_current_conversation_file("first.jsonl")
+        save_conversation_history(make_messages(2))
+
+        self.assertEqual(load_conversation_history(), make_messages(2))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory.name, "first.jsonl"))
+        )
+
+    def test_rename_current_conversation(self):
+        set_current_conversation_file("untitled.jsonl")
+        save_conversation_history(make_messages(2))
+
+        self.assertEqual(
+            rename_conversation("untitled.jsonl", "greeting"), "greeting.jsonl"
+        )
+        self.assertEqual(get_current_conversation_file(), "greeting.jsonl")
+        self.assertEqual(load_conversation_history(), make_messages(2))
+
+    def test_existing_logs_are_imported(self):
+        self.assertEqual(import_conversation("legacy"), "legacy")
+        self.assertEqual(load_conversation_history(), make_messages(2))
+        self.assertIsNone(import_conversation("missing"))
+
+        store = get_conversation_store(self.directory.name)
+        self.assertEqual(store.conversation_titles(), ["legacy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import unittest
+import threading
+import subprocess
+from argparse import Namespace
+from unittest.mock import patch
+from daemon import (
+    SocketOutput,
+    ThreadOutput,
+    run_in_daemon,
+    served_by_daemon,
+    SOCKET_FILE,
+)
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.home_directory = tempfile.TemporaryDirectory()
+        conversations_directory = os.path.join(cls.home_directory.name, "conversations")
+        os.makedirs(conversations_directory)
+        with open(os.path.join(conversations_directory, "greeting.jsonl"), "w") as file:
+            file.write(json.dumps({"role": "user", "content": "Hello"}) + "\n")
+            file.write(json.dumps({"role": "assistant", "content": "Hi there"}) + "\n")
+        cls.environment = {**os.environ, "HOME": cls.home_directory.name}
+        cls.socket_path = os.path.join(cls.home_directory.name, SOCKET_FILE)
+        cls.daemon = subprocess.Popen(
+            [sys.executable, "chat.py", "daemon"],
+            cwd=REPO_DIRECTORY,
+            env=cls.environment,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while not os.path.exists(cls.socket_path):
+            if time.monotonic() > deadline or cls.daemon.poll() is not None:
+                raise RuntimeError("The chat daemon did not start")
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.run_chat("daemon", "--stop")
+        cls.daemon.wait(timeout=10)
+        cls.home_directory.cleanup()
+
+    @classmethod
+    def run_chat(cls, *arguments):
+        return subprocess.run(
+            [sys.executable, "chat.py", *arguments],
+            cwd=REPO_DIRECTORY,
+            env=cls.environment,
+            capture_output=True,
+            text=True,
+        )
+
+    def test_commands_run_in_the_daemon(self):
+        completed = self.run_chat("import", "greeting")
+        self.assertEqual(completed.returncode, 0)
+        self.assertEqual(completed.stdout, "Imported conversation: greeting\n")
+
+        completed = self.run_chat("history", "--raw")
+        self.assertEqual(completed.returncode, 0)
+        self.assertEqual(
+            completed.stdout,
+            "Conversation history:\nuser: Hello\nassistant: Hi there\n",
+        )
+
+    def test_stderr_is_passed_through(self):
+        completed = self.run_chat("reset")
+        self.assertEqual(completed.returncode, 0)
+        self.assertEqual(completed.stderr, "Conversation reset.\n")
+
+    def test_a_request_does_not_wait_for_another(self):
+        # A client that has connected but not finished its request would
+        # hold up every other one if requests were handled in turn.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as slow_client:
+            slow_client.connect(self.socket_path)
+            completed = subprocess.run(
+                [sys.executable, "chat.py", "reset"],
+                cwd=REPO_DIRECTORY,
+                env=self.environment,
+                capture_output=True,
+                text=True,
+                timeout=10,
+            )
+        self.assertEqual(completed.returncode, 0)
+        self.assertEqual(completed.stderr, "Conversation reset.\n")
+
+    def test_a_second_daemon_does_not_start(self):
+        completed = self.run_chat("daemon")
+        self.assertEqual(completed.returncode, 1)
+        self.assertIn("already running", completed.stderr)
+
+
+class TestDaemonClient(unittest.TestCase):
+    def test_falls_back_without_a_daemon(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with patch(
+                "daemon.socket_path",
+                return_value=os.path.join(directory, SOCKET_FILE),
+            ):
+                self.assertIsNone(run_in_daemon(Namespace(command="reset")))
+
+    @patch("daemon._request", return_value=iter([{"exit": 0}]))
+    def test_paths_are_sent_as_absolute_paths(self, mock_request):
+        run_in_daemon(Namespace(command="import", directory="saved"))
+        request = mock_request.call_args[0][0]
+        self.assertEqual(request["args"]["directory"], os.path.abspath("saved"))
+
+    def test_served_by_daemon(self):
+        self.assertTrue(served_by_daemon(Namespace(command="history", pager=False)))
+        self.assertFalse(served_by_daemon(Namespace(command="history", pager=True)))
+        self.assertFalse(served_by_daemon(Namespace(command="interactive")))
+
+    def test_thread_output_is_redirected_per_thread(self):
+        daemon_stream = io.StringIO()
+        thread_output = ThreadOutput(daemon_stream)
+        request_streams = [io.StringIO(), io.StringIO()]
+
+        def write(stream, text):
+            thread_output.redirected.set(stream)
+            thread_output.write(text)
+
+        threads = [
+            threading.Thread(target=write, args=(stream, f"request {i}"))
+            for i, stream in enumerate(request_streams)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        thread_output.write("daemon")
+
+        self.assertEqual(
+            [stream.getvalue() for stream in request_streams],
+            ["request 0", "request 1"],
+        )
+        self.assertEqual(daemon_stream.getvalue(), "daemon")
+
+    def test_socket_output_sends_each_write(self):
+        server_end, client_end = socket.socketpair()
+        with server_end, client_end:
+            output = SocketOutput(server_end, "stdout", terminal=True)
+            output.write("Hello, ")
+            output.write("")
+            output.write("world")
+            self.assertTrue(output.isatty())
+            server_end.shutdown(socket.SHUT_WR)
+            lines = client_end.makefile("rb").read().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"stdout": "Hello, "}, {"stdout": "world"}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
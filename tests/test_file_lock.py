@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from threading import Thread
+from unittest.mock import patch
+
+from file_lock import write_atomically
+
+
+class TestWriteAtomically(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_threads_write_the_same_path(self):
+        errors = []
+
+        def write(data):
+            try:
+                for _ in range(50):
+                    write_atomically(self.path, data, sync=False)
+            except OSError as error:
+                errors.append(error)
+
+        contents = [str(number) * 1000 for number in range(4)]
+        threads = [Thread(target=write, args=(data,)) for data in contents]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with open(self.path) as file:
+            self.assertIn(file.read(), contents)
+        self.assertEqual(os.listdir(self.directory.name), ["state.json"])
+
+    def test_failed_write_removes_temporary_file(self):
+        with patch("file_lock.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                write_atomically(self.path, "data")
+
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import io
+import unittest
+from unittest.mock import patch
+from rich.text import Text
+from rich.syntax import Syntax
+
+from formatting import (
+    AssistantStreamRenderer,
+    format_assistant_stream,
+    format_assistant_message,
+    format_user_message,
+    assistant_message_renderables,
+    cached_lexer,
+    redirect_output,
+)
+from render_cache import RenderCache
+
+
+class TestAssistantStreamRenderer(unittest.TestCase):
+    @patch("formatting.console")
+    def test_prose_is_printed_before_the_line_completes(self, mock_console):
+        renderer = AssistantStreamRenderer()
+        renderer.feed("Hello")
+
+        mock_console.print.assert_called_once()
+        self.assertEqual(mock_console.print.call_args[0][0].plain, "Hello")
+
+    @patch("formatting.Syntax")
+    @patch("formatting.console")
+    def test_code_fence_split_across_chunks(self, mock_console, mock_syntax):
+        renderer = AssistantStreamRenderer()
+        for chunk in ["Intro\n`", "``ba", "sh\necho ", "hi\n``", "`\nDone"]:
+            renderer.feed(chunk)
+        renderer.close()
+
+        mock_syntax.assert_called_once_with(
+            "echo hi", cached_lexer("bash"), line_numbers=False, word_wrap=True
+        )
+        printed_text = "".join(
+            call[0][0].plain
+            for call in mock_console.print.call_args_list
+            if isinstance(call[0][0], Text)
+        )
+        self.assertEqual(printed_text, "Intro\nDone\n")
+
+    @patch("formatting.console")
+    def test_inline_code_spans_chunks(self, mock_console):
+        renderer = AssistantStreamRenderer()
+        renderer.feed("Run `pip ")
+        renderer.feed("install` now")
+        renderer.close()
+
+        spans = [
+            (span.style, call[0][0].plain[span.start : span.end])
+            for call in mock_console.print.call_args_list
+            for span in call[0][0].spans
+        ]
+        self.assertEqual(spans, [("bold yellow", "pip "), ("bold yellow", "install")])
+
+    @patch("formatting.Syntax")
+    @patch("formatting.console")
+    def test_unterminated_code_block_is_flushed(self, mock_console, mock_syntax):
+        format_assistant_stream(["```\n", "print(1)"])
+
+        mock_syntax.assert_called_once_with(
+            "print(1)", cached_lexer("python"), line_numbers=False, word_wrap=True
+        )
+
+    @patch("formatting.console")
+    def test_returns_assembled_text(self, mock_console):
+        text = format_assistant_stream(["Hello ", "there", "!"])
+
+        self.assertEqual(text, "Hello there!")
+
+
+class TestFormatAssistantMessage(unittest.TestCase):
+    @patch("formatting.get_render_cache", return_value=None)
+    @patch("formatting.console")
+    def test_message_is_printed_once(self, mock_console, mock_get_render_cache):
+        format_assistant_message("One\nTwo\n```\ncode\n```\nThree")
+
+        mock_console.print.assert_called_once()
+
+    def test_prose_and_code_blocks_keep_their_order(self):
+        renderables = assistant_message_renderables(
+            "Intro\nMore\n```bash\necho hi\n```\nDone"
+        )
+
+        self.assertEqual(
+            [type(renderable) for renderable in renderables], [Text, Syntax, Text]
+        )
+        self.assertEqual(renderables[0].plain, "Intro\nMore")
+        self.assertEqual(renderables[1].code, "echo hi")
+        self.assertEqual(renderables[2].plain, "Done")
+
+    def test_inline_code_is_highlighted(self):
+        (text,) = assistant_message_renderables("Run `pip install` then `x`")
+
+        self.assertEqual(text.plain, "Run pip install then x")
+        self.assertEqual(
+            [(span.style, text.plain[span.start : span.end]) for span in text.spans],
+            [("bold yellow", "pip install"), ("bold yellow", "x")],
+        )
+
+    def test_unterminated_code_block_is_kept(self):
+        renderables = assistant_message_renderables("Intro\n```\nprint(1)")
+
+        self.assertEqual(renderables[-1].code, "print(1)")
+
+    def test_unknown_language_is_shown_as_text(self):
+        (syntax,) = assistant_message_renderables("```nosuchlanguage\ncode\n```")
+
+        self.assertIsNone(cached_lexer("nosuchlanguage"))
+        self.assertEqual(syntax.lexer.name, "Text only")
+
+
+class TestRenderCache(unittest.TestCase):
+    def render(self, format_function, message, width=80):
+        output = io.StringIO()
+        with redirect_output(output, force_terminal=True, width=width):
+            format_function(message)
+        return output.getvalue()
+
+    @patch("formatting.get_render_cache")
+    def test_repeated_messages_are_rendered_once(self, mock_get_render_cache):
+        mock_get_render_cache.return_value = RenderCache(memory_entries=8)
+        message = "Intro `code`\n```python\nprint(1)\n```"
+
+        first = self.render(format_assistant_message, message)
+        with patch("formatting.assistant_message_renderables") as mock_renderables:
+            second = self.render(format_assistant_message, message)
+
+        mock_renderables.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertIn("print", first)
+
+    @patch("formatting.get_render_cache")
+    def test_cache_is_keyed_by_width_and_role(self, mock_get_render_cache):
+        mock_get_render_cache.return_value = RenderCache(memory_entries=8)
+        message = "word " * 30
+
+        narrow = self.render(format_assistant_message, message, width=40)
+        wide = self.render(format_assistant_message, message, width=120)
+        user = self.render(format_user_message, message, width=120)
+
+        self.assertGreater(narrow.count("\n"), wide.count("\n"))
+        self.assertNotEqual(wide, user)
+        self.assertEqual(len(mock_get_render_cache.return_value.entries), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from threading import Event
+from unittest.mock import patch
+
+from history_writer import HistoryWriter
+
+
+class TestHistoryWriter(unittest.TestCase):
+    def setUp(self):
+        self.saves = []
+        patcher = patch("history_writer.save_conversation", side_effect=self.save)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.writer = HistoryWriter()
+        self.addCleanup(self.writer.close)
+
+    def save(self, conversation_file, messages):
+        self.saves.append((conversation_file, messages))
+        return messages
+
+    def test_flush_waits_for_the_save(self):
+        self.writer.schedule("chat.jsonl", [{"role": "user", "content": "Hi"}])
+        self.writer.flush()
+
+        self.assertEqual(
+            self.saves, [("chat.jsonl", [{"role": "user", "content": "Hi"}])]
+        )
+
+    def test_changes_waiting_together_are_saved_once(self):
+        started = Event()
+        release = Event()
+
+        def slow_save(conversation_file, messages):
+            started.set()
+            release.wait()
+            return self.save(conversation_file, messages)
+
+        with patch("history_writer.save_conversation", side_effect=slow_save):
+            self.writer.schedule("chat.jsonl", [1])
+            started.wait()
+            for count in range(2, 6):
+                self.writer.schedule("chat.jsonl", list(range(1, count + 1)))
+            release.set()
+            self.writer.flush()
+
+        self.assertEqual(
+            self.saves, [("chat.jsonl", [1]), ("chat.jsonl", [1, 2, 3, 4, 5])]
+        )
+
+    def test_an_undo_is_saved_before_the_turn_that_follows_it(self):
+        started = Event()
+        release = Event()
+
+        def slow_save(conversation_file, messages):
+            started.set()
+            release.wait()
+            return self.save(conversation_file, messages)
+
+        with patch("history_writer.save_conversation", side_effect=slow_save):
+            self.writer.schedule("chat.jsonl", ["q1", "a1", "q2", "a2"])
+            started.wait()
+            self.writer.schedule("chat.jsonl", ["q1", "a1"])
+            self.writer.schedule("chat.jsonl", ["q1", "a1", "q3", "a3"])
+            release.set()
+            self.writer.flush()
+
+        self.assertEqual(
+            [messages for _, messages in self.saves],
+            [["q1", "a1", "q2", "a2"], ["q1", "a1"], ["q1", "a1", "q3", "a3"]],
+        )
+
+    def test_scheduled_history_is_copied(self):
+        messages = [1]
+        self.writer.schedule("chat.jsonl", messages)
+        self.writer.flush()
+        messages.append(2)
+
+        self.assertEqual(self.saves, [("chat.jsonl", [1])])
+
+    def test_a_failed_save_does_not_stop_the_writer(self):
+        with patch("history_writer.save_conversation", side_effect=OSError("full")):
+            with self.assertLogs("history_writer", level="ERROR"):
+                self.writer.schedule("chat.jsonl", [1])
+                self.writer.flush()
+        self.writer.schedule("chat.jsonl", [1, 2])
+        self.writer.flush()
+
+        self.assertEqual(self.saves, [("chat.jsonl", [1, 2])])
+
+    def test_on_saved_receives_the_saved_history(self):
+        calls = []
+        writer = HistoryWriter(on_saved=lambda *args: calls.append(args))
+        writer.schedule("chat.jsonl", [1])
+        writer.close()
+
+        self.assertEqual(calls, [("chat.jsonl", [1], [1])])
+
+    def test_schedule_after_close_fails(self):
+        self.writer.close()
+        with self.assertRaises(RuntimeError):
+            self.writer.schedule("chat.jsonl", [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import output
+from output import (
+    PlainOutput,
+    JsonOutput,
+    NdjsonOutput,
+    RichOutput,
+    get_output,
+    select_output,
+    use_output,
+)
+from search_index import SearchResult, HIGHLIGHT_START, HIGHLIGHT_END
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.result = SearchResult(
+            "python_help",
+            3,
+            "assistant",
+            "claude-3-haiku-20240307",
+            1700000000.0,
+            f"use {HIGHLIGHT_START}pip{HIGHLIGHT_END} install",
+            -1.5,
+        )
+
+    def capture(self, function, *args):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            returned = function(*args)
+        return stdout.getvalue(), returned
+
+    def test_plain_stream_writes_chunks_as_they_arrive(self):
+        written, text = self.capture(PlainOutput().assistant_stream, ["Hel", "lo"])
+
+        self.assertEqual(written, "Hello\n")
+        self.assertEqual(text, "Hello")
+
+    def test_plain_table_is_tab_separated(self):
+        written, _ = self.capture(
+            PlainOutput().table, "Personas", ["Persona", "Description"], [("a", "b")]
+        )
+
+        self.assertEqual(written, "a\tb\n")
+
+    def test_plain_search_result_drops_highlighting(self):
+        written, _ = self.capture(PlainOutput().search_result, self.result)
+
+        self.assertEqual(written, "python_help #3 assistant: use pip install\n")
+
+    def test_ndjson_stream_writes_delta_events(self):
+        written, text = self.capture(NdjsonOutput().assistant_stream, ["Hel", "lo"])
+
+        self.assertEqual(
+            [json.loads(line) for line in written.splitlines()],
+            [
+                {"type": "delta", "text": "Hel"},
+                {"type": "delta", "text": "lo"},
+                {"type": "message", "role": "assistant", "content": "Hello"},
+            ],
+        )
+        self.assertEqual(text, "Hello")
+
+    def test_json_document_is_written_when_the_command_finishes(self):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            with use_output(JsonOutput()) as json_output:
+                get_output().conversation_title("Greeting")
+                json_output.assistant_message("Hi there!")
+                self.assertEqual(stdout.getvalue(), "")
+
+        self.assertEqual(
+            json.loads(stdout.getvalue()),
+            {"title": "Greeting", "role": "assistant", "content": "Hi there!"},
+        )
+
+    def test_json_search_results(self):
+        json_output = JsonOutput()
+        json_output.search_result(self.result)
+
+        (result,) = json_output.document["results"]
+        self.assertEqual(result["snippet"], "use pip install")
+        self.assertEqual(result["conversation"], "python_help")
+
+    @patch("output.sys.stdout.isatty", return_value=False)
+    def test_piped_output_is_plain(self, mock_isatty):
+        self.assertIsInstance(get_output(), PlainOutput)
+        self.assertIsInstance(select_output(), PlainOutput)
+        self.assertIsInstance(select_output(json_output=True), JsonOutput)
+        self.assertIsInstance(
+            select_output(json_output=True, stream=True), NdjsonOutput
+        )
+
+    @patch("output.sys.stdout.isatty", return_value=True)
+    def test_terminal_output_is_rich(self, mock_isatty):
+        self.assertIsInstance(get_output(), RichOutput)
+
+    def test_use_output_restores_the_previous_backend(self):
+        with use_output(PlainOutput()):
+            with use_output(NdjsonOutput()):
+                self.assertIsInstance(get_output(), NdjsonOutput)
+            self.assertIsInstance(get_output(), PlainOutput)
+        self.assertIsNone(output._output.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import rate_limiter
+from rate_limiter import RateLimiter, SharedRateLimiter, TokenBucket
+from conversation_manager import get_conversation_names, search_conversations
+from utils import estimate_tokens
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_unknown_bucket_never_waits(self):
+        bucket = TokenBucket()
+        self.assertEqual(bucket.wait_time(1000), 0.0)
+
+    @patch("rate_limiter.monotonic")
+    def test_wait_time_until_refilled(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket()
+        bucket.update(limit=60, remaining=0)
+
+        self.assertEqual(bucket.wait_time(1), 1.0)
+        mock_monotonic.return_value = 101.0
+        self.assertEqual(bucket.wait_time(1), 0.0)
+
+    @patch("rate_limiter.monotonic")
+    def test_cost_is_capped_at_capacity(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket()
+        bucket.update(limit=60, remaining=60)
+
+        self.assertEqual(bucket.wait_time(1000), 0.0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    @patch("rate_limiter.sleep")
+    @patch("rate_limiter.monotonic")
+    def test_acquire_paces_by_remaining_requests(self, mock_monotonic, mock_sleep):
+        mock_monotonic.return_value = 100.0
+
+        def advance(seconds):
+            mock_monotonic.return_value += seconds
+
+        mock_sleep.side_effect = advance
+        limiter = RateLimiter()
+        limiter.update_from_headers(
+            {
+                "anthropic-ratelimit-requests-limit": "60",
+                "anthropic-ratelimit-requests-remaining": "1",
+            }
+        )
+
+        limiter.acquire(10)
+        mock_sleep.assert_not_called()
+        with self.assertLogs(level="INFO"):
+            limiter.acquire(10)
+        mock_sleep.assert_called_once_with(1.0)
+
+    @patch("rate_limiter.sleep")
+    @patch("rate_limiter.monotonic")
+    def test_acquire_paces_by_remaining_tokens(self, mock_monotonic, mock_sleep):
+        mock_monotonic.return_value = 100.0
+        limiter = RateLimiter()
+        limiter.update_from_headers(
+            {
+                "anthropic-ratelimit-tokens-limit": "6000",
+                "anthropic-ratelimit-tokens-remaining": "100",
+            }
+        )
+
+        def advance(seconds):
+            mock_monotonic.return_value += seconds
+
+        mock_sleep.side_effect = advance
+        with self.assertLogs(level="INFO"):
+            limiter.acquire(300)
+
+        mock_sleep.assert_called_once_with(2.0)
+
+    def test_malformed_headers_are_ignored(self):
+        limiter = RateLimiter()
+        limiter.update_from_headers(
+            {
+                "anthropic-ratelimit-requests-limit": "lots",
+                "anthropic-ratelimit-requests-remaining": "1",
+            }
+        )
+        self.assertIsNone(limiter.buckets["requests"].capacity)
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, ".rate_limit_state")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch("rate_limiter.sleep")
+    @patch("rate_limiter.time")
+    def test_processes_queue_behind_each_other(self, mock_time, mock_sleep):
+        mock_time.return_value = 1000.0
+        first_process = SharedRateLimiter(self.state_path)
+        second_process = SharedRateLimiter(self.state_path)
+        first_process.update_from_headers(
+            {
+                "anthropic-ratelimit-requests-limit": "60",
+                "anthropic-ratelimit-requests-remaining": "0",
+            }
+        )
+
+        with self.assertLogs(level="INFO"):
+            first_process.acquire(1)
+            second_process.acquire(1)
+            first_process.acquire(1)
+
+        self.assertEqual(
+            [call.args[0] for call in mock_sleep.call_args_list], [1.0, 2.0, 3.0]
+        )
+
+    @patch("rate_limiter.sleep")
+    @patch("rate_limiter.time")
+    def test_headers_do_not_erase_reservations(self, mock_time, mock_sleep):
+        mock_time.return_value = 1000.0
+        limiter = SharedRateLimiter(self.state_path)
+        headers = {
+            "anthropic-ratelimit-requests-limit": "60",
+            "anthropic-ratelimit-requests-remaining": "1",
+        }
+        limiter.update_from_headers(headers)
+        limiter.acquire(1)
+        limiter.acquire(1)
+        limiter.update_from_headers(headers)
+
+        with self.assertLogs(level="INFO"):
+            limiter.acquire(1)
+
+        self.assertEqual(
+            [call.args[0] for call in mock_sleep.call_args_list], [1.0, 2.0]
+        )
+
+    def test_unknown_limits_do_not_wait(self):
+        limiter = SharedRateLimiter(self.state_path)
+        self.assertEqual(limiter._reserve(100), 0.0)
+
+    @patch("rate_limiter.load_user_config")
+    def test_shared_limiter_is_configured_per_user(self, mock_load_user_config):
+        mock_load_user_config.return_value = {
+            "shared_rate_limit": True,
+            "conversations_directory": self.directory.name,
+        }
+
+        limiter = rate_limiter._create_rate_limiter()
+
+        self.assertIsInstance(limiter, SharedRateLimiter)
+        self.assertEqual(limiter.state_path, self.state_path)
+
+    def test_shared_state_is_not_a_conversation(self):
+        user_config = {
+            "shared_rate_limit": True,
+            "conversations_directory": self.directory.name,
+        }
+        with open(
+            os.path.join(self.directory.name, "saved_conversation.jsonl"), "w"
+        ) as file:
+            file.write('{"role": "user", "content": "Shared limits"}\n')
+        with patch("rate_limiter.load_user_config", return_value=user_config):
+            rate_limiter._create_rate_limiter().update_from_headers(
+                {
+                    "anthropic-ratelimit-requests-limit": "60",
+                    "anthropic-ratelimit-requests-remaining": "60",
+                }
+            )
+
+        with patch(
+            "conversation_manager.load_user_config", return_value=user_config
+        ), patch("conversation_history.CONVERSATION_DIRECTORY", self.directory.name):
+            self.assertEqual(get_conversation_names(), ["saved_conversation"])
+            results = search_conversations("limits")
+
+        self.assertEqual(
+            [result.conversation for result in results], ["saved_conversation"]
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory.name, ".rate_limit.jsonl"))
+        )
+
+
+class TestEstimateTokens(unittest.TestCase):
+    def test_estimate_tokens(self):
+        conversation_history = [
+            {"role": "user", "content": "a" * 400},
+            {"role": "assistant", "content": [{"type": "text", "text": "b" * 40}]},
+        ]
+        self.assertEqual(estimate_tokens(conversation_history, "c" * 40), 128)
+
+
+if __name__ == "__main__":
+    unittest.main()
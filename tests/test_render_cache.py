@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import render_cache
+from render_cache import RenderCache, render_key, get_render_cache
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_entries_are_evicted_least_recently_used_first(self):
+        cache = RenderCache(memory_entries=2)
+        cache.set("first", "1")
+        cache.set("second", "2")
+        cache.get("first")
+        cache.set("third", "3")
+
+        self.assertEqual(cache.get("first"), "1")
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), "3")
+
+    def test_disk_entries_outlive_the_memory_cache(self):
+        RenderCache(2, self.directory.name, 1024).set("key", "\x1b[1mbold\x1b[0m")
+
+        cache = RenderCache(2, self.directory.name, 1024)
+        self.assertEqual(cache.get("key"), "\x1b[1mbold\x1b[0m")
+        self.assertIn("key", cache.entries)
+
+    def test_evict_removes_least_recently_used_files(self):
+        cache = RenderCache(8, self.directory.name, max_size_bytes=10)
+        cache.set("old", "x" * 8)
+        old_path = os.path.join(self.directory.name, "old.ansi")
+        os.utime(old_path, (1, 1))
+        cache.set("new", "y" * 8)
+        cache.evict()
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, "new.ansi")))
+
+    def test_render_key(self):
+        key = render_key("user", "Hello", 80, "1:truecolor")
+
+        self.assertEqual(key, render_key("user", "Hello", 80, "1:truecolor"))
+        self.assertNotEqual(key, render_key("assistant", "Hello", 80, "1:truecolor"))
+        self.assertNotEqual(key, render_key("user", "Hello", 100, "1:truecolor"))
+        self.assertNotEqual(key, render_key("user", "Hello", 80, "1:None"))
+
+    @patch("render_cache.load_user_config")
+    def test_get_render_cache_respects_config(self, mock_load_user_config):
+        mock_load_user_config.return_value = {
+            "conversations_directory": self.directory.name,
+        }
+        with patch.object(render_cache, "_render_cache", None):
+            cache = get_render_cache()
+            self.assertIsNone(cache.directory)
+
+        mock_load_user_config.return_value["render_cache"] = {"disk": True}
+        with patch.object(render_cache, "_render_cache", None):
+            cache = get_render_cache()
+            self.assertEqual(
+                cache.directory, os.path.join(self.directory.name, ".render_cache")
+            )
+
+        mock_load_user_config.return_value["render_cache"] = {"enabled": False}
+        with patch.object(render_cache, "_render_cache", None):
+            self.assertIsNone(get_render_cache())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from time import time
+from unittest.mock import patch
+
+import response_cache
+from response_cache import ResponseCache, cache_key, get_response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(
+            self.directory.name, max_size_bytes=1024 * 1024, ttl_seconds=60
+        )
+        self.payload = {
+            "model": "claude-v1",
+            "temperature": 0.0,
+            "system": "You are helpful.",
+            "messages": [{"role": "user", "content": "Hello"}],
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.get(self.payload))
+        self.cache.set(self.payload, "Hi there!")
+
+        self.assertEqual(self.cache.get(self.payload), "Hi there!")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["entries"], 1)
+
+    def test_key_ignores_dictionary_order(self):
+        reordered_payload = dict(reversed(list(self.payload.items())))
+        self.assertEqual(cache_key(self.payload), cache_key(reordered_payload))
+        self.assertNotEqual(
+            cache_key(self.payload), cache_key({**self.payload, "temperature": 1.0})
+        )
+
+    @patch("response_cache.time")
+    def test_expired_entries_are_misses(self, mock_time):
+        mock_time.return_value = 1000.0
+        self.cache.set(self.payload, "Hi there!")
+
+        mock_time.return_value = 1061.0
+        self.assertIsNone(self.cache.get(self.payload))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        payloads = [{**self.payload, "temperature": value} for value in range(3)]
+        now = time()
+        for age, payload in enumerate(payloads):
+            self.cache.set(payload, "x" * 100)
+            path = self.cache._entry_path(payload)
+            os.utime(path, (now - 10 + age, now - 10 + age))
+
+        entry_size = os.path.getsize(path)
+        self.cache.max_size_bytes = 2 * entry_size
+        self.cache.evict()
+
+        self.assertIsNone(self.cache.get(payloads[0]))
+        self.assertEqual(self.cache.get(payloads[2]), "x" * 100)
+
+    @patch("response_cache.load_user_config")
+    def test_disabled_by_default(self, mock_load_user_config):
+        mock_load_user_config.return_value = {
+            "conversations_directory": self.directory.name,
+        }
+        with patch.object(response_cache, "_response_cache", None):
+            self.assertIsNone(get_response_cache())
+
+    @patch("response_cache.load_user_config")
+    def test_enabled_cache(self, mock_load_user_config):
+        mock_load_user_config.return_value = {
+            "conversations_directory": self.directory.name,
+            "response_cache": {"enabled": True},
+        }
+        with patch.object(response_cache, "_response_cache", None):
+            self.assertIsInstance(get_response_cache(), ResponseCache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import anthropic
+from retry_policy import RetryPolicy, is_retryable, retry_after
+
+
+def make_status_error(error_class, status_code, headers=None):
+    mock_response = MagicMock()
+    mock_response.status_code = status_code
+    mock_response.headers = headers or {}
+    return error_class(message="error", response=mock_response, body="error")
+
+
+class TestRetryPolicy(unittest.TestCase):
+    @patch("retry_policy.sleep")
+    def test_retries_overloaded_then_succeeds(self, mock_sleep):
+        function = MagicMock(
+            side_effect=[
+                make_status_error(anthropic.APIStatusError, 529),
+                make_status_error(anthropic.InternalServerError, 500),
+                "ok",
+            ]
+        )
+        policy = RetryPolicy(max_attempts=3, base_delay=1.0)
+
+        with self.assertLogs(level="WARNING"):
+            result = policy.call(function, 1, key="value")
+
+        self.assertEqual(result, "ok")
+        function.assert_called_with(1, key="value")
+        self.assertEqual([a.attempt for a in policy.attempts], [1, 2])
+        self.assertTrue(0 <= policy.attempts[0].delay <= 1.0)
+        self.assertTrue(0 <= policy.attempts[1].delay <= 2.0)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("retry_policy.sleep")
+    def test_retries_connection_errors(self, mock_sleep):
+        function = MagicMock(
+            side_effect=[anthropic.APITimeoutError(request=MagicMock()), "ok"]
+        )
+
+        with self.assertLogs(level="WARNING") as log_records:
+            result = RetryPolicy().call(function)
+
+        self.assertEqual(result, "ok")
+        self.assertIn("Request timed out. Retrying in", log_records.output[0])
+
+    @patch("retry_policy.sleep")
+    def test_honors_retry_after_header(self, mock_sleep):
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after": "1"})
+        function = MagicMock(side_effect=[error, "ok"])
+
+        with self.assertLogs(level="WARNING") as log_records:
+            RetryPolicy().call(function)
+
+        mock_sleep.assert_called_once_with(1.0)
+        self.assertIn(
+            "Rate limit exceeded. Retrying in 1 seconds. Attempt 1/3",
+            log_records.output[0],
+        )
+
+    @patch("retry_policy.sleep")
+    def test_max_attempts_reached(self, mock_sleep):
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after": "1"})
+        function = MagicMock(side_effect=error)
+        policy = RetryPolicy(max_attempts=3)
+
+        with self.assertLogs(level="ERROR") as log_records:
+            with self.assertRaises(anthropic.RateLimitError):
+                policy.call(function)
+
+        self.assertEqual(function.call_count, 3)
+        self.assertEqual(len(policy.attempts), 3)
+        self.assertIsNone(policy.attempts[-1].delay)
+        self.assertTrue(
+            any(
+                "Rate limit exceeded. Max retries reached." in message
+                for message in log_records.output
+            )
+        )
+
+    @patch("retry_policy.sleep")
+    def test_deadline_stops_retries(self, mock_sleep):
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after": "60"})
+        function = MagicMock(side_effect=error)
+
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(anthropic.RateLimitError):
+                RetryPolicy(deadline=30.0).call(function)
+
+        function.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch("retry_policy.sleep")
+    def test_bad_request_is_not_retried(self, mock_sleep):
+        function = MagicMock(
+            side_effect=make_status_error(anthropic.BadRequestError, 400)
+        )
+
+        with self.assertLogs(level="ERROR") as log_records:
+            with self.assertRaises(anthropic.BadRequestError):
+                RetryPolicy().call(function)
+
+        function.assert_called_once()
+        self.assertIn("Bad request error: error", log_records.output[0])
+
+    @patch("retry_policy.sleep")
+    def test_connection_errors_are_not_retried_for_non_idempotent_calls(
+        self, mock_sleep
+    ):
+        function = MagicMock(
+            side_effect=[anthropic.APITimeoutError(request=MagicMock()), "ok"]
+        )
+
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(anthropic.APITimeoutError):
+                RetryPolicy(idempotent=False).call(function)
+
+        function.assert_called_once()
+        mock_sleep.assert_not_called()
+
+
+class TestRetryClassification(unittest.TestCase):
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(make_status_error(anthropic.APIStatusError, 529)))
+        self.assertTrue(is_retryable(make_status_error(anthropic.APIStatusError, 503)))
+        self.assertTrue(is_retryable(anthropic.APIConnectionError(request=MagicMock())))
+        self.assertFalse(
+            is_retryable(
+                anthropic.APIConnectionError(request=MagicMock()), idempotent=False
+            )
+        )
+        self.assertTrue(
+            is_retryable(make_status_error(anthropic.APIStatusError, 529), False)
+        )
+        self.assertFalse(
+            is_retryable(make_status_error(anthropic.AuthenticationError, 401))
+        )
+        self.assertFalse(is_retryable(ValueError("not an API error")))
+
+    def test_retry_after_prefers_milliseconds(self):
+        error = make_status_error(
+            anthropic.RateLimitError,
+            429,
+            {"retry-after-ms": "1500", "retry-after": "2"},
+        )
+        self.assertEqual(retry_after(error), 1.5)
+
+    def test_retry_after_missing(self):
+        error = make_status_error(anthropic.RateLimitError, 429)
+        self.assertIsNone(retry_after(error))
+
+
+if __name__ == "__main__":
+    unittest.main()
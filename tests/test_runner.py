@@ -0,0 +1,120 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from runner import run_requests
+
+
+@patch(
+    "runner.load_user_config",
+    return_value={"model": "claude-v1", "temperature": 0.7, "persona": "default"},
+)
+class TestRunRequests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.directory.name, "results.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_output(self):
+        with open(self.output_path, "r") as file:
+            return {record["id"]: record for record in map(json.loads, file)}
+
+    def write_input(self, entries):
+        input_path = os.path.join(self.directory.name, "requests.jsonl")
+        with open(input_path, "w") as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+        return input_path
+
+    @patch("runner.invoke_anthropic_api")
+    def test_runs_jsonl_requests(
+        self, mock_invoke_anthropic_api, mock_load_user_config
+    ):
+        def echo(messages, model, temperature, system_message, use_cache):
+            if messages[0]["content"] == "fail":
+                raise RuntimeError("boom")
+            return f"echo: {messages[0]['content']}"
+
+        mock_invoke_anthropic_api.side_effect = echo
+        input_path = self.write_input(
+            [{"id": f"prompt-{n}", "message": f"hello {n}"} for n in range(5)]
+            + [{"id": "broken", "message": "fail"}]
+        )
+
+        with patch("sys.stderr"):
+            counts = run_requests(input_path, self.output_path, concurrency=3)
+
+        self.assertEqual(counts, {"succeeded": 5, "errored": 1})
+        records = self.read_output()
+        self.assertEqual(records["prompt-3"]["response"], "echo: hello 3")
+        self.assertEqual(records["broken"]["error"], "boom")
+
+    @patch("runner.invoke_anthropic_api", return_value="done")
+    def test_resumes_from_checkpoint(
+        self, mock_invoke_anthropic_api, mock_load_user_config
+    ):
+        input_path = self.write_input(
+            [{"id": "first", "message": "one"}, {"id": "second", "message": "two"}]
+        )
+        with open(self.output_path, "w") as file:
+            file.write(json.dumps({"id": "first", "status": "succeeded"}) + "\n")
+            file.write('{"id": "second", "sta')
+
+        with patch("sys.stderr"):
+            counts = run_requests(input_path, self.output_path)
+
+        self.assertEqual(counts, {"succeeded": 1, "errored": 0})
+        mock_invoke_anthropic_api.assert_called_once()
+        self.assertEqual(
+            mock_invoke_anthropic_api.call_args.args[0][0]["content"], "two"
+        )
+        with open(self.output_path, "r") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[1], '{"id": "second", "sta')
+        self.assertEqual(json.loads(lines[2])["id"], "second")
+
+    @patch("runner.invoke_anthropic_api", return_value="done")
+    def test_retries_requests_that_errored(
+        self, mock_invoke_anthropic_api, mock_load_user_config
+    ):
+        input_path = self.write_input(
+            [{"id": "first", "message": "one"}, {"id": "second", "message": "two"}]
+        )
+        with open(self.output_path, "w") as file:
+            file.write(json.dumps({"id": "first", "status": "succeeded"}) + "\n")
+            file.write(
+                json.dumps({"id": "second", "status": "errored", "error": "timeout"})
+                + "\n"
+            )
+
+        with patch("sys.stderr"):
+            counts = run_requests(input_path, self.output_path)
+
+        self.assertEqual(counts, {"succeeded": 1, "errored": 0})
+        self.assertEqual(
+            mock_invoke_anthropic_api.call_args.args[0][0]["content"], "two"
+        )
+        self.assertEqual(self.read_output()["second"]["status"], "succeeded")
+
+    @patch("runner.invoke_anthropic_api", return_value="done")
+    def test_runs_a_directory_of_prompts(
+        self, mock_invoke_anthropic_api, mock_load_user_config
+    ):
+        prompts_directory = os.path.join(self.directory.name, "prompts")
+        os.mkdir(prompts_directory)
+        for file_name in ["alpha.txt", "beta gamma.md"]:
+            with open(os.path.join(prompts_directory, file_name), "w") as file:
+                file.write(f"contents of {file_name}")
+
+        with patch("sys.stderr"):
+            run_requests(prompts_directory, self.output_path)
+
+        self.assertEqual(set(self.read_output()), {"alpha", "beta_gamma"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from search_index import (
+    SearchIndex,
+    HIGHLIGHT_START,
+    HIGHLIGHT_END,
+    match_expression,
+)
+from conversation_manager import search_conversations
+
+
+def make_message(role, content, timestamp=1700000000.0, model="claude-v1"):
+    return {"role": role, "content": content, "timestamp": timestamp, "model": model}
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.search_index = SearchIndex(
+            os.path.join(self.directory.name, ".search_index.db")
+        )
+        self.search_index.update(
+            "nginx_setup",
+            [
+                make_message("user", "How do I set up an nginx reverse proxy?"),
+                make_message(
+                    "assistant",
+                    "Add a proxy_pass directive to the nginx location block.",
+                    timestamp=1700000100.0,
+                ),
+            ],
+        )
+        self.search_index.update(
+            "dinner_ideas",
+            [make_message("user", "Healthy dinner ideas", model="claude-v2")],
+        )
+
+    def tearDown(self):
+        self.search_index.close()
+        self.directory.cleanup()
+
+    def test_search_ranks_and_highlights_matches(self):
+        results = self.search_index.search("nginx proxy")
+        self.assertEqual([result.position for result in results], [0, 1])
+        self.assertEqual(results[0].conversation, "nginx_setup")
+        self.assertIn(f"{HIGHLIGHT_START}nginx{HIGHLIGHT_END}", results[0].snippet)
+        self.assertLessEqual(results[0].score, results[1].score)
+
+    def test_search_filters(self):
+        self.assertEqual(len(self.search_index.search("nginx", role="assistant")), 1)
+        self.assertEqual(len(self.search_index.search("dinner", model="claude-v1")), 0)
+        self.assertEqual(len(self.search_index.search("nginx", since=1700000050.0)), 1)
+        self.assertEqual(len(self.search_index.search("nginx", until=1700000050.0)), 1)
+
+    def test_update_reindexes_changed_tail(self):
+        self.search_index.update(
+            "nginx_setup",
+            [make_message("user", "How do I set up an nginx reverse proxy?")],
+        )
+        self.assertEqual(len(self.search_index.search("directive")), 0)
+
+        self.search_index.update(
+            "nginx_setup",
+            [
+                make_message("user", "How do I set up an nginx reverse proxy?"),
+                make_message("assistant", "Use a caddy file instead."),
+            ],
+        )
+        results = self.search_index.search("caddy")
+        self.assertEqual(
+            [(r.conversation, r.position) for r in results], [("nginx_setup", 1)]
+        )
+
+    def test_update_reindexes_replaced_turns(self):
+        self.search_index.update(
+            "nginx_setup",
+            [
+                make_message("user", "How do I set up an nginx reverse proxy?"),
+                make_message("assistant", "Use a caddy file instead."),
+            ],
+        )
+        self.assertEqual(len(self.search_index.search("directive")), 0)
+        self.assertEqual(len(self.search_index.search("caddy")), 1)
+
+    def test_rename(self):
+        self.search_index.rename("nginx_setup", "reverse_proxy")
+        results = self.search_index.search("nginx")
+        self.assertEqual({result.conversation for result in results}, {"reverse_proxy"})
+
+    def test_punctuation_is_not_query_syntax(self):
+        self.assertEqual(
+            match_expression('proxy_pass "block'), '"proxy_pass" """block"'
+        )
+        results = self.search_index.search("proxy_pass (nginx")
+        self.assertEqual([result.position for result in results], [1])
+
+
+class TestSearchConversations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(
+            os.path.join(self.directory.name, "old_conversation.jsonl"), "w"
+        ) as file:
+            file.write('{"role": "user", "content": "Saved before indexing"}\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_existing_conversations_are_indexed_once(self):
+        user_config = {"conversations_directory": self.directory.name}
+        with patch(
+            "conversation_manager.load_user_config", return_value=user_config
+        ), patch(
+            "conversation_history.CONVERSATION_DIRECTORY", self.directory.name
+        ), patch(
+            "conversation_manager.load_conversation",
+            wraps=__import__("conversation_history").load_conversation,
+        ) as mock_load_conversation:
+            results = search_conversations("indexing")
+            self.assertEqual(results[0].conversation, "old_conversation")
+            search_conversations("indexing")
+        mock_load_conversation.assert_called_once_with("old_conversation.jsonl")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+from conversation_names import write_conversation_names
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["anthropic", "rich", "prompt_toolkit", "argcomplete"]
+
+# Runs a command in a fresh interpreter and reports which heavy modules it
+# imported along the way.
+PROBE = """
+import sys, json
+sys.argv = ["chat.py", *sys.argv[1:]]
+import chat
+chat.main()
+print(json.dumps([name for name in %r if name in sys.modules]))
+""" % (HEAVY_MODULES,)
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.home_directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.home_directory.cleanup()
+
+    def imported_heavy_modules(self, *arguments):
+        environment = {**os.environ, "HOME": self.home_directory.name}
+        environment.pop("_ARGCOMPLETE", None)
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE, *arguments],
+            cwd=REPO_DIRECTORY,
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(completed.stdout.splitlines()[-1])
+
+    def test_reset_imports_no_heavy_modules(self):
+        self.assertEqual(self.imported_heavy_modules("reset"), [])
+
+    def test_history_raw_imports_no_heavy_modules(self):
+        self.assertEqual(self.imported_heavy_modules("history", "--raw"), [])
+
+    def test_import_imports_no_heavy_modules(self):
+        self.assertEqual(self.imported_heavy_modules("import", "missing"), [])
+
+    def test_piped_output_does_not_import_rich(self):
+        self.assertNotIn("rich", self.imported_heavy_modules("chat", "-l"))
+        self.assertNotIn("rich", self.imported_heavy_modules("chat", "-l", "--json"))
+
+    def test_remove_last_does_not_import_the_sdk(self):
+        self.assertNotIn("anthropic", self.imported_heavy_modules("chat", "-r"))
+
+    def test_completion_lists_conversation_names_without_heavy_modules(self):
+        conversations_directory = os.path.join(
+            self.home_directory.name, "conversations"
+        )
+        write_conversation_names(conversations_directory, ["python_help", "rust"])
+        output_path = os.path.join(self.home_directory.name, "completions")
+        command_line = "chat.py import py"
+        environment = {
+            **os.environ,
+            "HOME": self.home_directory.name,
+            "_ARGCOMPLETE": "1",
+            "_ARGCOMPLETE_IFS": "\n",
+            "_ARGCOMPLETE_STDOUT_FILENAME": output_path,
+            "COMP_LINE": command_line,
+            "COMP_POINT": str(len(command_line)),
+        }
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "completion.py"],
+            cwd=REPO_DIRECTORY,
+            env=environment,
+            capture_output=True,
+            text=True,
+        )
+        with open(output_path, "r") as file:
+            self.assertEqual(file.read().split(), ["python_help"])
+        imported_modules = {
+            line.split("|")[-1].strip() for line in completed.stderr.splitlines()
+        }
+        for module in ["anthropic", "rich", "prompt_toolkit"]:
+            self.assertNotIn(module, imported_modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
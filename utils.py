@@ -22,3 +22,15 @@ def extract_response_text(response, expected_output_tag, include_output_tag=Fals
         raise ValueError(
             f"Expected tag <{expected_output_tag}> not found in the API response."
         )
+
+
+def estimate_tokens(conversation_history, system_message=""):
+    # Roughly four characters per token for English text, plus a few tokens
+    # of framing per message.
+    characters = len(system_message or "")
+    for message in conversation_history:
+        content = message["content"]
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") for block in content)
+        characters += len(content)
+    return characters // 4 + 4 * len(conversation_history)